@@ -0,0 +1,164 @@
+"""
+Content-addressed store for large artifacts (query results and charts).
+
+Artifacts are keyed by the SHA-256 of their content, so identical results
+from repeated queries are stored once. They are zlib-compressed when that
+helps (PNGs already are compressed), kept in the shared state file rather than
+in each worker's memory, and the least recently used ones are evicted once
+the store grows past its size limit; a blob that couldn't fit even in an
+empty store is refused. The store's total size is kept up to
+date by triggers, so checking it doesn't scan the table. Since a hash always
+names the same bytes, they can be served with immutable cache headers; an
+evicted hash is reported to `on_evict` so references to it can be dropped.
+"""
+
+import base64
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Blobs deleted per eviction query
+EVICT_BATCH = 64
+
+DATA_URI_PATTERN = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,(.*)$", re.DOTALL)
+
+
+def decode_data_uri(uri):
+    """Split a base64 data URI into (bytes, content_type), or None"""
+    match = DATA_URI_PATTERN.match(uri)
+    if not match:
+        return None
+    return base64.b64decode(match.group(2)), match.group(1)
+
+
+class BlobStore:
+    """SHA-256 addressed, compressed, size-bounded blob table"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict  # Called with the hashes of evicted blobs
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                compressed INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access);
+            CREATE TABLE IF NOT EXISTS blob_usage (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                blobs INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL
+            );
+            CREATE TRIGGER IF NOT EXISTS blobs_inserted AFTER INSERT ON blobs BEGIN
+                UPDATE blob_usage SET blobs = blobs + 1, size = size + new.size,
+                                      stored_size = stored_size + new.stored_size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS blobs_deleted AFTER DELETE ON blobs BEGIN
+                UPDATE blob_usage SET blobs = blobs - 1, size = size - old.size,
+                                      stored_size = stored_size - old.stored_size;
+            END;
+            BEGIN IMMEDIATE;
+            -- Totals for blobs stored before the triggers existed
+            INSERT OR IGNORE INTO blob_usage
+                SELECT 1, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs;
+            COMMIT;
+            """
+        )
+
+    def put(self, data, content_type="application/octet-stream"):
+        """Store bytes (or text, as UTF-8) and return their hash, or None when too large to keep"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            # Already stored: just mark it as recently used
+            if self.conn.execute(
+                "UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), digest)
+            ).rowcount:
+                return digest
+            packed = zlib.compress(data, 6)
+            compressed = len(packed) < len(data)
+            stored = packed if compressed else data
+            if len(stored) > self.max_bytes:
+                return None
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, content_type, len(data), len(stored), int(compressed), time.time(), stored),
+            )
+            evicted = self._evict(keep=digest)
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return digest
+
+    def put_artifact(self, value):
+        """Store a result string or data URI chart; returns its hash, or None for empty or oversized values"""
+        if not value:
+            return None
+        decoded = decode_data_uri(value)
+        if decoded:
+            return self.put(*decoded)
+        return self.put(value, "application/json")
+
+    def exists(self, digest):
+        """Whether a blob is stored, marking it as recently used"""
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), digest)
+            ).rowcount > 0
+
+    def get(self, digest):
+        """Return (bytes, content_type), or None when unknown or evicted"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content_type, compressed, data FROM blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), digest))
+        content_type, compressed, data = row
+        return (zlib.decompress(data) if compressed else data), content_type
+
+    def _stored_size(self):
+        return self.conn.execute("SELECT stored_size FROM blob_usage").fetchone()[0]
+
+    def _evict(self, keep=None):
+        """Drop least recently used blobs (but not `keep`) until the store fits in max_bytes; returns their hashes"""
+        evicted = []
+        total = self._stored_size()
+        while total > self.max_bytes:
+            batch = self.conn.execute(
+                "SELECT hash, stored_size FROM blobs WHERE hash IS NOT ? ORDER BY last_access LIMIT ?",
+                (keep, EVICT_BATCH),
+            ).fetchall()
+            if not batch:
+                break
+            for digest, stored_size in batch:
+                self.conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                evicted.append(digest)
+                total -= stored_size
+                if total <= self.max_bytes:
+                    break
+            # Other processes write to the same file
+            total = self._stored_size()
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            count, size, stored = self.conn.execute("SELECT blobs, size, stored_size FROM blob_usage").fetchone()
+        return {"blobs": count, "bytes": size, "stored_bytes": stored, "max_bytes": self.max_bytes}
@@ -0,0 +1,122 @@
+"""
+DDL of the schemas the API starts with (default, hr and library).
+
+Kept apart from main.py so tools such as the synthetic data generator can read
+the built-in schemas without loading the API.
+"""
+
+BUILTIN_SCHEMA_DEFINITIONS = {
+    "default": """
+CREATE TABLE customers (
+    customer_id INT PRIMARY KEY,
+    name VARCHAR(100),
+    email VARCHAR(100),
+    join_date DATE
+);
+
+CREATE TABLE products (
+    product_id INT PRIMARY KEY,
+    name VARCHAR(100),
+    category VARCHAR(50),
+    price DECIMAL(10, 2)
+);
+
+CREATE TABLE orders (
+    order_id INT PRIMARY KEY,
+    customer_id INT,
+    order_date DATE,
+    total_amount DECIMAL(10, 2),
+    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
+);
+
+CREATE TABLE order_items (
+    order_id INT,
+    product_id INT,
+    quantity INT,
+    price DECIMAL(10, 2),
+    PRIMARY KEY (order_id, product_id),
+    FOREIGN KEY (order_id) REFERENCES orders(order_id),
+    FOREIGN KEY (product_id) REFERENCES products(product_id)
+);
+""",
+    "hr": """
+CREATE TABLE employees (
+    employee_id INT PRIMARY KEY,
+    first_name VARCHAR(50),
+    last_name VARCHAR(50),
+    email VARCHAR(100),
+    phone_number VARCHAR(20),
+    hire_date DATE,
+    job_id INT,
+    salary DECIMAL(10, 2),
+    commission_pct DECIMAL(4, 2),
+    manager_id INT,
+    department_id INT
+);
+
+CREATE TABLE departments (
+    department_id INT PRIMARY KEY,
+    department_name VARCHAR(100),
+    manager_id INT,
+    location_id INT
+);
+
+CREATE TABLE jobs (
+    job_id INT PRIMARY KEY,
+    job_title VARCHAR(100),
+    min_salary DECIMAL(10, 2),
+    max_salary DECIMAL(10, 2)
+);
+
+CREATE TABLE job_history (
+    employee_id INT,
+    start_date DATE,
+    end_date DATE,
+    job_id INT,
+    department_id INT,
+    PRIMARY KEY (employee_id, start_date)
+);
+""",
+    "library": """
+CREATE TABLE books (
+    book_id INT PRIMARY KEY,
+    title VARCHAR(200),
+    author_id INT,
+    publisher_id INT,
+    publication_year INT,
+    isbn VARCHAR(20),
+    genre VARCHAR(50),
+    available_copies INT
+);
+
+CREATE TABLE authors (
+    author_id INT PRIMARY KEY,
+    name VARCHAR(100),
+    birth_year INT,
+    nationality VARCHAR(50)
+);
+
+CREATE TABLE publishers (
+    publisher_id INT PRIMARY KEY,
+    name VARCHAR(100),
+    location VARCHAR(100)
+);
+
+CREATE TABLE borrowers (
+    borrower_id INT PRIMARY KEY,
+    name VARCHAR(100),
+    email VARCHAR(100),
+    join_date DATE
+);
+
+CREATE TABLE loans (
+    loan_id INT PRIMARY KEY,
+    book_id INT,
+    borrower_id INT,
+    loan_date DATE,
+    return_date DATE,
+    FOREIGN KEY (book_id) REFERENCES books(book_id),
+    FOREIGN KEY (borrower_id) REFERENCES borrowers(borrower_id)
+);
+""",
+}
@@ -0,0 +1,194 @@
+"""
+Structured catalog of a schema: its tables, columns, types, keys and indexes.
+
+The DDL is executed once against an empty in-memory SQLite database and read
+back through PRAGMA table_info/foreign_key_list/index_list, so the catalog
+sees exactly what SQLite sees. Columns that share the name of another table's
+single-column primary key are treated as foreign keys even when the DDL
+doesn't declare them (the hr and library schemas rely on this).
+
+Catalogs are built once per schema version and then only read: lookups go
+through case-insensitive dicts, so fast-path rules, the index advisor, chart
+heuristics and synthetic data never re-scan the DDL text.
+"""
+
+import difflib
+import re
+import sqlite3
+
+
+def parse_type(declared):
+    """Reduce a declared column type to (kind, length, precision, scale)"""
+    declared = (declared or "").upper()
+    params = [int(p) for p in re.findall(r"\d+", declared)]
+    if "INT" in declared:
+        return "int", None, None, None
+    if any(t in declared for t in ("DECIMAL", "NUMERIC", "REAL", "FLOAT", "DOUBLE")):
+        precision = params[0] if params else 10
+        scale = params[1] if len(params) > 1 else 2
+        return "decimal", None, precision, scale
+    if "DATE" in declared or "TIME" in declared:
+        return "date", None, None, None
+    return "text", (params[0] if params else None), None, None
+
+
+def _read_tables(conn):
+    table_names = [
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+        )
+    ]
+    tables = {}
+    for name in table_names:
+        columns = []
+        primary_key = []
+        for _, column, declared, notnull, _, pk in conn.execute(f'PRAGMA table_info("{name}")'):
+            kind, length, precision, scale = parse_type(declared)
+            columns.append({
+                "name": column,
+                "type": declared,
+                "kind": kind,
+                "length": length,
+                "precision": precision,
+                "scale": scale,
+                "nullable": not notnull and not pk,
+            })
+            if pk:
+                primary_key.append((pk, column))
+        foreign_keys = {}
+        for row in conn.execute(f'PRAGMA foreign_key_list("{name}")'):
+            # (id, seq, table, from, to, on_update, on_delete, match)
+            foreign_keys[row[3]] = (row[2], row[4])
+        indexes = []
+        for _, index, unique, origin, _ in conn.execute(f'PRAGMA index_list("{name}")'):
+            indexes.append({
+                "name": index,
+                "columns": [info[2] for info in conn.execute(f'PRAGMA index_info("{index}")')],
+                "unique": bool(unique),
+                "origin": origin,
+            })
+        tables[name] = {
+            "name": name,
+            "columns": columns,
+            "primary_key": [column for _, column in sorted(primary_key)],
+            "foreign_keys": foreign_keys,
+            "inferred_foreign_keys": [],
+            "indexes": indexes,
+        }
+    return tables
+
+
+def _resolve_foreign_keys(tables):
+    """Point FKs at the parent's implicit primary key, then infer undeclared ones"""
+    single_pks = {
+        name: table["primary_key"][0]
+        for name, table in tables.items()
+        if len(table["primary_key"]) == 1
+    }
+    pk_owner = {pk: name for name, pk in single_pks.items()}
+    for name, table in tables.items():
+        for column, (parent, parent_column) in list(table["foreign_keys"].items()):
+            if parent not in tables:
+                del table["foreign_keys"][column]
+            elif parent_column is None:
+                table["foreign_keys"][column] = (parent, single_pks.get(parent))
+        for column in table["columns"]:
+            owner = pk_owner.get(column["name"])
+            if owner and owner != name and column["name"] not in table["foreign_keys"]:
+                table["foreign_keys"][column["name"]] = (owner, column["name"])
+                table["inferred_foreign_keys"].append(column["name"])
+
+
+class Catalog:
+    """Read-only lookup tables over a schema's structure"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._table_names = {name.lower(): name for name in tables}
+        self._columns = {
+            name: {column["name"].lower(): column for column in table["columns"]}
+            for name, table in tables.items()
+        }
+        # Column name -> tables that have it, and names that are keys or dates
+        # anywhere, for matching result columns that carry no table
+        self._column_tables = {}
+        self.key_columns = set()
+        self.date_columns = set()
+        for name, table in tables.items():
+            for column in table["columns"]:
+                lowered = column["name"].lower()
+                self._column_tables.setdefault(lowered, []).append(name)
+                if column["kind"] == "date":
+                    self.date_columns.add(lowered)
+            self.key_columns.update(column.lower() for column in table["primary_key"])
+            self.key_columns.update(column.lower() for column in table["foreign_keys"])
+
+    @classmethod
+    def from_ddl(cls, schema_def):
+        """Build a catalog by running the DDL against an empty database"""
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.executescript(schema_def)
+            tables = _read_tables(conn)
+        finally:
+            conn.close()
+        _resolve_foreign_keys(tables)
+        return cls(tables)
+
+    def table_name(self, name):
+        """The table's name as declared, or None when there is no such table"""
+        return self._table_names.get(str(name).lower())
+
+    def table(self, name):
+        table_name = self.table_name(name)
+        return self.tables[table_name] if table_name else None
+
+    def has_table(self, *names):
+        return all(self.table_name(name) for name in names)
+
+    def column(self, table, column):
+        table_name = self.table_name(table)
+        return self._columns[table_name].get(str(column).lower()) if table_name else None
+
+    def has_column(self, table, column):
+        return self.column(table, column) is not None
+
+    def tables_with_column(self, column):
+        return list(self._column_tables.get(str(column).lower(), []))
+
+    def table_columns(self, tables):
+        """{table: {lowercase column: column name}} for the given (existing) tables"""
+        return {
+            table: {lowered: column["name"] for lowered, column in self._columns[self.table_name(table)].items()}
+            for table in tables
+            if self.table_name(table)
+        }
+
+    def suggest(self, name, limit=3):
+        """Table or column names close to a misspelled one"""
+        candidates = list(self._table_names) + list(self._column_tables)
+        return difflib.get_close_matches(str(name).lower(), candidates, n=limit, cutoff=0.6)
+
+    def to_dict(self):
+        return {
+            "tables": [
+                {
+                    "name": name,
+                    "columns": [
+                        {key: column[key] for key in ("name", "type", "kind", "nullable")}
+                        for column in table["columns"]
+                    ],
+                    "primary_key": table["primary_key"],
+                    "foreign_keys": [
+                        {
+                            "column": column,
+                            "references": {"table": parent, "column": parent_column},
+                            "inferred": column in table["inferred_foreign_keys"],
+                        }
+                        for column, (parent, parent_column) in table["foreign_keys"].items()
+                    ],
+                    "indexes": table["indexes"],
+                }
+                for name, table in self.tables.items()
+            ]
+        }
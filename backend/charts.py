@@ -0,0 +1,467 @@
+"""
+Chart selection, data reduction and off-loop rendering for query results.
+
+prepare_chart() picks a chart for a result DataFrame with the same column-type
+heuristics execute_query always used, then reduces large results so any row
+count can be charted in bounded time and memory:
+
+- categories: one aggregated bar per category; past MAX_CATEGORIES, the top
+  categories plus an "Other" bucket
+- dates: bucketed by day, week, month, quarter or year
+- numeric series (x sorted): LTTB downsampling, which keeps the visual shape
+- scatter plots: binned into a 2D histogram, drawn as sized points
+
+The chart's source (spec plus the columns it plots) is stored
+content-addressed, and its hash is the chart's key: identical results and
+specs always map to the same /charts/{key} URL.
+
+By default no image is made at all: vega_lite_spec() turns the choice into a
+Vega-Lite spec whose data is the named dataset "results", which the browser
+binds to the result rows it already has and renders itself (reduced charts
+carry their few reduced rows inline instead). Images are only made when PNG
+or SVG is asked for, on request, in worker processes, with explicit
+Figure/Agg canvases instead of the global pyplot state machine. Renders are
+memoized by (key, format). Each one waits for a free worker, then gets
+`timeout` seconds to draw; a worker that runs over is killed and replaced on
+its own, without touching renders running on the other workers.
+"""
+
+import json
+import multiprocessing
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import metrics
+import tracing
+
+# numpy and pandas are imported inside the functions that use them, so the
+# API process only loads them once a query result is charted
+
+DEFAULT_RENDER_TIMEOUT = 10.0
+DEFAULT_CACHE_SIZE = 256
+
+# Bar charts with more distinct categories than this are too crowded to read;
+# larger ones keep the top MAX_CATEGORIES - 1 and group the rest as "Other"
+MAX_CATEGORIES = 20
+OTHER_LABEL = "Other"
+
+# Date buckets, finest first; the finest giving at most MAX_TIME_BUCKETS is used
+TIME_BUCKETS = (("D", "day"), ("W", "week"), ("M", "month"), ("Q", "quarter"), ("Y", "year"))
+MAX_TIME_BUCKETS = 120
+
+# Points kept when a sorted numeric series is downsampled
+MAX_SERIES_POINTS = 500
+
+# Scatter plots with more points than this are binned into a density grid
+MAX_SCATTER_POINTS = 2_000
+DENSITY_BINS = 40
+
+# Values that are averages or ratios are averaged when grouped, others summed
+MEAN_COLUMN_PATTERN = re.compile(r"avg|average|mean|median|rate|ratio|pct|percent", re.IGNORECASE)
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+RENDER_SECONDS = metrics.histogram(
+    "nl2sql_chart_render_seconds", "Time a render worker spent drawing a chart", ["format"])
+RENDER_QUEUE_SECONDS = metrics.histogram(
+    "nl2sql_chart_render_queue_seconds", "Time a chart waited for a free render worker", ["format"])
+RENDER_CACHE = metrics.counter(
+    "nl2sql_chart_render_cache_total", "Chart image requests by render cache result", ["result"])
+RENDER_FAILURES = metrics.counter(
+    "nl2sql_chart_render_failures_total", "Chart renders that timed out, failed or lost their worker", ["reason"])
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+
+def chart_spec(df, catalog=None):
+    """Choose a chart for a result, or None when nothing sensible fits
+
+    A categorical or date column against a numeric one becomes a bar chart;
+    two numeric columns become a scatter. With the schema's `catalog`, columns
+    named like a key (customer_id, ...) are categories rather than values,
+    and text columns declared as dates are dates.
+    """
+    if df.empty or len(df.columns) < 2:
+        return None
+    keys = catalog.key_columns if catalog else set()
+    declared_dates = catalog.date_columns if catalog else set()
+    numeric = df.select_dtypes(include=["number"]).columns
+    numeric_cols = [c for c in numeric if str(c).lower() not in keys]
+    text_cols = df.select_dtypes(include=["object", "string"]).columns
+    categorical_cols = [c for c in text_cols if str(c).lower() not in declared_dates]
+    categorical_cols += [c for c in numeric if str(c).lower() in keys]
+    date_cols = df.select_dtypes(include=["datetime"]).columns.tolist()
+    date_cols += [c for c in text_cols if str(c).lower() in declared_dates]
+
+    if numeric_cols and (categorical_cols or date_cols):
+        x_col = categorical_cols[0] if categorical_cols else date_cols[0]
+        return {"mark": "bar", "x": x_col, "y": numeric_cols[0], "x_type": "nominal"}
+    if len(numeric_cols) >= 2:
+        return {"mark": "point", "x": numeric_cols[0], "y": numeric_cols[1], "x_type": "quantitative"}
+    return None
+
+
+def _aggregate_for(column):
+    return "mean" if MEAN_COLUMN_PATTERN.search(str(column)) else "sum"
+
+
+def _as_dates(values):
+    """Parse a column as dates, or None when it doesn't hold dates"""
+    import pandas as pd
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    sample = values.dropna().head(50).astype(str)
+    if sample.empty or not sample.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+        return None
+    return pd.to_datetime(values, errors="coerce")
+
+
+def category_totals(df, x, y):
+    """Aggregate y per category, in order of first appearance"""
+    aggregate = _aggregate_for(y)
+    totals = df.groupby(x, sort=False, dropna=False)[y].agg(aggregate)
+    return totals.reset_index(), aggregate
+
+
+def top_categories(df, x, y, limit=MAX_CATEGORIES):
+    """Aggregate y per category, keeping the largest limit - 1 and an "Other" bucket"""
+    import pandas as pd
+    aggregate = _aggregate_for(y)
+    totals = df.groupby(df[x].astype(str), sort=False)[y].agg(aggregate).sort_values(ascending=False)
+    top = totals.iloc[: limit - 1]
+    rest = df[~df[x].astype(str).isin(top.index)][y]
+    reduced = top.rename_axis(x).reset_index()
+    other = pd.DataFrame({x: [OTHER_LABEL], y: [rest.agg(aggregate)]})
+    return pd.concat([reduced, other], ignore_index=True), aggregate
+
+
+def time_buckets(dates, y_values, x, y, max_buckets=MAX_TIME_BUCKETS):
+    """Aggregate y into the finest date buckets that give at most max_buckets"""
+    import pandas as pd
+    aggregate = _aggregate_for(y)
+    valid = dates.notna()
+    dates, y_values = dates[valid], y_values[valid]
+    for code, name in TIME_BUCKETS:
+        periods = dates.dt.to_period(code)
+        if periods.nunique() <= max_buckets or code == TIME_BUCKETS[-1][0]:
+            grouped = y_values.groupby(periods).agg(aggregate).sort_index()
+            reduced = pd.DataFrame({
+                x: grouped.index.to_timestamp().strftime("%Y-%m-%d"),
+                y: grouped.to_numpy(),
+            })
+            return reduced, f"{aggregate} per {name}"
+
+
+def lttb_indices(x, y, threshold=MAX_SERIES_POINTS):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling
+
+    The first and last points are kept; each bucket in between contributes
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket.
+    """
+    import numpy as np
+    n = len(x)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs(
+            (x[previous] - next_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
+
+
+def density_bins(x_values, y_values, x, y, bins=DENSITY_BINS):
+    """Bin points into a bins x bins grid, one row per non-empty cell with its count"""
+    import numpy as np
+    import pandas as pd
+    valid = np.isfinite(x_values) & np.isfinite(y_values)
+    counts, x_edges, y_edges = np.histogram2d(x_values[valid], y_values[valid], bins=bins)
+    x_index, y_index = np.nonzero(counts)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return pd.DataFrame({
+        x: x_centers[x_index],
+        y: y_centers[y_index],
+        "count": counts[x_index, y_index].astype(int),
+    })
+
+
+def prepare_chart(df, catalog=None):
+    """Choose a chart and reduce the result to what it plots
+
+    Returns (spec, data) or None. Small results are returned unchanged; for
+    reduced ones the spec's "reduction" describes what was done.
+    """
+    import numpy as np
+    spec = chart_spec(df, catalog)
+    if spec is None:
+        return None
+    x, y = spec["x"], spec["y"]
+    rows = len(df)
+
+    if spec["mark"] == "bar":
+        categories = df[x].nunique()
+        if categories <= MAX_CATEGORIES:
+            if rows <= categories:
+                return spec, df[[x, y]]
+            # Repeated categories: one bar each, not one per row
+            data, aggregate = category_totals(df, x, y)
+            return {**spec, "reduction": {"method": f"{aggregate} of {y} per {x}", "rows": rows}}, data
+        dates = _as_dates(df[x])
+        if dates is not None:
+            data, method = time_buckets(dates, df[y], x, y)
+            spec = {**spec, "mark": "line", "x_type": "temporal"}
+        else:
+            data, aggregate = top_categories(df, x, y)
+            method = f"top {MAX_CATEGORIES - 1} by {aggregate} of {y}, rest as {OTHER_LABEL}"
+        return {**spec, "reduction": {"method": method, "rows": rows}}, data
+
+    if rows <= MAX_SCATTER_POINTS:
+        return spec, df[[x, y]]
+    x_values = df[x].to_numpy(dtype=float)
+    y_values = df[y].to_numpy(dtype=float)
+    if df[x].is_monotonic_increasing and np.isfinite(y_values).all():
+        kept = lttb_indices(x_values, y_values)
+        spec = {**spec, "mark": "line", "reduction": {"method": "lttb", "rows": rows}}
+        return spec, df[[x, y]].iloc[kept]
+    spec = {**spec, "size": "count", "reduction": {"method": f"{DENSITY_BINS}x{DENSITY_BINS} density bins", "rows": rows}}
+    return spec, density_bins(x_values, y_values, x, y)
+
+
+def vega_lite_spec(spec, data=None):
+    """Vega-Lite spec for a chart choice
+
+    Unreduced charts plot the "results" dataset; reduced ones carry their
+    reduced rows inline.
+    """
+    x_encoding = {"field": spec["x"], "type": spec["x_type"]}
+    if spec["mark"] == "bar":
+        x_encoding["axis"] = {"labelAngle": -45}
+    encoding = {
+        "x": x_encoding,
+        "y": {"field": spec["y"], "type": "quantitative"},
+    }
+    if spec.get("size"):
+        encoding["size"] = {"field": spec["size"], "type": "quantitative"}
+    vega_lite = {
+        "$schema": VEGA_LITE_SCHEMA,
+        "data": {"name": "results"},
+        "mark": {"type": spec["mark"], "tooltip": True},
+        "encoding": encoding,
+    }
+    if spec.get("reduction") and data is not None:
+        vega_lite["data"] = {"values": json.loads(data.to_json(orient="records"))}
+        vega_lite["usermeta"] = {"reduction": spec["reduction"]}
+    return vega_lite
+
+
+def chart_source(df, spec):
+    """The spec and the data it plots, as stored for rendering"""
+    x = df[spec["x"]]
+    if spec["x_type"] == "nominal":
+        x = x.astype(str)
+    source = {"spec": spec, "x": x.tolist(), "y": df[spec["y"]].tolist()}
+    if spec.get("size"):
+        source["size"] = df[spec["size"]].tolist()
+    return source
+
+
+def render_chart(source, fmt="png"):
+    """Render a chart source to PNG or SVG bytes (runs in a worker process)"""
+    # Imported here so only the render workers pay for matplotlib
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    spec = source["spec"]
+    x = source["x"]
+    if spec["x_type"] == "temporal":
+        x = np.array(x, dtype="datetime64[D]")
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if spec["mark"] == "bar":
+        ax.bar(x, source["y"])
+        ax.tick_params(axis="x", labelrotation=45)
+    elif spec["mark"] == "line":
+        ax.plot(x, source["y"])
+        if spec["x_type"] == "temporal":
+            ax.tick_params(axis="x", labelrotation=45)
+    elif "size" in source:
+        sizes = np.asarray(source["size"], dtype=float)
+        ax.scatter(x, source["y"], s=10 + 290 * sizes / max(sizes.max(), 1), alpha=0.6)
+    else:
+        ax.scatter(x, source["y"])
+    ax.set_xlabel(spec["x"])
+    ax.set_ylabel(spec["y"])
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _serve_renders(conn):
+    """Render worker main loop: send the start time, then (ok, data or error, finished), per chart"""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        conn.send(time.time())
+        try:
+            reply = (True, render_chart(*message))
+        except Exception as e:
+            # Sent as text: not every exception can be unpickled in the parent
+            reply = (False, f"{type(e).__name__}: {e}")
+        conn.send(reply + (time.time(),))
+
+
+class ChartRenderTimeout(Exception):
+    """Raised when a chart takes longer than the render timeout"""
+
+
+class ChartRenderError(Exception):
+    """Raised when a render fails or its worker dies"""
+
+
+class _RenderWorker:
+    """One render process, started on first use and again after it is killed"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+
+    def ensure_started(self):
+        if self.process is None:
+            # spawn: workers must not inherit the server's threads and locks
+            context = multiprocessing.get_context("spawn")
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_serve_renders, args=(child_conn,), name=f"chart-render-{self.index}", daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.process, self.conn = process, parent_conn
+
+    def kill(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+            self.conn.close()
+        self.process = self.conn = None
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(5)
+        self.kill()
+
+
+class ChartRenderer:
+    """Registers chart sources in a blob store and renders them in worker processes"""
+
+    def __init__(self, store, workers=2, timeout=DEFAULT_RENDER_TIMEOUT, cache_size=DEFAULT_CACHE_SIZE):
+        self.store = store
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = [_RenderWorker(index) for index in range(max(1, workers))]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def register(self, df, spec=None):
+        """Store a chart; returns its key, or None when there is no chart (or it is too large to store)
+
+        Without a spec, the chart is chosen and its data reduced with
+        prepare_chart(); with one, `df` is taken as the prepared data.
+        """
+        if spec is None:
+            prepared = prepare_chart(df)
+            if prepared is None:
+                return None
+            spec, df = prepared
+        return self.store.put(json.dumps(chart_source(df, spec), default=str), "application/json")
+
+    def render(self, key, fmt="png"):
+        """Return the rendered bytes for a chart key, or None for an unknown key"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        with self._lock:
+            if (key, fmt) in self._cache:
+                self._cache.move_to_end((key, fmt))
+                RENDER_CACHE.inc(result="hit")
+                return self._cache[(key, fmt)]
+        RENDER_CACHE.inc(result="miss")
+
+        blob = self.store.get(key)
+        if blob is None:
+            return None
+        source = json.loads(blob[0])
+        submitted = time.time()
+        worker = self._idle.get()
+        try:
+            data, started, finished = self._run(worker, source, fmt)
+        finally:
+            self._idle.put(worker)
+        RENDER_QUEUE_SECONDS.observe(max(0.0, started - submitted), format=fmt)
+        RENDER_SECONDS.observe(finished - started, format=fmt)
+        tracing.add_span("chart.queue", int(submitted * 1e9), int(max(started, submitted) * 1e9))
+        tracing.add_span("chart.draw", int(started * 1e9), int(finished * 1e9), format=fmt)
+
+        with self._lock:
+            self._cache[(key, fmt)] = data
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def _run(self, worker, source, fmt):
+        """Render on a checked-out worker; the timeout starts once it has the chart"""
+        try:
+            worker.ensure_started()
+            worker.conn.send((source, fmt))
+            started = worker.conn.recv()
+            if not worker.conn.poll(max(0.0, started + self.timeout - time.time())):
+                # A running render can't be interrupted, so stop this worker only
+                worker.kill()
+                RENDER_FAILURES.inc(reason="timeout")
+                raise ChartRenderTimeout(f"Chart rendering took longer than {self.timeout}s")
+            ok, value, finished = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # The worker died (e.g. out of memory); the next render starts a new one
+            worker.kill()
+            RENDER_FAILURES.inc(reason="worker_died")
+            raise ChartRenderError(f"Chart render worker {worker.index} died") from e
+        if not ok:
+            RENDER_FAILURES.inc(reason="error")
+            raise ChartRenderError(value)
+        return value, started, finished
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data generator for the NL2SQL schemas.
+
+Reads a schema's tables, keys and column types from its catalog (see
+catalog.py) and fills an SQLite database with seeded, referentially
+consistent rows at a chosen scale. Rows are produced column by column in vectorized numpy batches.
+Line items copy the price of the row they reference, and totals on the
+table they belong to (orders.total_amount) are the sum of their items.
+
+Usage:
+    python datagen.py --schema hr --rows 1M --out hr.db
+"""
+
+import argparse
+import datetime
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from builtin_schemas import BUILTIN_SCHEMA_DEFINITIONS
+from catalog import Catalog
+
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 50_000
+
+# Rows in a referencing table per row of the table it references
+DEFAULT_FANOUT = 8
+
+# Smallest size for any generated table, so lookup tables are never empty
+MIN_TABLE_ROWS = 5
+
+# Generated dates fall between this date and the anchor date. The default
+# anchor is fixed rather than today, so a seed gives the same data every day.
+DATE_RANGE_START = datetime.date(2015, 1, 1)
+DEFAULT_ANCHOR_DATE = datetime.date(2025, 1, 1)
+
+SCALE_SUFFIXES = {"": 1, "k": 1_000, "m": 1_000_000}
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Lisa", "Matthew", "Nancy",
+    "Anthony", "Emily", "Mark", "Emma", "Paul", "Anna", "Steven", "Olivia",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Wilson", "Anderson", "Taylor", "Thomas", "Moore", "Jackson",
+    "Martin", "Lee", "Thompson", "White", "Harris", "Clark", "Lewis", "Walker",
+]
+COMPANY_SUFFIXES = ["Press", "Books", "Publishing", "& Sons", "Group", "House", "Media"]
+ADJECTIVES = [
+    "Silent", "Golden", "Hidden", "Broken", "Lost", "Bright", "Dark", "Last",
+    "Secret", "Wild", "Quiet", "Red", "Endless", "Ancient", "Little", "Crimson",
+]
+NOUNS = [
+    "River", "Garden", "Kingdom", "Shadow", "Journey", "City", "Storm", "Promise",
+    "Mountain", "Forest", "Letter", "Island", "Winter", "Empire", "Voyage", "Mirror",
+]
+PRODUCT_NOUNS = [
+    "Laptop", "Headphones", "Smartphone", "Coffee Maker", "Running Shoes", "T-shirt",
+    "Blender", "Watch", "Backpack", "Desk Chair", "Monitor", "Keyboard", "Lamp", "Jacket",
+]
+VOCABULARIES = {
+    "category": ["Electronics", "Clothing", "Appliances", "Accessories", "Furniture", "Books", "Toys", "Sports"],
+    "genre": ["Fantasy", "Classic", "Mystery", "Horror", "Dystopian", "Romance", "Science Fiction", "Biography"],
+    "nationality": ["American", "British", "Canadian", "French", "German", "Russian", "Japanese", "Indian"],
+    "location": ["New York", "London", "Paris", "Berlin", "Tokyo", "Toronto", "Sydney", "Moscow"],
+    "city": ["New York", "London", "Paris", "Berlin", "Tokyo", "Toronto", "Sydney", "Moscow"],
+    "country": ["USA", "United Kingdom", "France", "Germany", "Japan", "Canada", "Australia", "India"],
+    "status": ["active", "pending", "completed", "cancelled"],
+    "department_name": ["IT", "Marketing", "Finance", "Human Resources", "Sales", "Operations", "Legal", "Support"],
+    "job_title": [
+        "Software Developer", "Marketing Specialist", "Financial Analyst", "HR Manager",
+        "Sales Representative", "Senior Developer", "Marketing Manager", "Data Analyst",
+    ],
+}
+
+# Date columns named like these follow the first date column of the same row
+LATER_DATE_MARKERS = ("end", "return", "due", "ship", "close", "finish")
+
+# Decimal columns named like these on a table with line items are the sum of its items
+TOTAL_MARKERS = ("total", "amount")
+
+
+def parse_scale(value):
+    """Parse a scale factor such as '1k', '1M' or '10000' into a row count"""
+    text = str(value).strip().lower().replace("_", "").replace(",", "")
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", text)
+    if not match:
+        raise ValueError(f"Invalid scale factor: {value}")
+    number, suffix = match.groups()
+    return max(1, int(float(number) * SCALE_SUFFIXES[suffix]))
+
+
+def _table_levels(tables):
+    """Distance of each table from the tables nothing references (0 = fact table)"""
+    children = {name: set() for name in tables}
+    for name, table in tables.items():
+        for parent, _ in table["foreign_keys"].values():
+            if parent != name:
+                children[parent].add(name)
+
+    levels = {}
+
+    def level(name, seen=()):
+        if name in levels:
+            return levels[name]
+        if name in seen:  # FK cycle: treat the back edge as absent
+            return 0
+        result = max((level(child, seen + (name,)) + 1 for child in children[name]), default=0)
+        levels[name] = result
+        return result
+
+    for name in tables:
+        level(name)
+    return levels
+
+
+def _generation_order(tables):
+    """Order tables so every referenced table is populated before its referrers"""
+    ordered, visiting = [], set()
+
+    def visit(name):
+        if name in ordered or name in visiting:
+            return
+        visiting.add(name)
+        for parent, _ in tables[name]["foreign_keys"].values():
+            if parent != name:
+                visit(parent)
+        visiting.discard(name)
+        ordered.append(name)
+
+    for name in tables:
+        visit(name)
+    return ordered
+
+
+def plan_row_counts(tables, rows, fanout=DEFAULT_FANOUT, row_counts=None):
+    """Decide how many rows each table gets for a given scale
+
+    The most-referencing (fact) tables get `rows`; each table they reference
+    gets `fanout` times fewer, so dimension tables stay proportionate.
+    """
+    levels = _table_levels(tables)
+    plan = {
+        name: max(MIN_TABLE_ROWS, int(rows // (fanout ** levels[name])))
+        for name in tables
+    }
+    plan.update(row_counts or {})
+    return plan
+
+
+def _skewed_choice(rng, values, size, exponent=0.8):
+    """Pick from a vocabulary with a Zipf-like preference for earlier entries"""
+    weights = 1.0 / np.arange(1, len(values) + 1) ** exponent
+    return rng.choice(np.asarray(values), size=size, p=weights / weights.sum())
+
+
+def _skewed_index(rng, population, size, skew=1.5):
+    """Indexes into a population of keys, favouring low keys (popular customers, bestsellers)"""
+    return np.minimum((population * rng.random(size) ** skew).astype(np.int64), population - 1)
+
+
+def _join(*parts):
+    """Element-wise string concatenation of arrays and scalars"""
+    result = np.asarray(parts[0]).astype(str)
+    for part in parts[1:]:
+        result = np.char.add(result, np.asarray(part).astype(str))
+    return result
+
+
+def _sequential_keys(table_name, column, index):
+    """Single-column primary key values for zero-based row positions, typed like the column"""
+    values = np.asarray(index, dtype=np.int64) + 1
+    if column["kind"] == "text":
+        return _join(f"{table_name}_", values)
+    return values
+
+
+def _price_column(table):
+    """Name of a table's first decimal price column, or None"""
+    return next((c["name"] for c in table["columns"] if c["kind"] == "decimal" and "price" in c["name"].lower()), None)
+
+
+def _dates(ordinals):
+    """Convert day ordinals (days since 1970-01-01) into ISO date strings"""
+    return np.datetime_as_string(ordinals.astype("datetime64[D]"), unit="D")
+
+
+class _TableGenerator:
+    """Produces batches of rows for one table"""
+
+    def __init__(self, name, table, n_rows, key_values, rng_seed, anchor_date, prices=None):
+        self.name = name
+        self.table = table
+        self.n_rows = n_rows
+        self.key_values = key_values
+        self.prices = prices or {}  # Price column values of generated tables, by key position
+        self.parent_positions = {}  # Positions of the current batch's foreign keys in their tables
+        self.rng_seed = rng_seed
+        self.start_day = (DATE_RANGE_START - datetime.date(1970, 1, 1)).days
+        self.end_day = (anchor_date - datetime.date(1970, 1, 1)).days
+        self.anchor_year = anchor_date.year
+        self.date_columns = [c["name"] for c in table["columns"] if c["kind"] == "date"]
+        self.person_table = any(c["name"] in ("email", "birth_year", "first_name") for c in table["columns"])
+
+        # Composite keys are built from a "driver" column plus a repetition
+        # counter, which keeps every key tuple unique by construction.
+        self.primary_key = table["primary_key"]
+        self.driver_size = None
+        if len(self.primary_key) > 1:
+            driver = self.primary_key[0]
+            parent_keys = self._parent_keys(driver)
+            self.driver_size = len(parent_keys) if parent_keys is not None else n_rows
+            # Spread date keys over the date range instead of running past the anchor date
+            repetitions = -(-n_rows // self.driver_size)
+            self.date_step = max(1, (self.end_day - self.start_day) // repetitions)
+
+    def _parent_keys(self, column):
+        fk = self.table["foreign_keys"].get(column)
+        if fk is None:
+            return None
+        parent, _ = fk
+        return self.key_values.get(parent)
+
+    def batch(self, batch_index, start, stop):
+        """Generate rows [start, stop) as a list of column arrays"""
+        rng = np.random.default_rng([self.rng_seed, batch_index])
+        index = np.arange(start, stop, dtype=np.int64)
+        size = len(index)
+        generated = {}
+        self.parent_positions = {}
+        for column in self.table["columns"]:
+            generated[column["name"]] = self._column(rng, column, index, size, generated)
+        return [generated[c["name"]] for c in self.table["columns"]]
+
+    def _column(self, rng, column, index, size, generated):
+        name = column["name"]
+        if name in self.primary_key:
+            return self._key_column(name, column, index)
+        parent_keys = self._parent_keys(name)
+        if parent_keys is not None:
+            positions = self.parent_positions[name] = _skewed_index(rng, len(parent_keys), size)
+            return parent_keys[positions].astype(object)
+        kind = column["kind"]
+        if kind == "int":
+            return self._int_column(rng, name, index, size)
+        if kind == "decimal":
+            return self._decimal_column(rng, column, size, generated)
+        if kind == "date":
+            return self._date_column(rng, name, size, generated)
+        return self._text_column(rng, column, index, size, generated)
+
+    def _key_column(self, name, column, index):
+        position = self.primary_key.index(name)
+        if len(self.primary_key) == 1:
+            return _sequential_keys(self.name, column, index).astype(object)
+
+        driver_index = index % self.driver_size
+        repetition = index // self.driver_size
+        parent_keys = self._parent_keys(name)
+        if position == 0:
+            if parent_keys is not None:
+                self.parent_positions[name] = driver_index
+                return parent_keys[driver_index].astype(object)
+            return (driver_index + 1).astype(object)
+
+        # Offset each driver's sequence so secondary keys don't all line up
+        offset = (driver_index * 2654435761) % 9973
+        if parent_keys is not None:
+            positions = self.parent_positions[name] = (repetition + offset) % len(parent_keys)
+            return parent_keys[positions].astype(object)
+        if column["kind"] == "date":
+            return _dates(self.start_day + repetition * self.date_step + offset % self.date_step).astype(object)
+        if column["kind"] == "text":
+            return _join(f"{name}_", repetition + 1).astype(object)
+        return (repetition + 1).astype(object)
+
+    def _int_column(self, rng, name, index, size):
+        lowered = name.lower()
+        if lowered == "birth_year":
+            return rng.integers(1800, self.anchor_year - 18, size).astype(object)
+        if lowered.endswith("year"):
+            return rng.integers(1900, self.anchor_year + 1, size).astype(object)
+        if "quantity" in lowered or "qty" in lowered:
+            return (rng.poisson(1.5, size) + 1).astype(object)
+        if "copies" in lowered or "stock" in lowered or "count" in lowered:
+            return rng.poisson(3, size).astype(object)
+        if lowered.endswith("_id"):
+            values = rng.integers(1, max(2, self.n_rows // 10), size).astype(object)
+            if "manager" in lowered:
+                values[rng.random(size) < 0.3] = None
+            return values
+        return rng.integers(1, 1000, size).astype(object)
+
+    def _parent_prices(self):
+        """Prices of the rows this batch references (e.g. an order item's product), or None"""
+        for column, positions in self.parent_positions.items():
+            prices = self.prices.get(self.table["foreign_keys"][column][0])
+            if prices is not None:
+                return prices[positions]
+        return None
+
+    def _decimal_column(self, rng, column, size, generated):
+        lowered = column["name"].lower()
+        scale = column["scale"]
+        ceiling = 10 ** (column["precision"] - scale) - 10 ** -scale
+        nullable = False
+        inherited = self._parent_prices() if "price" in lowered else None
+        if inherited is not None:
+            values = inherited.astype(float)
+        elif "pct" in lowered or "percent" in lowered or "rate" in lowered:
+            values = rng.uniform(0.05, 0.4, size)
+            nullable = True
+        elif lowered.startswith("max_") and ("min_" + lowered[4:]) in generated:
+            values = np.asarray(generated["min_" + lowered[4:]], dtype=float) * rng.uniform(1.3, 2.0, size)
+        elif "salary" in lowered:
+            values = rng.lognormal(np.log(70000), 0.35, size)
+        else:
+            values = rng.lognormal(np.log(50), 1.0, size)
+        values = np.round(np.minimum(values, ceiling), scale).astype(object)
+        if nullable:
+            values[rng.random(size) < 0.7] = None
+        return values
+
+    def _date_column(self, rng, name, size, generated):
+        lowered = name.lower()
+        first_date = self.date_columns[0]
+        if name != first_date and first_date in generated and any(m in lowered for m in LATER_DATE_MARKERS):
+            base = np.array(generated[first_date], dtype="datetime64[D]").astype(np.int64)
+            return _dates(base + rng.integers(1, 60, size)).astype(object)
+        # Recent dates are more common than old ones
+        span = self.end_day - self.start_day
+        days = self.end_day - (span * rng.random(size) ** 2).astype(np.int64)
+        return _dates(days).astype(object)
+
+    def _text_column(self, rng, column, index, size, generated):
+        name = column["name"]
+        lowered = name.lower()
+        table = self.name.lower()
+        if "email" in lowered:
+            person = generated.get("first_name", generated.get("name"))
+            if person is None:
+                person = _skewed_choice(rng, FIRST_NAMES, size)
+            local_part = np.char.replace(np.char.lower(np.asarray(person).astype(str)), " ", ".")
+            values = _join(local_part, ".", index + 1, "@example.com")
+        elif "phone" in lowered:
+            values = _join("555-", np.char.zfill(rng.integers(0, 10000, size).astype(str), 4))
+        elif "isbn" in lowered:
+            values = _join("978", np.char.zfill(rng.integers(0, 10 ** 10, size).astype(str), 10))
+        elif lowered == "first_name":
+            values = _skewed_choice(rng, FIRST_NAMES, size)
+        elif lowered == "last_name":
+            values = _skewed_choice(rng, LAST_NAMES, size)
+        elif lowered in VOCABULARIES:
+            values = _skewed_choice(rng, VOCABULARIES[lowered], size)
+        elif lowered == "title":
+            values = _join("The ", rng.choice(ADJECTIVES, size), " ", rng.choice(NOUNS, size))
+        elif lowered == "name" and ("product" in table or "item" in table):
+            values = _join(rng.choice(ADJECTIVES, size), " ", _skewed_choice(rng, PRODUCT_NOUNS, size))
+        elif lowered == "name" and not self.person_table:
+            values = _join(rng.choice(LAST_NAMES, size), " ", rng.choice(COMPANY_SUFFIXES, size))
+        elif lowered == "name" or lowered.endswith("_name"):
+            values = _join(_skewed_choice(rng, FIRST_NAMES, size), " ", _skewed_choice(rng, LAST_NAMES, size))
+        else:
+            values = _join(f"{name}_", index + 1)
+        if column["length"]:
+            values = values.astype(f"<U{column['length']}")
+        return values.astype(object)
+
+
+def populate_schema(conn, schema_def, rows=1000, seed=DEFAULT_SEED, batch_size=DEFAULT_BATCH_SIZE,
+                    fanout=DEFAULT_FANOUT, row_counts=None, anchor_date=None, catalog=None):
+    """Fill the (already created) tables of a schema with synthetic rows
+
+    Output is fully determined by the schema, `rows`, `seed`, `batch_size` and
+    `anchor_date`. Pass the schema's `catalog` when one is already built.
+    Returns the number of rows written per table.
+    """
+    tables = (catalog or Catalog.from_ddl(schema_def)).tables
+    plan = plan_row_counts(tables, rows, fanout=fanout, row_counts=row_counts)
+    anchor_date = anchor_date or DEFAULT_ANCHOR_DATE
+    key_values = {}
+    prices = {}
+
+    for table_number, name in enumerate(_generation_order(tables)):
+        table = tables[name]
+        n_rows = plan[name]
+        generator = _TableGenerator(name, table, n_rows, key_values, [seed, table_number], anchor_date, prices)
+        if len(table["primary_key"]) > 1:
+            # A composite key can't have more tuples than its driver x second key allow
+            second_keys = generator._parent_keys(table["primary_key"][1])
+            if second_keys is not None:
+                n_rows = generator.n_rows = min(n_rows, generator.driver_size * len(second_keys))
+        placeholders = ", ".join("?" for _ in table["columns"])
+        insert = f'INSERT INTO "{name}" VALUES ({placeholders})'
+        names = [c["name"] for c in table["columns"]]
+        price_index = names.index(_price_column(table)) if _price_column(table) else None
+        price_batches = []
+
+        for batch_index, start in enumerate(range(0, n_rows, batch_size)):
+            stop = min(start + batch_size, n_rows)
+            columns = generator.batch(batch_index, start, stop)
+            conn.executemany(insert, zip(*(c.tolist() for c in columns)))
+            if price_index is not None:
+                price_batches.append(columns[price_index])
+
+        if len(table["primary_key"]) == 1:
+            key_column = next(c for c in table["columns"] if c["name"] == table["primary_key"][0])
+            key_values[name] = _sequential_keys(name, key_column, np.arange(n_rows))
+            if price_batches:
+                prices[name] = np.concatenate(price_batches)
+        plan[name] = n_rows
+
+    _sum_line_items(conn, tables)
+    conn.commit()
+    return plan
+
+
+def _sum_line_items(conn, tables):
+    """Set totals (e.g. orders.total_amount) to the sum of quantity x price over their line items"""
+    for child_name, child in tables.items():
+        price = _price_column(child)
+        if price is None:
+            continue
+        quantity = next((c["name"] for c in child["columns"] if c["kind"] == "int"
+                         and ("quantity" in c["name"].lower() or "qty" in c["name"].lower())), None)
+        amount = f'"{quantity}" * "{price}"' if quantity else f'"{price}"'
+        for column, (parent_name, _) in child["foreign_keys"].items():
+            parent = tables.get(parent_name)
+            if parent is None or parent_name == child_name or len(parent["primary_key"]) != 1:
+                continue
+            key = parent["primary_key"][0]
+            for total in parent["columns"]:
+                lowered = total["name"].lower()
+                if total["kind"] != "decimal" or "price" in lowered or not any(m in lowered for m in TOTAL_MARKERS):
+                    continue
+                conn.execute(
+                    f'UPDATE "{parent_name}" SET "{total["name"]}" = COALESCE('
+                    f'(SELECT ROUND(SUM({amount}), {total["scale"]}) FROM "{child_name}" AS item '
+                    f'WHERE item."{column}" = "{parent_name}"."{key}"), 0)'
+                )
+
+
+def build_database(schema_def, path, rows=1000, seed=DEFAULT_SEED, batch_size=DEFAULT_BATCH_SIZE, **kwargs):
+    """Create a new SQLite file at `path` holding the schema populated with synthetic rows"""
+    conn = sqlite3.connect(path)
+    try:
+        # Bulk-load settings: the file is rebuilt from scratch if anything goes wrong
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(schema_def)
+        counts = populate_schema(conn, schema_def, rows=rows, seed=seed, batch_size=batch_size, **kwargs)
+        conn.execute("ANALYZE")
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic data for an NL2SQL schema")
+    parser.add_argument("--schema", default="default", choices=sorted(BUILTIN_SCHEMA_DEFINITIONS),
+                        help="Built-in schema name")
+    parser.add_argument("--ddl", help="Path to a DDL file to use instead of a built-in schema")
+    parser.add_argument("--rows", default="1k", help="Rows in the largest table, e.g. 1k, 1M, 10M")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--fanout", type=int, default=DEFAULT_FANOUT)
+    parser.add_argument("--anchor-date", help=f"Latest generated date (YYYY-MM-DD), defaults to {DEFAULT_ANCHOR_DATE}")
+    parser.add_argument("--out", required=True, help="Path of the SQLite file to create")
+    args = parser.parse_args()
+
+    if args.ddl:
+        with open(args.ddl) as ddl_file:
+            schema_def = ddl_file.read()
+    else:
+        schema_def = BUILTIN_SCHEMA_DEFINITIONS[args.schema]
+
+    anchor_date = datetime.date.fromisoformat(args.anchor_date) if args.anchor_date else None
+    start_time = time.time()
+    counts = build_database(
+        schema_def,
+        args.out,
+        rows=parse_scale(args.rows),
+        seed=args.seed,
+        batch_size=args.batch_size,
+        fanout=args.fanout,
+        anchor_date=anchor_date,
+    )
+    elapsed = time.time() - start_time
+    for table, count in counts.items():
+        print(f"{table}: {count:,} rows")
+    print(f"Wrote {sum(counts.values()):,} rows to {args.out} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
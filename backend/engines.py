@@ -0,0 +1,143 @@
+"""
+Execution engines for running validated SELECT statements.
+
+execute_query keeps the shared steps (safety checks, SQLite-compatibility
+preprocessing, result formatting and charting) and hands the actual execution
+to an engine chosen per schema:
+
+- sqlite: the in-memory schema database (default)
+- duckdb: an embedded, columnar DuckDB database for aggregation-heavy work on
+  large tables. It is loaded from the schema's SQLite database, or from
+  Parquet files when present, and runs fully in-process and offline.
+
+DuckDB is optional; install it with `pip install duckdb` to enable it.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+# Rows copied per chunk when loading DuckDB from SQLite
+COPY_CHUNK_ROWS = 100_000
+
+
+def parse_engine_config(value):
+    """Parse SCHEMA_ENGINES ("hr=duckdb,default=sqlite") into {schema: engine}"""
+    engines = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            schema_name, engine = item.split("=", 1)
+            engines[schema_name.strip()] = engine.strip().lower()
+    return engines
+
+
+class SQLiteEngine:
+    """Runs statements on a schema's SQLite connection"""
+
+    name = "sqlite"
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def translate(self, sql):
+        """SQL is already SQLite-compatible after preprocessing"""
+        return sql
+
+    def execute(self, sql):
+        import pandas as pd
+
+        with self.lock:
+            return pd.read_sql_query(sql, self.conn, params={})
+
+
+class DuckDBEngine:
+    """Runs statements on an embedded DuckDB copy of a schema's data"""
+
+    name = "duckdb"
+
+    def __init__(self, schema_name, schema_def, source_conn=None, source_lock=None, parquet_dir=None):
+        try:
+            import duckdb  # Optional dependency, only loaded when the engine is used
+        except ImportError:
+            raise RuntimeError("The duckdb engine requires the duckdb package (pip install duckdb)")
+        self.schema_name = schema_name
+        self.conn = duckdb.connect(":memory:")
+        self._lock = threading.Lock()
+        self._load(schema_def, source_conn, source_lock or threading.Lock(), parquet_dir)
+
+    @staticmethod
+    def _source_tables(schema_def, source_conn, source_lock):
+        """{table: [(column, declared type)]} as SQLite has them, ALTER TABLE changes included
+
+        Without a source database the whole definition is applied to a
+        scratch one, so added columns are picked up either way.
+        """
+        conn = source_conn
+        if conn is None:
+            conn = sqlite3.connect(":memory:")
+            conn.executescript(schema_def)
+        with source_lock:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+            )]
+            return {
+                table: [(row[1], row[2] or "VARCHAR") for row in conn.execute(f'PRAGMA table_info("{table}")')]
+                for table in tables
+            }
+
+    def _load(self, schema_def, source_conn, source_lock, parquet_dir):
+        import pandas as pd
+
+        tables = self._source_tables(schema_def, source_conn, source_lock)
+        parquet_dir = os.path.join(parquet_dir, self.schema_name) if parquet_dir else None
+
+        for table, columns in tables.items():
+            parquet_path = os.path.join(parquet_dir, f"{table}.parquet") if parquet_dir else None
+            if parquet_path and os.path.exists(parquet_path):
+                # Query the Parquet file in place instead of copying it
+                self.conn.execute(f"CREATE VIEW \"{table}\" AS SELECT * FROM read_parquet('{parquet_path}')")
+                continue
+            # Columns and types only: constraints slow down bulk loading and are
+            # enforced by the SQLite copy
+            definition = ", ".join(f'"{name}" {declared}' for name, declared in columns)
+            self.conn.execute(f'CREATE TABLE "{table}" ({definition})')
+            if source_conn is None:
+                continue
+            with source_lock:
+                chunks = pd.read_sql_query(f'SELECT * FROM "{table}"', source_conn, chunksize=COPY_CHUNK_ROWS)
+                for chunk in chunks:
+                    self.conn.register("source_chunk", chunk)
+                    self.conn.execute(f'INSERT INTO "{table}" SELECT * FROM source_chunk')
+                    self.conn.unregister("source_chunk")
+
+    def translate(self, sql):
+        """Rewrite the SQLite date idioms produced by preprocessing into DuckDB SQL"""
+        def date_now(match):
+            if not match.group(1):
+                return "CURRENT_DATE"
+            sign, amount, unit = match.group(1), match.group(2), match.group(3)
+            return f"CAST(CURRENT_DATE {'+' if sign == '+' else '-'} INTERVAL '{amount} {unit}' AS DATE)"
+
+        sql = re.sub(r"date\(\s*'now'\s*(?:,\s*'([+-]?)(\d+)\s*(\w+)'\s*)?\)", date_now, sql, flags=re.IGNORECASE)
+        # SQLite's strftime(format, value) is DuckDB's strftime(value, format)
+        sql = re.sub(
+            r"strftime\(\s*('[^']*')\s*,\s*([^()]+?|\w+\([^()]*\))\s*\)",
+            r"strftime(CAST(\2 AS DATE), \1)",
+            sql,
+            flags=re.IGNORECASE,
+        )
+        return sql
+
+    def execute(self, sql):
+        with self._lock:
+            cursor = self.conn.cursor()
+        try:
+            df = cursor.execute(sql).df()
+        finally:
+            cursor.close()
+        # Match SQLite's output, which returns dates as ISO strings
+        for column in df.select_dtypes(include=["datetime", "datetimetz"]).columns:
+            df[column] = df[column].dt.strftime("%Y-%m-%d")
+        return df
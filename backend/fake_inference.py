@@ -0,0 +1,201 @@
+"""
+A local stand-in for the HuggingFace inference API, for load tests.
+
+Serves the two calls the backend makes, for any model:
+
+- POST /models/{model}/v1/chat/completions  (chat_completion)
+- POST /models/{model}                      (text_generation)
+
+Point the backend at it with HF_INFERENCE_URL=http://host:port. Each
+request waits for a latency drawn from a distribution, fails with 503 at the
+configured rate (or always, for models listed as failing, to exercise the
+fallbacks), and otherwise answers like a model would. The answer depends on
+the prompt: SQL explanations and visualization suggestions get canned text,
+and SQL prompts get a query on the first table of the prompt's schema (in
+the step-by-step format for reasoning prompts). A responses file can
+override that with its own canned answers:
+
+    [{"match": "average salary", "response": "```sql\\nSELECT ...;\\n```"}]
+
+where `match` is a regular expression searched for in the prompt, and the
+first match wins.
+
+    python fake_inference.py --port 8081 --latency lognormal:0.3,0.5 --failure-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_LATENCY = "lognormal:0.25,0.5"
+
+EXPLANATION = ("This query reads the requested rows from the table and returns them, "
+               "limited to the first few results.")
+VISUALIZATION = "A bar chart would work well, with the first text column on the x-axis and a numeric column on the y-axis."
+
+
+def parse_latency(spec):
+    """A sampler for "fixed:S", "uniform:LOW,HIGH" or "lognormal:MEDIAN,SIGMA" (seconds)"""
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(",")] if params else []
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(*values)
+        if kind == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Bad latency '{spec}'. Use fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+
+
+def canned_response(prompt, responses=()):
+    """What the fake model answers to a prompt"""
+    for entry in responses:
+        if re.search(entry["match"], prompt, re.IGNORECASE):
+            return entry["response"]
+    if "SQL educator" in prompt:
+        return EXPLANATION
+    if "data visualization expert" in prompt:
+        return VISUALIZATION
+    table = re.search(r"CREATE TABLE\s+(?:IF NOT EXISTS\s+)?[`\"\[]?(\w+)", prompt, re.IGNORECASE)
+    sql = f"SELECT * FROM {table.group(1) if table else 'sqlite_master'} LIMIT 10;"
+    if "step by step" in prompt:
+        return (f"1. The question is answered by the {table.group(1) if table else 'matching'} table.\n"
+                "2. No joins are needed.\n"
+                "3. No filtering is needed.\n"
+                "4. No aggregation is needed.\n"
+                f"5. The final SQL query:\n```sql\n{sql}\n```")
+    return f"```sql\n{sql}\n```"
+
+
+class FakeInferenceServer:
+    """The fake API on a background thread; `stats` counts what it served"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=DEFAULT_LATENCY, failure_rate=0.0,
+                 failing_models=(), responses=(), seed=None):
+        self.sample_latency = parse_latency(latency)
+        self.failure_rate = failure_rate
+        self.failing_models = set(failing_models)
+        self.responses = list(responses)
+        self.stats = {"chat_completion": 0, "text_generation": 0, "failed": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self, model):
+        """(latency, fail) for one request"""
+        with self._lock:
+            latency = self.sample_latency(self._rng)
+            fail = model in self.failing_models or self._rng.random() < self.failure_rate
+        return max(0.0, latency), fail
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                path = self.path.split("?")[0]
+                if not path.startswith("/models/"):
+                    return self._reply(404, {"error": f"Unknown path {path}"})
+                chat = path.endswith("/v1/chat/completions")
+                model = path[len("/models/"):-len("/v1/chat/completions") if chat else None]
+                server._count("chat_completion" if chat else "text_generation")
+
+                latency, fail = server._draw(model)
+                time.sleep(latency)
+                if fail:
+                    server._count("failed")
+                    return self._reply(503, {"error": f"Model {model} is currently loading"})
+
+                if chat:
+                    prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+                    text = canned_response(prompt, server.responses)
+                    return self._reply(200, {
+                        "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                                  "total_tokens": (len(prompt) + len(text)) // 4},
+                    })
+                return self._reply(200, [{"generated_text": canned_response(body.get("inputs", ""), server.responses)}])
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-inference", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", default=DEFAULT_LATENCY,
+                        help="fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA, in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--failing-models", default="", help="Comma-separated models that always fail")
+    parser.add_argument("--responses", help="JSON file of canned responses: [{match, response}]")
+    parser.add_argument("--seed", type=int, help="Random seed, for repeatable latencies and failures")
+
+
+def from_arguments(args, host="127.0.0.1", port=0):
+    responses = []
+    if args.responses:
+        with open(args.responses) as responses_file:
+            responses = json.load(responses_file)
+    failing = [model.strip() for model in args.failing_models.split(",") if model.strip()]
+    return FakeInferenceServer(host, port, args.latency, args.failure_rate, failing, responses, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake HuggingFace inference API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = from_arguments(args, args.host, args.port).start()
+    print(f"Fake inference API on {server.url} (set HF_INFERENCE_URL={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats))
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
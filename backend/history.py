@@ -0,0 +1,171 @@
+"""
+Persistent query history.
+
+Records are rows in a SQLite table indexed by id, timestamp and schema, kept
+in the shared state file so every worker sees the same history. Listing is
+paginated with a cursor (the row's sequence number) and can project a subset
+of fields; the reasoning and result columns are stored last so summary
+listings never read them. Results and charts themselves normally live in the
+blob store, with only their hashes kept here; references to evicted blobs are
+cleared by forget_blobs().
+"""
+
+import json
+import sqlite3
+import threading
+
+from fastapi.encoders import jsonable_encoder
+
+# Entries kept; older ones are dropped as new ones are added (0 keeps everything)
+DEFAULT_RETENTION = 10_000
+
+SUMMARY_FIELDS = ("id", "question", "sql", "timestamp", "schema_name", "model_used", "execution_time", "status")
+DETAIL_FIELDS = ("reasoning_steps", "results", "visualization", "results_blob", "visualization_blob", "chart_spec")
+FIELDS = SUMMARY_FIELDS + DETAIL_FIELDS
+
+# Fields stored as JSON text
+JSON_FIELDS = ("reasoning_steps", "chart_spec")
+
+
+class HistoryStore:
+    """Query history table with O(log n) lookups and cursor pagination"""
+
+    def __init__(self, path, model, retention=DEFAULT_RETENTION):
+        self.model = model
+        self.retention = retention
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_history (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                schema_name TEXT,
+                model_used TEXT,
+                execution_time REAL,
+                status TEXT,
+                reasoning_steps TEXT,
+                results TEXT,
+                visualization TEXT,
+                results_blob TEXT,
+                visualization_blob TEXT,
+                chart_spec TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_query_history_timestamp ON query_history (timestamp);
+            CREATE INDEX IF NOT EXISTS idx_query_history_schema ON query_history (schema_name, seq);
+            """
+        )
+        # Add columns introduced after a state file was created
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(query_history)")}
+        for field in FIELDS:
+            if field not in existing:
+                self.conn.execute(f"ALTER TABLE query_history ADD COLUMN {field} TEXT")
+
+    @staticmethod
+    def _encode(field, value):
+        return json.dumps(value) if field in JSON_FIELDS and value is not None else value
+
+    @staticmethod
+    def _decode(row, fields):
+        record = dict(zip(fields, row))
+        for field in JSON_FIELDS:
+            if record.get(field) is not None:
+                record[field] = json.loads(record[field])
+        return record
+
+    def append(self, record):
+        values = jsonable_encoder(record)
+        columns = [field for field in FIELDS if field in values]
+        with self._lock:
+            cursor = self.conn.execute(
+                f"INSERT INTO query_history ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [self._encode(field, values[field]) for field in columns],
+            )
+            if self.retention:
+                # Sequence numbers only grow, so this is a range delete on the primary key
+                self.conn.execute("DELETE FROM query_history WHERE seq <= ?", (cursor.lastrowid - self.retention,))
+
+    def get(self, query_id):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM query_history WHERE id = ?", (query_id,)
+            ).fetchone()
+        return self.model(**self._decode(row, FIELDS)) if row else None
+
+    def update(self, query_id, **fields):
+        """Set fields on a stored record; returns False when it doesn't exist"""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown history fields: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self._lock:
+            cursor = self.conn.execute(
+                f"UPDATE query_history SET {assignments} WHERE id = ?",
+                [self._encode(field, value) for field, value in fields.items()] + [query_id],
+            )
+        return cursor.rowcount > 0
+
+    def forget_blobs(self, hashes):
+        """Clear references to blobs that were evicted; returns the records changed"""
+        hashes = list(hashes)
+        if not hashes:
+            return 0
+        marks = ", ".join("?" * len(hashes))
+        changed = 0
+        with self._lock:
+            for column, match in (
+                ("results_blob", "results_blob"),
+                ("visualization_blob", "visualization_blob"),
+                # Chart URLs: /charts/<key>.<format>
+                ("visualization", "CASE WHEN visualization LIKE '/charts/%' THEN substr(visualization, 9, 64) END"),
+            ):
+                changed += self.conn.execute(
+                    f"UPDATE query_history SET {column} = NULL WHERE {match} IN ({marks})", hashes
+                ).rowcount
+        return changed
+
+    def page(self, limit=100, cursor=None, schema_name=None, fields=FIELDS, flags=False):
+        """Return (records, next_cursor), newest first
+
+        `cursor` is the value returned as next_cursor by the previous page.
+        With `flags`, each record also gets has_results / has_visualization,
+        which lets a summary listing show badges without the data itself.
+        """
+        fields = tuple(fields)
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown history fields: {', '.join(sorted(unknown))}")
+        columns = ["seq", *fields]
+        if flags:
+            columns += [
+                "results IS NOT NULL OR results_blob IS NOT NULL",
+                "visualization IS NOT NULL OR visualization_blob IS NOT NULL OR chart_spec IS NOT NULL",
+            ]
+        conditions, params = [], []
+        if cursor is not None:
+            conditions.append("seq < ?")
+            params.append(cursor)
+        if schema_name:
+            conditions.append("schema_name = ?")
+            params.append(schema_name)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM query_history {where} ORDER BY seq DESC LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+
+        records = []
+        for row in rows[:limit]:
+            record = self._decode(row[1:len(fields) + 1], fields)
+            if flags:
+                record["has_results"], record["has_visualization"] = bool(row[-2]), bool(row[-1])
+            records.append(record)
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return records, next_cursor
@@ -0,0 +1,352 @@
+"""
+Index advisor for the schema databases.
+
+Watches the plans of executed queries (EXPLAIN QUERY PLAN), flags full table
+scans and temporary B-trees on large tables, and recommends covering indexes
+built from the columns each query filters, joins, groups and sorts on.
+Recommendations can be applied on demand or automatically in the background,
+with before/after timings of the queries that triggered them.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Tables smaller than this are cheap to scan and never get recommendations
+DEFAULT_MIN_TABLE_ROWS = 10_000
+
+# Widest index the advisor will propose, key and covering columns included
+DEFAULT_MAX_INDEX_COLUMNS = 5
+
+# Queries kept per recommendation for before/after timing
+MAX_SAMPLE_QUERIES = 5
+
+# Longest a sample query may hold the schema's lock while being timed; slower
+# ones are interrupted and reported without a time
+DEFAULT_SAMPLE_TIMEOUT = 0.5
+
+SQL_KEYWORDS = {
+    "ON", "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "OUTER", "NATURAL",
+    "GROUP", "ORDER", "LIMIT", "HAVING", "USING", "UNION", "EXCEPT", "INTERSECT",
+}
+TABLE_REF_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+CLAUSE_PATTERN = re.compile(r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b", re.IGNORECASE)
+ON_PATTERN = re.compile(
+    r"\bON\b(.*?)(?=\b(?:JOIN|INNER|LEFT|RIGHT|CROSS|WHERE|GROUP|ORDER|LIMIT|HAVING)\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$", re.IGNORECASE)
+TEMP_BTREE_PATTERN = re.compile(r"USE TEMP B-TREE FOR (.+)$", re.IGNORECASE)
+EQUALITY_OPERATORS = ("=", "IN", "IS")
+
+
+def explain_query_plan(conn, sql):
+    """Return the EXPLAIN QUERY PLAN rows of a statement as dicts"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql.strip().rstrip(';')}").fetchall()
+    return [{"id": row[0], "parent": row[1], "detail": row[3]} for row in rows]
+
+
+def split_clauses(sql):
+    """Map each top-level clause keyword (SELECT, FROM, WHERE, ...) to its text"""
+    depth_at = []
+    depth = 0
+    for char in sql:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        depth_at.append(depth)
+
+    markers = []
+    for match in CLAUSE_PATTERN.finditer(sql):
+        keyword = re.sub(r"\s+", " ", match.group(1).upper())
+        if depth_at[match.start()] == 0 and keyword not in (m[0] for m in markers):
+            markers.append((keyword, match.start(), match.end()))
+
+    clauses = {}
+    for i, (keyword, _, end) in enumerate(markers):
+        stop = markers[i + 1][1] if i + 1 < len(markers) else len(sql)
+        clauses[keyword] = sql[end:stop]
+    return clauses
+
+
+def table_aliases(sql):
+    """Map every table name and alias used in FROM/JOIN to the real table name"""
+    aliases = {}
+    for table, alias in TABLE_REF_PATTERN.findall(sql):
+        aliases[table.lower()] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _column_refs(text, aliases, table_columns):
+    """Yield (table, column, match) for every column reference in a fragment of SQL"""
+    tables_in_query = set(aliases.values())
+    for match in re.finditer(r'(?:"?(\w+)"?\.)?"?(\w+)"?', text):
+        qualifier, column = match.group(1), match.group(2)
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+            if table and column.lower() in table_columns.get(table, {}):
+                yield table, table_columns[table][column.lower()], match
+        else:
+            owners = [t for t in tables_in_query if column.lower() in table_columns.get(t, {})]
+            if len(owners) == 1:
+                yield owners[0], table_columns[owners[0]][column.lower()], match
+
+
+def _predicate_columns(text, aliases, table_columns):
+    """Split the columns compared in a predicate into equality and range columns"""
+    equality, ranges = [], []
+    for table, column, match in _column_refs(text, aliases, table_columns):
+        after = re.match(r"\s*(<=|>=|<>|!=|=|<|>|IN\b|IS\b|BETWEEN\b|LIKE\b)", text[match.end():], re.IGNORECASE)
+        before = re.search(r"(<=|>=|<>|!=|=|<|>)\s*$", text[:match.start()])
+        operator = (after or before)
+        if not operator:
+            continue
+        target = equality if operator.group(1).upper() in EQUALITY_OPERATORS else ranges
+        target.append((table, column))
+    return equality, ranges
+
+
+class IndexAdvisor:
+    """Collects query plans per schema and turns bad ones into index recommendations"""
+
+    def __init__(self, min_table_rows=DEFAULT_MIN_TABLE_ROWS, max_index_columns=DEFAULT_MAX_INDEX_COLUMNS,
+                 auto_create=False, sample_timeout=DEFAULT_SAMPLE_TIMEOUT):
+        self.min_table_rows = min_table_rows
+        self.max_index_columns = max_index_columns
+        self.auto_create = auto_create
+        self.sample_timeout = sample_timeout
+        self.recommendations = {}
+        self.reports = deque(maxlen=100)
+        self._row_counts = {}
+        self._lock = threading.Lock()
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+
+    def forget(self, schema_name):
+        """Drop everything learned about a schema (e.g. after its database is rebuilt)"""
+        with self._lock:
+            self._row_counts = {k: v for k, v in self._row_counts.items() if k[0] != schema_name}
+            self.recommendations = {k: v for k, v in self.recommendations.items() if k[0] != schema_name}
+
+    def prime(self, schema_name, conn):
+        """Count table rows ahead of the first observed query"""
+        for (table,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall():
+            self._row_count(schema_name, conn, table)
+
+    def _row_count(self, schema_name, conn, table):
+        key = (schema_name, table)
+        if key not in self._row_counts:
+            self._row_counts[key] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        return self._row_counts[key]
+
+    def _table_columns(self, conn, tables):
+        columns = {}
+        for table in tables:
+            columns[table] = {row[1].lower(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        return columns
+
+    def _existing_indexes(self, conn, table):
+        indexes = []
+        for row in conn.execute(f'PRAGMA index_list("{table}")'):
+            indexes.append([info[2] for info in conn.execute(f'PRAGMA index_info("{row[1]}")')])
+        return indexes
+
+    def observe(self, schema_name, conn, sql, elapsed, lock=None, catalog=None):
+        """Inspect the plan of an executed query and record any index recommendations
+
+        Column names come from the schema's `catalog` when given, and from
+        PRAGMA table_info otherwise. Returns the plan findings (full scans and
+        temp B-trees on large tables).
+        """
+        plan = explain_query_plan(conn, sql)
+        aliases = table_aliases(sql)
+        tables = set(aliases.values())
+        table_columns = catalog.table_columns(tables) if catalog else self._table_columns(conn, tables)
+        clauses = split_clauses(sql)
+
+        flagged = {}
+        for step in plan:
+            detail = step["detail"]
+            scan = SCAN_PATTERN.match(detail)
+            if scan and "COVERING INDEX" not in scan.group(3).upper():
+                table = aliases.get((scan.group(2) or scan.group(1)).lower(), scan.group(1))
+                if table in table_columns and self._row_count(schema_name, conn, table) >= self.min_table_rows:
+                    flagged.setdefault(table, []).append(f"full scan: {detail}")
+            temp_btree = TEMP_BTREE_PATTERN.search(detail)
+            if temp_btree:
+                purpose = temp_btree.group(1).upper()
+                clause = clauses.get(purpose, "") if purpose in ("GROUP BY", "ORDER BY") else clauses.get("SELECT", "")
+                for table, _, _ in _column_refs(clause, aliases, table_columns):
+                    if self._row_count(schema_name, conn, table) >= self.min_table_rows:
+                        flagged.setdefault(table, []).append(f"temp b-tree: {detail}")
+
+        findings = [{"table": table, "reasons": reasons} for table, reasons in flagged.items()]
+        if not flagged:
+            return findings
+
+        equality, ranges = _predicate_columns(clauses.get("WHERE", ""), aliases, table_columns)
+        joins = []
+        for condition in ON_PATTERN.findall(clauses.get("FROM", "")):
+            joins.extend((t, c) for t, c, _ in _column_refs(condition, aliases, table_columns))
+        ordering = [
+            (t, c) for clause in ("GROUP BY", "ORDER BY")
+            for t, c, _ in _column_refs(clauses.get(clause, ""), aliases, table_columns)
+        ]
+        select_clause = clauses.get("SELECT", "")
+        selected = list(_column_refs(select_clause, aliases, table_columns))
+
+        def own(*groups):
+            columns = []
+            for group in groups:
+                for owner, column in group:
+                    if owner == table and column not in columns:
+                        columns.append(column)
+            return columns
+
+        for table, reasons in flagged.items():
+            # Seek on equality filters, then one range filter; a scanned table with
+            # neither is better served as the inner side of its join. Sort columns
+            # only help while no range filter breaks the index order.
+            key_columns = own(equality, ranges[:1]) or own(joins)
+            if not own(ranges):
+                key_columns += [c for c in own(ordering) if c not in key_columns]
+            if not key_columns:
+                continue  # Nothing to seek or sort on, an index wouldn't help
+            columns = key_columns[:self.max_index_columns]
+
+            # Make the index covering when the query reads only a few columns of this table
+            select_star = re.search(r"(^|[\s,])(\*|\w+\.\*)", select_clause)
+            if not select_star:
+                for column in own(joins, ranges, ordering, [(t, c) for t, c, _ in selected]):
+                    if column not in columns and len(columns) < self.max_index_columns:
+                        columns.append(column)
+
+            if any(index[:len(key_columns)] == key_columns for index in self._existing_indexes(conn, table)):
+                continue  # Already indexed
+            self._record(schema_name, table, columns, reasons, sql, elapsed, conn, lock)
+
+        return findings
+
+    def _record(self, schema_name, table, columns, reasons, sql, elapsed, conn, lock):
+        key = (schema_name, table, tuple(columns))
+        with self._lock:
+            recommendation = self.recommendations.get(key)
+            is_new = recommendation is None
+            if is_new:
+                name = f"idx_{table}_{'_'.join(columns)}"
+                quoted = ", ".join(f'"{column}"' for column in columns)
+                recommendation = {
+                    "schema_name": schema_name,
+                    "table": table,
+                    "columns": list(columns),
+                    "index_name": name,
+                    "ddl": f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quoted})',
+                    "reasons": [],
+                    "queries": 0,
+                    "total_time": 0.0,
+                    "sample_queries": [],
+                    "status": "recommended",
+                }
+                self.recommendations[key] = recommendation
+            recommendation["queries"] += 1
+            recommendation["total_time"] += elapsed
+            for reason in reasons:
+                if reason not in recommendation["reasons"]:
+                    recommendation["reasons"].append(reason)
+            if sql not in recommendation["sample_queries"] and len(recommendation["sample_queries"]) < MAX_SAMPLE_QUERIES:
+                recommendation["sample_queries"].append(sql)
+
+        if is_new and self.auto_create:
+            self._background.submit(self._safe_create, key, conn, lock)
+
+    def get_recommendations(self, schema_name=None):
+        """List recommendations, most expensive workload first"""
+        with self._lock:
+            items = [dict(r) for k, r in self.recommendations.items() if schema_name in (None, k[0])]
+        return sorted(items, key=lambda r: r["total_time"], reverse=True)
+
+    def _safe_create(self, key, conn, lock):
+        try:
+            self.create_index(key, conn, lock)
+        except Exception as e:
+            logger.warning("Background index creation failed for %s: %s", key, e)
+
+    def _timed(self, conn, lock, sql):
+        """Seconds a sample query takes, or None when it runs past sample_timeout"""
+        with lock:
+            start = time.perf_counter()
+            deadline = start + self.sample_timeout
+            conn.set_progress_handler(lambda: time.perf_counter() > deadline, 10_000)
+            try:
+                conn.execute(sql).fetchall()
+            except sqlite3.OperationalError:
+                if time.perf_counter() <= deadline:
+                    raise
+                return None  # Interrupted
+            finally:
+                conn.set_progress_handler(None, 0)
+            return time.perf_counter() - start
+
+    def create_index(self, key, conn, lock=None):
+        """Build one recommended index and time its sample queries before and after
+
+        Each sample query holds the schema's lock for at most sample_timeout,
+        so timing a large table doesn't stall the schema's other queries.
+        """
+        lock = lock or threading.Lock()
+        with self._lock:
+            # Gone (the schema was rebuilt), built, or being built by another call
+            recommendation = self.recommendations.get(key)
+            if recommendation is None or recommendation["status"] in ("creating", "created"):
+                return None
+            recommendation["status"] = "creating"
+            sample_queries = list(recommendation["sample_queries"])
+
+        def timed(sql):
+            return self._timed(conn, lock, sql)
+
+        try:
+            before = [timed(sql) for sql in sample_queries]
+            with lock:
+                start = time.perf_counter()
+                conn.execute(recommendation["ddl"])
+                conn.execute(f'ANALYZE "{recommendation["table"]}"')
+                conn.commit()
+                build_time = time.perf_counter() - start
+            after = [timed(sql) for sql in sample_queries]
+        except Exception:
+            with self._lock:
+                recommendation["status"] = "recommended"
+            raise
+
+        with self._lock:
+            recommendation["status"] = "created"
+        report = {
+            "schema_name": recommendation["schema_name"],
+            "index_name": recommendation["index_name"],
+            "ddl": recommendation["ddl"],
+            "build_time": build_time,
+            "queries": [
+                {"sql": sql, "before": b, "after": a, "speedup": (b / a) if b and a else None}
+                for sql, b, a in zip(sample_queries, before, after)
+            ],
+            "created_at": time.time(),
+        }
+        self.reports.append(report)
+        return report
+
+    def apply(self, schema_name, conn, lock=None):
+        """Create every outstanding recommendation for a schema; returns the reports"""
+        with self._lock:
+            keys = [k for k, r in self.recommendations.items() if k[0] == schema_name and r["status"] != "created"]
+        return [report for report in (self.create_index(key, conn, lock) for key in keys) if report]
@@ -0,0 +1,323 @@
+"""
+Offline load test for the API, using the fake inference server.
+
+Starts fake_inference.py's server and a uvicorn process pointed at it
+(HF_INFERENCE_URL), so no HuggingFace token or network is needed. It then
+drives POST /generate_sql and POST /execute_sql from a growing number of
+concurrent clients. Each client sends its next request as soon as the last
+one is answered. For each concurrency level it reports throughput, p50/p95/p99
+latency and errors per endpoint. The saturation point is the last level
+before throughput stops scaling with the number of clients (see
+saturation_point()).
+
+    python loadtest.py --concurrency 1,2,4,8,16 --duration 10 --latency lognormal:0.3,0.5
+
+The API process inherits this environment, so e.g. EXECUTION_WORKERS=2
+python loadtest.py load-tests that configuration. The semantic cache is off
+unless SEMANTIC_CACHE_ENABLED=true is set. With --api-url, the
+API at that URL is driven instead; it must already point at an inference
+server. The exit status is non-zero when a level's error rate is over
+--max-error-rate, so it can run in CI.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import fake_inference
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUESTIONS = {
+    "default": [
+        "Show all customers",
+        "What are the ten most expensive products?",
+        "How many orders were placed per customer?",
+        "List orders from the last month",
+    ],
+    "hr": [
+        "What's the average salary by department?",
+        "List employees hired this year",
+        "Which department has the most employees?",
+    ],
+    "library": [
+        "Show all books",
+        "Which members have overdue loans?",
+        "How many books does each author have?",
+    ],
+}
+
+
+# p95 growth below this between two levels is noise, not a latency knee
+MIN_KNEE_LATENCY_GROWTH = 1.5
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    # Rounded first so float error (0.07 * 100 = 7.000000000000001) doesn't move up a rank
+    index = max(0, min(len(sorted_values) - 1, math.ceil(round(fraction * len(sorted_values), 9)) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    """A keep-alive HTTP connection to the API"""
+
+    def __init__(self, url, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def post(self, path, payload):
+        """(status, parsed body); status 0 for connection errors"""
+        body = json.dumps(payload)
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request("POST", path, body, {"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            data = response.read()
+            return response.status, json.loads(data) if data else None
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            return 0, str(e)
+
+
+def start_api(inference_url, state_dir, api_workers, timeout=60):
+    """Launch uvicorn against the fake inference server; returns (process, url)"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "HF_INFERENCE_URL": inference_url,
+        "HUGGINGFACE_API_TOKEN": env.get("HUGGINGFACE_API_TOKEN") or "loadtest",
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "WARMUP_MODELS": "",
+    })
+    env.setdefault("LOG_LEVEL", "WARNING")
+    # The same few questions repeat, so the semantic cache would answer most of them
+    env.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(api_workers),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited before becoming ready")
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=1) as response:
+                if response.status == 200:
+                    return proc, url
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"API not ready within {timeout}s")
+
+
+def seed_queries(url, schemas, timeout):
+    """Generate one query per question, for /execute_sql to run; returns [(query_id, schema)]"""
+    client = Client(url, timeout)
+    queries = []
+    for schema in schemas:
+        for question in QUESTIONS.get(schema, QUESTIONS["default"]):
+            status, body = client.post("/generate_sql", {"question": question, "schema_name": schema})
+            if status != 200:
+                raise RuntimeError(f"Seeding failed for '{question}' on {schema}: {status} {body}")
+            queries.append((body["query_id"], schema))
+    return queries
+
+
+def run_level(url, concurrency, duration, requests_for, timeout):
+    """Drive the API from `concurrency` clients for `duration` seconds"""
+    samples = []  # (endpoint, seconds, ok)
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def drive(index):
+        client = Client(url, timeout)
+        requests = requests_for(index)
+        while time.perf_counter() < stop_at:
+            endpoint, payload = next(requests)
+            started = time.perf_counter()
+            status, _ = client.post(endpoint, payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append((endpoint, elapsed, status == 200))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return summarize(concurrency, wall, samples)
+
+
+def summarize(concurrency, wall, samples):
+    def stats(selected):
+        latencies = sorted(seconds * 1000 for _, seconds, _ in selected)
+        errors = sum(1 for _, _, ok in selected if not ok)
+        return {
+            "requests": len(selected),
+            "errors": errors,
+            "error_rate": round(errors / len(selected), 4) if selected else 0.0,
+            "throughput_rps": round(len(selected) / wall, 2),
+            "p50_ms": round(percentile(latencies, 0.50) or 0, 1),
+            "p95_ms": round(percentile(latencies, 0.95) or 0, 1),
+            "p99_ms": round(percentile(latencies, 0.99) or 0, 1),
+        }
+
+    endpoints = sorted({endpoint for endpoint, _, _ in samples})
+    return {
+        "concurrency": concurrency,
+        "seconds": round(wall, 2),
+        **stats(samples),
+        "endpoints": {endpoint: stats([s for s in samples if s[0] == endpoint]) for endpoint in endpoints},
+    }
+
+
+def saturation_point(levels, efficiency):
+    """(level, reason) for the last level before saturation, or None
+
+    Going from `c1` to `c2` clients should multiply throughput by up to
+    c2 / c1. A step saturates when it got less than `efficiency` of that
+    gain, or when an endpoint's p95 grew by a larger factor than its
+    throughput (the latency knee: requests queue instead of being served).
+    """
+    for previous, current in zip(levels, levels[1:]):
+        ideal = current["concurrency"] / previous["concurrency"]
+        if previous["throughput_rps"] and ideal > 1:
+            growth = current["throughput_rps"] / previous["throughput_rps"]
+            if growth - 1 < efficiency * (ideal - 1):
+                return previous, (f"throughput grew {growth:.2f}x for {ideal:.2f}x the clients "
+                                  f"({previous['throughput_rps']} to {current['throughput_rps']} req/s)")
+        for endpoint, stats in current["endpoints"].items():
+            before = previous["endpoints"].get(endpoint)
+            if not before or not before["throughput_rps"] or not before["p95_ms"]:
+                continue
+            throughput_growth = stats["throughput_rps"] / before["throughput_rps"]
+            latency_growth = stats["p95_ms"] / before["p95_ms"]
+            if latency_growth > max(throughput_growth, MIN_KNEE_LATENCY_GROWTH):
+                return previous, (f"{endpoint} p95 grew {latency_growth:.2f}x while its throughput "
+                                  f"grew {throughput_growth:.2f}x")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument("--execute-ratio", type=float, default=0.5,
+                        help="Fraction of requests that are /execute_sql (the rest are /generate_sql)")
+    parser.add_argument("--schemas", default="default,hr,library")
+    parser.add_argument("--no-reasoning", action="store_true", help="Send include_reasoning=false")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--api-url", help="Drive this API instead of starting one")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--saturation-efficiency", type=float, default=0.5,
+                        help="Fraction of the ideal throughput gain a step must reach to count as scaling")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--json", help="Also write the report to this file")
+    fake_inference.add_arguments(parser)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    schemas = [schema.strip() for schema in args.schemas.split(",") if schema.strip()]
+    fake = None if args.api_url else fake_inference.from_arguments(args).start()
+    proc = None
+    with tempfile.TemporaryDirectory() as state_dir:
+        try:
+            if args.api_url:
+                url = args.api_url.rstrip("/")
+            else:
+                proc, url = start_api(fake.url, state_dir, args.api_workers)
+            queries = seed_queries(url, schemas, args.timeout)
+            questions = [(question, schema) for schema in schemas
+                         for question in QUESTIONS.get(schema, QUESTIONS["default"])]
+
+            def requests_for(index):
+                # Each client gets its own deterministic mix
+                rng = random.Random(index)
+                for n in itertools.count():
+                    if rng.random() < args.execute_ratio:
+                        query_id, schema = queries[rng.randrange(len(queries))]
+                        yield "/execute_sql", {"query_id": query_id, "schema_name": schema}
+                    else:
+                        question, schema = questions[(index + n) % len(questions)]
+                        yield "/generate_sql", {"question": question, "schema_name": schema,
+                                                "include_reasoning": not args.no_reasoning}
+
+            results = []
+            print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  per endpoint")
+            for concurrency in levels:
+                result = run_level(url, concurrency, args.duration, requests_for, args.timeout)
+                results.append(result)
+                per_endpoint = "  ".join(
+                    f"{endpoint} {stats['throughput_rps']}/s p95 {stats['p95_ms']}ms"
+                    for endpoint, stats in result["endpoints"].items()
+                )
+                print(f"{concurrency:>7} {result['throughput_rps']:>8.2f} {result['p50_ms']:>9.1f} "
+                      f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7}  {per_endpoint}")
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+            if fake is not None:
+                fake.stop()
+
+    saturated = saturation_point(results, args.saturation_efficiency)
+    failures = [
+        f"{level['error_rate']:.1%} errors at concurrency {level['concurrency']} (max {args.max_error_rate:.1%})"
+        for level in results if level["error_rate"] > args.max_error_rate
+    ]
+    if saturated:
+        level, reason = saturated
+        print(f"saturated at {level['concurrency']} clients, {level['throughput_rps']} req/s: {reason}")
+    else:
+        print("no saturation up to the highest concurrency level")
+    if fake is not None:
+        print(f"fake inference: {json.dumps(fake.stats)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        report = {
+            "levels": results,
+            "saturation": saturated and {"concurrency": saturated[0]["concurrency"],
+                                         "throughput_rps": saturated[0]["throughput_rps"],
+                                         "reason": saturated[1]},
+            "inference": fake.stats if fake is not None else None,
+            "failures": failures,
+        }
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Structured, leveled logging that stays off the request path.
+
+Modules log through `logging.getLogger(__name__)`. configure() puts a queue
+between them and the output: a request only checks the level and enqueues
+the record, and a listener thread formats it (JSON by default, one object per
+line) and writes it to stdout. Each record carries the id of the request it
+was logged in (the request's trace id, also sent as X-Trace-Id).
+
+At the default INFO level the per-request details (SQL before and after
+preprocessing, model attempts, model responses) are DEBUG records, so they
+cost a level check. With LOG_LEVEL=DEBUG, LOG_DEBUG_SAMPLE_RATE keeps the
+DEBUG records of only that fraction of requests, chosen by request id so a
+sampled request is logged completely.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+import tracing
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class RequestContext(logging.Filter):
+    """Stamps records with the current request's id, in the thread that logged them"""
+
+    def filter(self, record):
+        record.request_id = tracing.current_trace_id()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keeps DEBUG records for a fraction of requests; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            # The same decision for every record of a request
+            return int(request_id[:8], 16) < self.rate * 0x100000000
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with `extra=` fields as keys"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{text} [{request_id}]" if request_id else text
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueues records as they are, so formatting happens on the listener thread
+
+    (The stock QueueHandler formats in the caller, to make records picklable
+    for multiprocessing queues; this queue never leaves the process.)
+    """
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure(level="INFO", fmt="json", debug_sample_rate=1.0, stream=None):
+    """Route the root logger through a queue to `stream`; returns the listener"""
+    global _listener
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContext())
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, _DeferredQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _stop_listener()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+# Flush what's queued when the process exits
+atexit.register(_stop_listener)
@@ -1,25 +1,57 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, Body
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import requests
 import os
+
+# Headless chart backend, set before anything can import matplotlib (the
+# chart render workers inherit it)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from fastapi import FastAPI, Request, HTTPException, Depends, Body, Header
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 import json
 import re
 import asyncio
+import functools
 from concurrent.futures import ThreadPoolExecutor
 import time
-from huggingface_hub import InferenceClient
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 import uuid
 import datetime
 import sqlite3
-import pandas as pd
-import pandas.io.sql
-from io import BytesIO
-import matplotlib.pyplot as plt
-import base64
-import traceback
+import threading
+import contextvars
+import random
+from contextlib import asynccontextmanager
+from index_advisor import IndexAdvisor
+from query_guard import QueryGuard, QueryRejected
+from sql_validator import SQLValidator
+from engines import SQLiteEngine, DuckDBEngine, parse_engine_config
+from state import open_store, SchemaRegistry, VersionConflict
+from blobs import BlobStore
+from charts import ChartRenderer, ChartRenderError, ChartRenderTimeout, prepare_chart, vega_lite_spec, FORMATS as CHART_FORMATS
+from history import HistoryStore, FIELDS as HISTORY_FIELDS, SUMMARY_FIELDS as HISTORY_SUMMARY_FIELDS
+from warmup import Warmup
+from catalog import Catalog
+from builtin_schemas import BUILTIN_SCHEMA_DEFINITIONS
+from sandbox import SandboxPool, SandboxLimit
+from workers import ShardedPool, WorkerError
+from semantic_cache import SemanticCache
+import metrics
+import tracing
+import profiling
+import hmac
+import logging
+import logs
+
+# Logging (see logs.py): records go through a queue to a background writer.
+# LOG_FORMAT is "json" (one object per line) or "text". At LOG_LEVEL=DEBUG,
+# LOG_DEBUG_SAMPLE_RATE keeps the DEBUG records of that fraction of requests.
+LOG_LISTENER = logs.configure(
+    os.environ.get("LOG_LEVEL", "INFO"),
+    os.environ.get("LOG_FORMAT", "json"),
+    float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0")),
+)
+logger = logging.getLogger("nl2sql")
 
 # Define data models
 class Schema(BaseModel):
@@ -31,18 +63,44 @@ class QueryHistory(BaseModel):
     question: str
     sql: str
     timestamp: str
+    schema_name: Optional[str] = None
     model_used: str
     execution_time: float
     status: str = "success"
     results: Optional[str] = None
     visualization: Optional[str] = None
     reasoning_steps: Optional[List[str]] = None
+    chart_spec: Optional[Dict[str, Any]] = None
+    # Hashes of the results (and, for older entries, the chart image) in the
+    # blob store (GET /blobs/{hash}); charts are otherwise /charts/ URLs
+    results_blob: Optional[str] = None
+    visualization_blob: Optional[str] = None
+
+class SandboxCreateRequest(BaseModel):
+    schema_name: Optional[str] = None
+
+class SandboxExecuteRequest(BaseModel):
+    sql: str
+    chart_format: Optional[str] = None
+
+class SchemaInfo(Schema):
+    version: int
+    rebuild: Optional[str] = None  # "pending" or "done" after a change
+
+class SchemaUpdate(BaseModel):
+    definition: str
+    expected_version: Optional[int] = None  # Fails with 409 when the schema has moved on
+
+class SchemaPatch(BaseModel):
+    ddl: str  # Statements appended to the definition, e.g. ALTER TABLE ... ADD COLUMN
+    expected_version: Optional[int] = None
 
 class GenerateSQLRequest(BaseModel):
     question: str
     schema_name: Optional[str] = None
     include_reasoning: Optional[bool] = True
     execute_query: Optional[bool] = False
+    chart_format: Optional[str] = None  # "spec", "png" or "svg"; CHART_FORMAT by default
 
 class GenerateSQLResponse(BaseModel):
     sql: str
@@ -54,11 +112,35 @@ class GenerateSQLResponse(BaseModel):
     reasoning_steps: Optional[List[str]] = None
     results: Optional[str] = None
     result_visualization: Optional[str] = None
+    chart_spec: Optional[Dict[str, Any]] = None
+    cost_estimate: Optional[Dict[str, Any]] = None
+    validation: Optional[Dict[str, Any]] = None
+    semantic_cache: Optional[Dict[str, Any]] = None  # Set when answered from the semantic cache
+
+class SemanticCacheFalseHit(BaseModel):
+    query_id: str
+
+class ExplainSQLRequest(BaseModel):
+    sql: str
+    schema_name: Optional[str] = None
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background; GET /ready reports when it's done
+    if WORKER_POOL:
+        WORKER_POOL.start()
+    asyncio.get_running_loop().run_in_executor(None, WARMUP.run)
+    yield
+    CHART_RENDERER.shutdown()
+    if WORKER_POOL:
+        WORKER_POOL.shutdown()
+    TRACER.close()
 
 app = FastAPI(
     title="NL2SQL AI",
     description="Convert natural language to SQL queries using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -67,11 +149,44 @@ app.add_middleware(
     allow_origins=["*"],  # In production, replace with specific origins
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Trace the request and record its latency; stage timings go in Server-Timing"""
+    start = time.perf_counter()
+    root, token = TRACER.start(f"{request.method} {request.url.path}", **{"http.method": request.method})
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = tracing.server_timing(root)
+        response.headers["X-Trace-Id"] = root.trace_id
+        return response
+    finally:
+        # Label by route template, so ids in paths don't make new series
+        route = request.scope.get("route")
+        route = route.path if route else "unmatched"
+        root.name = f"{request.method} {route}"
+        root.set(**{"http.route": route, "http.status_code": status})
+        TRACER.finish(root, token)
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+
 # Create a thread pool for running API calls
 executor = ThreadPoolExecutor(max_workers=1)
 
+# Model requests block for as long as the model takes, so they run on their
+# own threads instead of the event loop (or the default executor, which query
+# execution uses)
+MODEL_CALL_THREADS = int(os.environ.get("MODEL_CALL_THREADS", "16"))
+MODEL_CALLS = ThreadPoolExecutor(max_workers=MODEL_CALL_THREADS, thread_name_prefix="model-call")
+
+async def run_model_call(fn, *args, **kwargs):
+    """Await a blocking inference client call on the model-call threads"""
+    return await asyncio.get_running_loop().run_in_executor(
+        MODEL_CALLS, tracing.in_context(functools.partial(fn, *args, **kwargs)))
+
 # HuggingFace API settings
 HF_API_TOKEN = os.environ.get("HUGGINGFACE_API_TOKEN", "")
 
@@ -86,153 +201,261 @@ SQL_MODELS = {
 # Get selected model from environment variable or use default
 SELECTED_MODEL = os.environ.get("SELECTED_MODEL", "sqlcoder")
 if SELECTED_MODEL not in SQL_MODELS:
-    print(f"Warning: Unknown model '{SELECTED_MODEL}'. Falling back to 'sqlcoder'")
+    logger.warning("Unknown model '%s'. Falling back to 'sqlcoder'", SELECTED_MODEL)
     SELECTED_MODEL = "sqlcoder"
 
 MODEL_NAME = SQL_MODELS[SELECTED_MODEL]
 
-print(f"Using HuggingFace Hub with primary model: {MODEL_NAME}")
-print(f"Will try alternate models if the primary model fails")
+logger.info("Using HuggingFace Hub with primary model %s; alternate models are tried if it fails", MODEL_NAME)
+
+# Send inference requests to {HF_INFERENCE_URL}/models/{model} instead of the
+# HuggingFace router, e.g. a self-hosted endpoint or the load test's fake
+# server (see fake_inference.py)
+HF_INFERENCE_URL = os.environ.get("HF_INFERENCE_URL", "").rstrip("/")
+if HF_INFERENCE_URL:
+    logger.info("Sending inference requests to %s", HF_INFERENCE_URL)
 
 if not HF_API_TOKEN:
-    print("WARNING: No HuggingFace API token provided. API calls may be rate limited or rejected.")
-    print("Set the HUGGINGFACE_API_TOKEN environment variable with your token.")
-
-# In-memory database for schemas and query history
-SCHEMAS = {
-    "default": Schema(
-        name="default",
-        definition="""
-CREATE TABLE customers (
-    customer_id INT PRIMARY KEY,
-    name VARCHAR(100),
-    email VARCHAR(100),
-    join_date DATE
-);
-
-CREATE TABLE products (
-    product_id INT PRIMARY KEY,
-    name VARCHAR(100),
-    category VARCHAR(50),
-    price DECIMAL(10, 2)
-);
-
-CREATE TABLE orders (
-    order_id INT PRIMARY KEY,
-    customer_id INT,
-    order_date DATE,
-    total_amount DECIMAL(10, 2),
-    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
-);
-
-CREATE TABLE order_items (
-    order_id INT,
-    product_id INT,
-    quantity INT,
-    price DECIMAL(10, 2),
-    PRIMARY KEY (order_id, product_id),
-    FOREIGN KEY (order_id) REFERENCES orders(order_id),
-    FOREIGN KEY (product_id) REFERENCES products(product_id)
-);
-"""
-    ),
-    "hr": Schema(
-        name="hr",
-        definition="""
-CREATE TABLE employees (
-    employee_id INT PRIMARY KEY,
-    first_name VARCHAR(50),
-    last_name VARCHAR(50),
-    email VARCHAR(100),
-    phone_number VARCHAR(20),
-    hire_date DATE,
-    job_id INT,
-    salary DECIMAL(10, 2),
-    commission_pct DECIMAL(4, 2),
-    manager_id INT,
-    department_id INT
-);
-
-CREATE TABLE departments (
-    department_id INT PRIMARY KEY,
-    department_name VARCHAR(100),
-    manager_id INT,
-    location_id INT
-);
-
-CREATE TABLE jobs (
-    job_id INT PRIMARY KEY,
-    job_title VARCHAR(100),
-    min_salary DECIMAL(10, 2),
-    max_salary DECIMAL(10, 2)
-);
-
-CREATE TABLE job_history (
-    employee_id INT,
-    start_date DATE,
-    end_date DATE,
-    job_id INT,
-    department_id INT,
-    PRIMARY KEY (employee_id, start_date)
-);
-"""
-    ),
-    "library": Schema(
-        name="library",
-        definition="""
-CREATE TABLE books (
-    book_id INT PRIMARY KEY,
-    title VARCHAR(200),
-    author_id INT,
-    publisher_id INT,
-    publication_year INT,
-    isbn VARCHAR(20),
-    genre VARCHAR(50),
-    available_copies INT
-);
-
-CREATE TABLE authors (
-    author_id INT PRIMARY KEY,
-    name VARCHAR(100),
-    birth_year INT,
-    nationality VARCHAR(50)
-);
-
-CREATE TABLE publishers (
-    publisher_id INT PRIMARY KEY,
-    name VARCHAR(100),
-    location VARCHAR(100)
-);
-
-CREATE TABLE borrowers (
-    borrower_id INT PRIMARY KEY,
-    name VARCHAR(100),
-    email VARCHAR(100),
-    join_date DATE
-);
-
-CREATE TABLE loans (
-    loan_id INT PRIMARY KEY,
-    book_id INT,
-    borrower_id INT,
-    loan_date DATE,
-    return_date DATE,
-    FOREIGN KEY (book_id) REFERENCES books(book_id),
-    FOREIGN KEY (borrower_id) REFERENCES borrowers(borrower_id)
-);
-"""
-    )
+    logger.warning("No HuggingFace API token provided (set HUGGINGFACE_API_TOKEN). "
+                   "API calls may be rate limited or rejected.")
+
+# Metrics served by GET /metrics (see metrics.py), for capacity planning.
+# Each process has its own; chart render metrics are declared in charts.py.
+HTTP_SECONDS = metrics.histogram(
+    "nl2sql_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+LLM_SECONDS = metrics.histogram(
+    "nl2sql_llm_request_seconds", "Inference API call latency", ["model", "endpoint", "status"])
+GENERATIONS = metrics.counter(
+    "nl2sql_generations_total", "SQL generations by where the SQL came from (fast_path, model or rule_based)",
+    ["outcome"])
+GENERATION_SECONDS = metrics.histogram(
+    "nl2sql_generation_seconds", "Time to generate SQL, before validation", ["outcome"])
+FALLBACK_DEPTH = metrics.histogram(
+    "nl2sql_fallback_depth", "Models that failed before SQL was generated (all of them for rule_based)",
+    buckets=(0, 1, 2, 3, 4))
+CATALOG_CACHE = metrics.counter(
+    "nl2sql_catalog_cache_total", "Schema catalog lookups by cache result", ["result"])
+PREPROCESS_SECONDS = metrics.histogram(
+    "nl2sql_sql_preprocess_seconds", "Time to rewrite SQL for SQLite")
+QUERY_SECONDS = metrics.histogram(
+    "nl2sql_query_seconds", "Statement execution time on the schema's engine", ["engine"])
+QUERY_ERRORS = metrics.counter(
+    "nl2sql_query_errors_total", "Failed query executions by HTTP status", ["status"])
+RESULT_ROWS = metrics.histogram(
+    "nl2sql_result_rows", "Rows returned by executed queries", ["engine"], buckets=metrics.ROW_BUCKETS)
+RESULT_BYTES = metrics.histogram(
+    "nl2sql_result_bytes", "Size of executed queries' JSON results", ["engine"], buckets=metrics.BYTE_BUCKETS)
+SEMANTIC_CACHE_LOOKUPS = metrics.counter(
+    "nl2sql_semantic_cache_total", "Semantic cache lookups by result (hit, miss or rejected)", ["result"])
+SEMANTIC_CACHE_SIMILARITY = metrics.histogram(
+    "nl2sql_semantic_cache_similarity", "Similarity of the closest cached question at lookup",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0))
+SEMANTIC_CACHE_FALSE_HITS = metrics.counter(
+    "nl2sql_semantic_cache_false_hits_total", "Cache hits found to be wrong, by audit or by report", ["source"])
+metrics.gauge("nl2sql_schema_databases", "Schema databases held by this process", fn=lambda: len(DB_CONNECTIONS))
+metrics.gauge("nl2sql_sandbox_bytes", "Memory used by sandboxes and their images",
+              fn=lambda: SANDBOXES.stats()["used_bytes"])
+metrics.gauge("nl2sql_ready", "Whether startup warm-up has finished", fn=lambda: int(WARMUP.ready))
+
+# Request tracing (see tracing.py): each response's stage timings go in its
+# Server-Timing header, requests slower than SLOW_REQUEST_MS are kept for
+# GET /debug/slow, and when TRACE_EXPORT_PATH is set every trace is appended
+# to it as OTLP/JSON
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+TRACER = tracing.Tracer(
+    slow_ms=float(os.environ.get("SLOW_REQUEST_MS", "2000")),
+    slow_log_size=int(os.environ.get("SLOW_REQUEST_LOG_SIZE", "100")),
+    exporter=tracing.OTLPFileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+)
+
+# Admin endpoints (/admin/...) need ADMIN_TOKEN, sent as a bearer token or in
+# X-Admin-Token, and are disabled when it is unset. CPU profiles run for at
+# most PROFILE_MAX_SECONDS; tracemalloc keeps TRACEMALLOC_FRAMES frames per
+# allocation (deep enough to see our code under pandas) once started.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+CPU_PROFILER = profiling.SamplingProfiler()
+MEMORY_PROFILER = profiling.MemoryProfiler(frames=int(os.environ.get("TRACEMALLOC_FRAMES", "25")))
+
+def require_admin(authorization: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled. Set ADMIN_TOKEN to enable them")
+    supplied = x_admin_token or ""
+    if authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[7:]
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+class TimedInferenceClient:
+    """An InferenceClient that records the latency of every call in LLM_SECONDS"""
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+
+    def _timed(self, endpoint, fn, *args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with tracing.span(f"llm.{endpoint}", model=self.model):
+                response = fn(*args, **kwargs)
+            status = "ok"
+            return response
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, endpoint=endpoint, status=status)
+
+    def chat_completion(self, *args, **kwargs):
+        return self._timed("chat_completion", self.client.chat_completion, *args, **kwargs)
+
+    def text_generation(self, *args, **kwargs):
+        return self._timed("text_generation", self.client.text_generation, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def hub_inference_client(model, token):
+    """A huggingface_hub InferenceClient for a model (via HF_INFERENCE_URL when set)"""
+    # Deferred so starting a worker doesn't pay for huggingface_hub's imports
+    from huggingface_hub import InferenceClient
+    target = f"{HF_INFERENCE_URL}/models/{model}" if HF_INFERENCE_URL else model
+    return InferenceClient(model=target, token=token)
+
+# One client per model, reused so warm-up and requests share its setup
+INFERENCE_CLIENTS = {}
+# Makes the client for (model, token); replaced by the benchmark's cassette
+# recorder and player (nl2sql_benchmark.py)
+INFERENCE_CLIENT_FACTORY = hub_inference_client
+
+def get_inference_client(model, token):
+    """Get the InferenceClient for a model, creating it on first use"""
+    key = (model, token)
+    if key not in INFERENCE_CLIENTS:
+        INFERENCE_CLIENTS[key] = TimedInferenceClient(INFERENCE_CLIENT_FACTORY(model, token), model)
+    return INFERENCE_CLIENTS[key]
+
+# Schemas every deployment starts with
+BUILTIN_SCHEMAS = {
+    name: Schema(name=name, definition=definition) for name, definition in BUILTIN_SCHEMA_DEFINITIONS.items()
 }
 
-QUERY_HISTORY = []
+# Schemas and query history live in a store shared by all workers
+# (STATE_BACKEND=sqlite, the default, or memory for a single process)
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite").lower()
+STATE_STORE = open_store(STATE_BACKEND, os.environ.get("STATE_DB_PATH"))
+SCHEMAS = SchemaRegistry(STATE_STORE, Schema)
+SCHEMAS.seed(BUILTIN_SCHEMAS)
+
+# Query history is kept in the same file; HISTORY_RETENTION entries are kept
+HISTORY_RETENTION = int(os.environ.get("HISTORY_RETENTION", "10000"))
+HISTORY_PAGE_LIMIT = 500
+QUERY_HISTORY = HistoryStore(
+    STATE_STORE.path if STATE_BACKEND == "sqlite" else ":memory:",
+    QueryHistory,
+    retention=HISTORY_RETENTION
+)
+
+# Results and charts referenced from history, deduplicated by content hash
+# and evicted least recently used first beyond BLOB_STORE_MAX_MB. History
+# entries lose their references to evicted blobs rather than pointing at 404s
+BLOB_STORE_MAX_MB = int(os.environ.get("BLOB_STORE_MAX_MB", "256"))
+BLOB_STORE = BlobStore(
+    STATE_STORE.path if STATE_BACKEND == "sqlite" else ":memory:",
+    max_bytes=BLOB_STORE_MAX_MB * 1024 * 1024,
+    on_evict=QUERY_HISTORY.forget_blobs
+)
+
+# Charts are returned as Vega-Lite specs for the browser to render
+# (CHART_FORMAT=spec) or as image URLs (png/svg). Images are rendered on request
+# in CHART_RENDER_WORKERS processes, and give up after CHART_RENDER_TIMEOUT seconds
+CHART_FORMAT = os.environ.get("CHART_FORMAT", "spec").lower()
+CHART_RENDERER = ChartRenderer(
+    BLOB_STORE,
+    workers=int(os.environ.get("CHART_RENDER_WORKERS", "2")),
+    timeout=float(os.environ.get("CHART_RENDER_TIMEOUT", "10"))
+)
 
-# In-memory database connections
+# In-memory database connections, and a lock per schema so background work
+# (e.g. index creation) never runs concurrently with a query. Each worker
+# builds its own, for the schema version recorded in DB_VERSIONS.
 DB_CONNECTIONS = {}
+DB_LOCKS = {}
+DB_VERSIONS = {}
+# Held while a schema database is built or swapped, so warm-up and a request
+# never build one twice. Databases for changed schemas are built one at a time
+# in the background, and PENDING_REBUILDS holds the future for each schema.
+SCHEMA_BUILD_LOCK = threading.RLock()
+SCHEMA_REBUILDS = ThreadPoolExecutor(max_workers=1, thread_name_prefix="schema-rebuild")
+PENDING_REBUILDS = {}
+
+# Parsed tables, columns and keys of each schema, as (version, Catalog)
+SCHEMA_CATALOGS = {}
+
+# Synthetic data scale for schema databases (e.g. "1k", "1M"). When unset the
+# built-in schemas get their small hand-written sample rows instead.
+SYNTHETIC_ROWS = os.environ.get("SYNTHETIC_ROWS")
+SYNTHETIC_SEED = int(os.environ.get("SYNTHETIC_SEED", "42"))
+# Generated dates end here (YYYY-MM-DD), by default the day the server started,
+# so questions about "last month" find rows; pin it to get the same data every day
+SYNTHETIC_ANCHOR_DATE = datetime.date.fromisoformat(
+    os.environ.get("SYNTHETIC_ANCHOR_DATE") or datetime.date.today().isoformat())
+
+# Index advisor: inspects the plan of every executed query and recommends
+# indexes for large tables; AUTO_CREATE_INDEXES builds them in the background.
+# Timing a recommendation's sample queries holds the schema's lock for at most
+# INDEX_ADVISOR_SAMPLE_TIMEOUT seconds per query.
+INDEX_ADVISOR_ENABLED = os.environ.get("INDEX_ADVISOR_ENABLED", "true").lower() == "true"
+INDEX_ADVISOR = IndexAdvisor(
+    min_table_rows=int(os.environ.get("INDEX_ADVISOR_MIN_ROWS", "10000")),
+    auto_create=os.environ.get("AUTO_CREATE_INDEXES", "false").lower() == "true",
+    sample_timeout=float(os.environ.get("INDEX_ADVISOR_SAMPLE_TIMEOUT", "0.5")),
+)
 
+# Pre-execution cost guard: every statement is planned first, and ones estimated
+# to visit more than QUERY_COST_BUDGET rows are rejected (or LIMIT-ed when a
+# LIMIT bounds the work). Unaggregated results are capped at QUERY_MAX_ROWS.
+QUERY_GUARD_ENABLED = os.environ.get("QUERY_GUARD_ENABLED", "true").lower() == "true"
+QUERY_GUARD = QueryGuard(
+    cost_budget=int(os.environ.get("QUERY_COST_BUDGET", "50000000")),
+    max_rows=int(os.environ.get("QUERY_MAX_ROWS", "10000")),
+    action=os.environ.get("QUERY_GUARD_ACTION", "limit"),
+)
+
+# Execution engine per schema: "sqlite" (default) or "duckdb" for large,
+# aggregation-heavy data, e.g. SCHEMA_ENGINES="hr=duckdb". DuckDB loads each
+# table from DUCKDB_PARQUET_DIR/<schema>/<table>.parquet when present, and
+# from the schema's SQLite database otherwise.
+DEFAULT_ENGINE = os.environ.get("DEFAULT_ENGINE", "sqlite").lower()
+SCHEMA_ENGINES = parse_engine_config(os.environ.get("SCHEMA_ENGINES", ""))
+DUCKDB_PARQUET_DIR = os.environ.get("DUCKDB_PARQUET_DIR")
+DUCKDB_ENGINES = {}
+
+# Execution workers: with EXECUTION_WORKERS > 0, each schema's database lives
+# in one of that many worker processes, and queries on it run there (see
+# workers.py). Schemas move between workers every WORKER_REBALANCE_SECONDS
+# when load is uneven. Workers read schemas from the state store, so this
+# needs STATE_BACKEND=sqlite; 0 runs queries in the API process.
+EXECUTION_WORKER_ID = os.environ.get("EXECUTION_WORKER_ID")  # Set inside workers
+EXECUTION_WORKERS = 0 if EXECUTION_WORKER_ID else int(os.environ.get("EXECUTION_WORKERS", "0"))
+if EXECUTION_WORKERS and STATE_BACKEND != "sqlite":
+    logger.warning("EXECUTION_WORKERS needs STATE_BACKEND=sqlite. Running queries in-process")
+    EXECUTION_WORKERS = 0
+WORKER_POOL = ShardedPool(
+    EXECUTION_WORKERS,
+    "main:handle_worker_call",
+    warm_op="warm",
+    drop_op="drop",
+    threads=int(os.environ.get("WORKER_THREADS", "4")),
+    rebalance_seconds=float(os.environ.get("WORKER_REBALANCE_SECONDS", "30"))
+) if EXECUTION_WORKERS else None
+
+# How many times the model is asked to fix SQL that fails to compile
+MAX_REPAIR_ATTEMPTS = int(os.environ.get("MAX_REPAIR_ATTEMPTS", "2"))
+
+@tracing.span("sql.preprocess")
 def preprocess_sql_for_sqlite(sql):
     """Preprocess SQL queries to make them compatible with SQLite"""
-    # Print original SQL for debugging
-    print(f"Preprocessing SQL: {sql}")
+    start = time.perf_counter()
+    logger.debug("Preprocessing SQL: %s", sql)
     
     # Replace CURRENT_DATE with SQLite's date('now')
     sql = re.sub(r'CURRENT_DATE', "date('now')", sql, flags=re.IGNORECASE)
@@ -276,35 +499,100 @@ def preprocess_sql_for_sqlite(sql):
             flags=re.IGNORECASE
         )
     
-    # Print processed SQL for debugging
-    print(f"After preprocessing: {sql}")
+    logger.debug("After preprocessing: %s", sql)
     
+    PREPROCESS_SECONDS.observe(time.perf_counter() - start)
     return sql
 
+# Compile-only validator for generated SQL, using the same preprocessing as execution
+SQL_VALIDATOR = SQLValidator(preprocess=preprocess_sql_for_sqlite)
+
+# Semantic cache (see semantic_cache.py): a question close enough to one
+# answered before on the same schema version (cosine similarity of at least
+# SEMANTIC_CACHE_THRESHOLD) reuses its SQL, once that SQL validates again.
+# SEMANTIC_CACHE_SIZE questions are kept per schema. SEMANTIC_CACHE_AUDIT_RATE
+# of hits are regenerated in the background and their results compared, to
+# estimate how often the cache answers wrongly.
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_AUDIT_RATE = float(os.environ.get("SEMANTIC_CACHE_AUDIT_RATE", "0.02"))
+SEMANTIC_CACHE = SemanticCache(
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    max_entries=int(os.environ.get("SEMANTIC_CACHE_SIZE", "1000"))
+)
+SEMANTIC_CACHE_AUDITS = set()  # Running audit tasks, so they aren't garbage collected
+
+def get_schema_entry(schema_name):
+    """(schema, version), raising 404 when the schema doesn't exist or was just deleted"""
+    entry = SCHEMAS.get_with_version(schema_name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    return entry
+
 def initialize_schema_database(schema_name):
-    """Create an in-memory SQLite database with the given schema"""
+    """Get the in-memory SQLite database for a schema, building it on first use
+
+    When the schema has changed since this worker built its database, the old
+    database keeps serving while the new version is built in the background
+    and swapped in (see rebuild_schema_database).
+    """
+    schema, version = get_schema_entry(schema_name)
+    if DB_VERSIONS.get(schema_name) == version:
+        return DB_CONNECTIONS[schema_name]
     if schema_name in DB_CONNECTIONS:
+        schedule_schema_rebuild(schema_name)
         return DB_CONNECTIONS[schema_name]
-    
-    schema_def = SCHEMAS[schema_name].definition
-    conn = sqlite3.connect(":memory:")
+    with SCHEMA_BUILD_LOCK:
+        if schema_name not in DB_CONNECTIONS:
+            install_schema_database(schema_name, build_schema_database(schema_name, schema), version)
+        return DB_CONNECTIONS[schema_name]
+
+def open_schema_connection():
+    """A new in-memory SQLite connection with the settings queries rely on"""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
     
     # Enable foreign keys
     conn.execute("PRAGMA foreign_keys = ON")
     
     # Add custom functions to SQLite
     conn.create_function("CURRENT_DATE", 0, lambda: datetime.datetime.now().strftime("%Y-%m-%d"))
-    
+    return conn
+
+# Session sandboxes: private, writable clones of a schema database (POST
+# /sandboxes), dropped after SANDBOX_IDLE_SECONDS unused and evicted least
+# recently used first beyond SANDBOX_MAX_MB in total (per process). With
+# execution workers, a sandbox lives in the worker that owns its schema, and
+# its id starts with that worker's index ("w1-...") so calls can find it
+SANDBOXES = SandboxPool(
+    open_schema_connection,
+    max_bytes=int(os.environ.get("SANDBOX_MAX_MB", "512")) * 1024 * 1024,
+    idle_seconds=int(os.environ.get("SANDBOX_IDLE_SECONDS", "900")),
+    id_prefix=f"w{EXECUTION_WORKER_ID}-" if EXECUTION_WORKER_ID else ""
+)
+SANDBOX_WORKER_PATTERN = re.compile(r"^w(\d+)-")
+
+def build_schema_database(schema_name, schema):
+    """Create an in-memory SQLite database with the given schema"""
+    schema_def = schema.definition
+    conn = open_schema_connection()
     cursor = conn.cursor()
     
+    # Built-in schemas get their sample rows as long as their original DDL is
+    # intact; anything appended to it (PATCH) runs after the rows are inserted
+    builtin = BUILTIN_SCHEMAS.get(schema_name)
+    base_def = builtin.definition.strip() if builtin else None
+    sample_data = not SYNTHETIC_ROWS and base_def is not None and schema_def.strip().startswith(base_def)
+    
     # Execute schema definition
-    statements = re.split(r';(?!\))', schema_def)  # Split on semicolons that aren't inside parentheses
-    for statement in statements:
-        if statement.strip():
-            cursor.execute(statement)
+    conn.executescript(base_def if sample_data else schema_def)
             
-    # Insert some sample data
-    if schema_name == "default":
+    # Insert synthetic data at the configured scale, or some sample data
+    if SYNTHETIC_ROWS:
+        # Imported here so numpy is only loaded when synthetic data is used
+        from datagen import populate_schema, parse_scale
+        counts = populate_schema(conn, schema_def, rows=parse_scale(SYNTHETIC_ROWS), seed=SYNTHETIC_SEED,
+                                 anchor_date=SYNTHETIC_ANCHOR_DATE, catalog=get_catalog(schema_name))
+        logger.info("Generated %d synthetic rows for schema '%s'", sum(counts.values()), schema_name)
+    elif sample_data and schema_name == "default":
         # Sample data for default schema - add more variety
         # Customers
         customers = [
@@ -377,7 +665,7 @@ def initialize_schema_database(schema_name):
         cursor.executemany("INSERT INTO orders VALUES (?, ?, ?, ?)", orders)
         cursor.executemany("INSERT INTO order_items VALUES (?, ?, ?, ?)", order_items)
     
-    elif schema_name == "hr":
+    elif sample_data and schema_name == "hr":
         # Enhanced sample data for HR schema
         departments = [
             (1, 'IT', 101, 1),
@@ -421,7 +709,7 @@ def initialize_schema_database(schema_name):
         cursor.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", employees)
         cursor.executemany("INSERT INTO job_history VALUES (?, ?, ?, ?, ?)", job_history)
     
-    elif schema_name == "library":
+    elif sample_data and schema_name == "library":
         # Enhanced sample data for library schema
         authors = [
             (1, 'J.K. Rowling', 1965, 'British'),
@@ -499,114 +787,526 @@ def initialize_schema_database(schema_name):
         cursor.executemany("INSERT INTO borrowers VALUES (?, ?, ?, ?)", borrowers)
         cursor.executemany("INSERT INTO loans VALUES (?, ?, ?, ?, ?)", loans)
     
+    if sample_data:
+        conn.executescript(schema_def.strip()[len(base_def):])
+    
+    # Collect statistics for the query planner and the cost guard
+    conn.execute("ANALYZE")
     conn.commit()
-    DB_CONNECTIONS[schema_name] = conn
     return conn
 
-def execute_query(sql, schema_name):
-    """Execute SQL query against the schema database"""
-    if schema_name not in SCHEMAS:
-        raise HTTPException(status_code=404, detail="Schema not found")
+def migrate_schema_database(schema_name, migrations):
+    """Copy a schema's current database and apply the DDL appended since its version"""
+    conn = open_schema_connection()
+    with DB_LOCKS[schema_name]:
+        DB_CONNECTIONS[schema_name].backup(conn)
+    for ddl in migrations:
+        conn.executescript(ddl)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+def install_schema_database(schema_name, conn, version, duckdb_engine=None):
+    """Swap in a schema's database for a new version"""
+    with SCHEMA_BUILD_LOCK:
+        replaced = schema_name in DB_CONNECTIONS
+        DB_LOCKS.setdefault(schema_name, threading.Lock())
+        DB_CONNECTIONS[schema_name] = conn
+        DB_VERSIONS[schema_name] = version
+        if duckdb_engine:
+            DUCKDB_ENGINES[schema_name] = duckdb_engine
+        else:
+            DUCKDB_ENGINES.pop(schema_name, None)
+    if replaced:
+        invalidate_schema_caches(schema_name)
+
+def invalidate_schema_caches(schema_name):
+    """Drop what was derived from a schema's previous version
+
+    Catalogs and parsed schemas are keyed by version and replace themselves;
+    charts and blobs are keyed by content, so they stay valid.
+    """
+    INDEX_ADVISOR.forget(schema_name)
+    QUERY_GUARD.forget(schema_name)
+    SQL_VALIDATOR.forget(schema_name)
+    SANDBOXES.forget(schema_name)
+    SEMANTIC_CACHE.forget(schema_name)
+
+def forget_schema(schema_name):
+    """Drop a deleted schema's database and everything derived from it"""
+    with SCHEMA_BUILD_LOCK:
+        DB_CONNECTIONS.pop(schema_name, None)
+        DB_VERSIONS.pop(schema_name, None)
+        DUCKDB_ENGINES.pop(schema_name, None)
+        SCHEMA_CATALOGS.pop(schema_name, None)
+    invalidate_schema_caches(schema_name)
+    if WORKER_POOL:
+        WORKER_POOL.forget(schema_name)
+
+def schedule_schema_rebuild(schema_name):
+    """Start building the latest version of a schema in the background, unless already underway"""
+    with SCHEMA_BUILD_LOCK:
+        future = PENDING_REBUILDS.get(schema_name)
+        if future is None or future.done():
+            future = SCHEMA_REBUILDS.submit(rebuild_schema_database, schema_name)
+            PENDING_REBUILDS[schema_name] = future
+        return future
+
+def rebuild_schema_database(schema_name):
+    """Build the latest version of a schema off the request path and swap it in
+
+    A database holding an earlier version is copied and migrated when every
+    change since was appended DDL, and rebuilt from scratch otherwise. Caches
+    are primed for the new version right after the swap.
+    """
+    entry = SCHEMAS.get_with_version(schema_name)
+    if entry is None:
+        forget_schema(schema_name)
+        return None
+    schema, version = entry
+    old_version = DB_VERSIONS.get(schema_name)
+    if old_version == version:
+        return version
     
+    start = time.perf_counter()
+    migrations = SCHEMAS.migrations(schema_name, old_version, version) if old_version else None
+    if migrations:
+        conn = migrate_schema_database(schema_name, migrations)
+    else:
+        conn = build_schema_database(schema_name, schema)
+    duckdb_engine = None
+    if SCHEMA_ENGINES.get(schema_name, DEFAULT_ENGINE) == "duckdb":
+        duckdb_engine = DuckDBEngine(
+            schema_name,
+            schema.definition,
+            source_conn=conn,
+            source_lock=DB_LOCKS.setdefault(schema_name, threading.Lock()),
+            parquet_dir=DUCKDB_PARQUET_DIR
+        )
+    install_schema_database(schema_name, conn, version, duckdb_engine)
+    warm_schema(schema_name)
+    logger.info("Schema '%s' %s to version %d in %.0fms", schema_name, "migrated" if migrations else "built",
+                version, (time.perf_counter() - start) * 1000)
+    return version
+
+def get_catalog(schema_name):
+    """Get a schema's parsed catalog, built once per schema version"""
+    schema, version = get_schema_entry(schema_name)
+    cached = SCHEMA_CATALOGS.get(schema_name)
+    if cached is None or cached[0] != version:
+        CATALOG_CACHE.inc(result="miss")
+        cached = (version, Catalog.from_ddl(schema.definition))
+        SCHEMA_CATALOGS[schema_name] = cached
+    else:
+        CATALOG_CACHE.inc(result="hit")
+    return cached[1]
+
+def get_engine(schema_name):
+    """Get the execution engine configured for a schema"""
+    conn = initialize_schema_database(schema_name)
+    engine_name = SCHEMA_ENGINES.get(schema_name, DEFAULT_ENGINE)
+    if engine_name == "duckdb":
+        if schema_name not in DUCKDB_ENGINES:
+            with SCHEMA_BUILD_LOCK:
+                if schema_name not in DUCKDB_ENGINES:
+                    DUCKDB_ENGINES[schema_name] = DuckDBEngine(
+                        schema_name,
+                        SCHEMAS[schema_name].definition,
+                        source_conn=conn,
+                        source_lock=DB_LOCKS[schema_name],
+                        parquet_dir=DUCKDB_PARQUET_DIR
+                    )
+        return DUCKDB_ENGINES[schema_name]
+    if engine_name != "sqlite":
+        logger.warning("Unknown engine '%s' for schema '%s'. Using sqlite", engine_name, schema_name)
+    return SQLiteEngine(conn, DB_LOCKS[schema_name])
+
+# Startup warm-up (see warmup.py): WARMUP_SCHEMAS are built and primed, "*" for
+# all, and WARMUP_MODELS (SQL_MODELS keys or model ids, "*" for all; the
+# selected model by default when a token is set) get a one-token request.
+# GET /ready answers 503 until it's done or WARMUP_TIMEOUT seconds have passed.
+WARMUP_SCHEMAS = os.environ.get("WARMUP_SCHEMAS", "*")
+WARMUP_MODELS = os.environ.get("WARMUP_MODELS", SELECTED_MODEL if HF_API_TOKEN else "")
+WARMUP = Warmup(timeout=float(os.environ.get("WARMUP_TIMEOUT", "60")))
+
+def warm_schema(schema_name):
+    """Build a schema's database and engine, and prime the caches its queries use"""
+    catalog = get_catalog(schema_name)
     conn = initialize_schema_database(schema_name)
+    engine = get_engine(schema_name)
+    SQL_VALIDATOR.prime(schema_name, SCHEMAS[schema_name].definition)
+    with DB_LOCKS[schema_name]:
+        if QUERY_GUARD_ENABLED:
+            QUERY_GUARD.prime(schema_name, conn)
+        if INDEX_ADVISOR_ENABLED:
+            INDEX_ADVISOR.prime(schema_name, conn)
+    return {"version": DB_VERSIONS[schema_name], "engine": engine.name, "tables": len(catalog.tables)}
+
+def warm_model(model):
+    """Set up the client and connection for a model with a one-token completion"""
+    call_model(model, "SELECT 1;", 1)
+
+def parse_warmup_list(value, all_values):
+    if value.strip() == "*":
+        return list(dict.fromkeys(all_values))
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+for warmup_schema in parse_warmup_list(WARMUP_SCHEMAS, SCHEMAS.keys()):
+    if warmup_schema in SCHEMAS and WORKER_POOL:
+        # Each schema's owner warms it, so workers warm up concurrently
+        WARMUP.add("schema", warmup_schema, lambda name=warmup_schema: call_worker("warm", name))
+    elif warmup_schema in SCHEMAS:
+        WARMUP.add("schema", warmup_schema, lambda name=warmup_schema: warm_schema(name), group="schemas")
+    else:
+        logger.warning("Unknown schema '%s' in WARMUP_SCHEMAS", warmup_schema)
+for warmup_model in parse_warmup_list(WARMUP_MODELS, SQL_MODELS.values()):
+    model_id = SQL_MODELS.get(warmup_model, warmup_model)
+    WARMUP.add("model", model_id, lambda model=model_id: warm_model(model))
+
+def check_chart_format(chart_format):
+    chart_format = (chart_format or CHART_FORMAT).lower()
+    if chart_format != "spec" and chart_format not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported chart format: {chart_format}")
+    return chart_format
+
+def chart_for_result(df, schema_name, chart_format):
+    """Return (visualization URL, Vega-Lite spec) for a result, either may be None"""
+    # Pick a chart for the result, reducing large results to what it
+    # plots. Images are only registered when asked for, and are
+    # rendered when their URL is fetched.
+    visualization = None
+    chart = None
+    try:
+        with tracing.span("chart.prepare", format=chart_format):
+            prepared = prepare_chart(df, get_catalog(schema_name))
+            if prepared and chart_format == "spec":
+                chart = vega_lite_spec(*prepared)
+            elif prepared:
+                spec, chart_data = prepared
+                chart_key = CHART_RENDERER.register(chart_data, spec)
+                # None when the chart's data is too large for the blob store
+                if chart_key:
+                    visualization = f"/charts/{chart_key}.{chart_format}"
+    except Exception as viz_error:
+        logger.warning("Visualization generation failed: %s", viz_error)
+        # Continue without visualization if it fails
+    return visualization, chart
+
+def run_query(schema_name, sql):
+    """Run a SELECT on the schema's engine; returns the DataFrame, cost estimate and engine
+
+    This is the part of execute_query that needs the schema's database, and
+    runs in the schema's execution worker when there are any.
+    """
+    conn = initialize_schema_database(schema_name)
+    try:
+        engine = get_engine(schema_name)
+    except RuntimeError as engine_error:
+        raise HTTPException(status_code=500, detail=str(engine_error))
     
     try:
         # Handle potential SQL injection and syntax errors
         sql = sql.strip()
         
-        # Print original SQL for debugging
-        print(f"Original SQL: {sql}")
+        logger.debug("Original SQL: %s", sql)
         
         # Ensure the SQL is a SELECT query only (security)
         if not sql.upper().startswith('SELECT'):
             raise HTTPException(status_code=400, detail="Only SELECT queries are allowed for execution")
         
-        # Preprocess SQL for SQLite compatibility
-        processed_sql = preprocess_sql_for_sqlite(sql)
+        # Preprocess SQL for SQLite compatibility, then for the engine's dialect
+        processed_sql = engine.translate(preprocess_sql_for_sqlite(sql))
         
-        # Print processed SQL for debugging
-        print(f"Processed SQL for SQLite: {processed_sql}")
+        logger.debug("Processed SQL for SQLite: %s", processed_sql)
         
         # Make sure SQL ends with semicolon
         if not processed_sql.endswith(';'):
             processed_sql += ';'
+        
+        # Plan the statement and check its estimated cost before running it
+        cost_estimate = None
+        if QUERY_GUARD_ENABLED and engine.name == "sqlite":
+            try:
+                with tracing.span("sql.cost_guard"), DB_LOCKS[schema_name]:
+                    processed_sql, cost_estimate = QUERY_GUARD.check(schema_name, conn, processed_sql)
+            except QueryRejected as rejected:
+                raise HTTPException(status_code=400, detail=str(rejected))
+            except sqlite3.Error as plan_error:
+                # Let execution report errors such as typos in the usual way
+                logger.debug("Could not plan query: %s", plan_error)
             
         try:
             # Execute query
-            df = pd.read_sql_query(processed_sql, conn, params={})
-            print(f"Query execution successful. Result shape: {df.shape}")
-            
-            # Convert to JSON
-            results = df.to_json(orient="records")
+            query_start = time.perf_counter()
+            with tracing.span("sql.execute", engine=engine.name) as stage:
+                df = engine.execute(processed_sql)
+                stage.set(rows=len(df))
+            query_time = time.perf_counter() - query_start
+            logger.debug("Query execution successful on %s. Result shape: %s", engine.name, df.shape)
             
-            # Generate visualization if applicable
-            visualization = None
-            if not df.empty and len(df) < 100:  # Only visualize reasonable sized results
-                if len(df.columns) >= 2:
-                    try:
-                        # Create a simple bar or line chart based on data types
-                        plt.figure(figsize=(10, 6))
-                        
-                        # Determine column types
-                        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-                        categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
-                        date_cols = df.select_dtypes(include=['datetime']).columns.tolist()
-                        
-                        if len(numeric_cols) >= 1 and (len(categorical_cols) >= 1 or len(date_cols) >= 1):
-                            # Use the first categorical/date column for x and first numeric for y
-                            x_col = categorical_cols[0] if categorical_cols else date_cols[0]
-                            y_col = numeric_cols[0]
-                            
-                            if len(df[x_col].unique()) <= 20:  # Avoid overcrowded plots
-                                plt.bar(df[x_col].astype(str), df[y_col])
-                                plt.xlabel(x_col)
-                                plt.ylabel(y_col)
-                                plt.xticks(rotation=45)
-                                plt.tight_layout()
-                                
-                                # Save to base64
-                                buffer = BytesIO()
-                                plt.savefig(buffer, format='png')
-                                buffer.seek(0)
-                                img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                                visualization = f"data:image/png;base64,{img_str}"
-                                plt.close()
-                        elif len(numeric_cols) >= 2:
-                            # Scatter plot for two numeric columns
-                            plt.scatter(df[numeric_cols[0]], df[numeric_cols[1]])
-                            plt.xlabel(numeric_cols[0])
-                            plt.ylabel(numeric_cols[1])
-                            plt.tight_layout()
-                            
-                            # Save to base64
-                            buffer = BytesIO()
-                            plt.savefig(buffer, format='png')
-                            buffer.seek(0)
-                            img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                            visualization = f"data:image/png;base64,{img_str}"
-                            plt.close()
-                    except Exception as viz_error:
-                        print(f"Visualization generation failed: {str(viz_error)}")
-                        # Continue without visualization if it fails
+            # Let the index advisor look at the plan of what we just ran
+            if INDEX_ADVISOR_ENABLED and engine.name == "sqlite":
+                try:
+                    with tracing.span("index_advisor.observe"), DB_LOCKS[schema_name]:
+                        INDEX_ADVISOR.observe(schema_name, conn, processed_sql, query_time, lock=DB_LOCKS[schema_name],
+                                              catalog=get_catalog(schema_name))
+                except Exception as advisor_error:
+                    logger.warning("Index advisor failed: %s", advisor_error)
             
-            return {
-                "results": results,
-                "visualization": visualization
-            }
+            return {"df": df, "cost_estimate": cost_estimate, "engine": engine.name, "query_time": query_time}
         except Exception as db_error:
-            # Print the full error with traceback
-            print(f"Database error: {str(db_error)}")
-            print(traceback.format_exc())
+            # Tracebacks only when debugging; bad SQL is an expected failure
+            logger.info("Database error: %s", db_error, extra={"schema_name": schema_name},
+                        exc_info=logger.isEnabledFor(logging.DEBUG))
             raise HTTPException(status_code=400, detail=f"SQL execution error: {str(db_error)}")
     except Exception as e:
         error_msg = str(e)
-        print(f"Query execution error: {error_msg}")
-        print(traceback.format_exc())
         if isinstance(e, HTTPException):
+            logger.debug("Query execution error: %s", error_msg)
             raise e
         else:
+            logger.error("Query execution error: %s", error_msg, exc_info=True)
             raise HTTPException(status_code=500, detail=f"Query execution error: {error_msg}")
 
+async def execute_query(sql, schema_name, chart_format=None):
+    """Execute SQL query against the schema database"""
+    chart_format = check_chart_format(chart_format)
+    if schema_name not in SCHEMAS:
+        if schema_name in DB_CONNECTIONS or (WORKER_POOL and schema_name in WORKER_POOL.assignments):
+            # Deleted by another worker
+            forget_schema(schema_name)
+        raise HTTPException(status_code=404, detail="Schema not found")
+    
+    try:
+        with tracing.span("execute_query", schema=schema_name, worker=bool(WORKER_POOL)):
+            if WORKER_POOL:
+                result = await call_worker_async("execute", schema_name, sql)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, tracing.in_context(run_query), schema_name, sql)
+    except HTTPException as query_error:
+        QUERY_ERRORS.inc(status=query_error.status_code)
+        raise
+    df = result.pop("df")
+    
+    # Convert to JSON
+    try:
+        with tracing.span("results.serialize"):
+            results = df.to_json(orient="records")
+    except ValueError as json_error:
+        QUERY_ERRORS.inc(status=400)
+        raise HTTPException(status_code=400, detail=f"SQL execution error: {str(json_error)}")
+    QUERY_SECONDS.observe(result["query_time"], engine=result["engine"])
+    RESULT_ROWS.observe(len(df), engine=result["engine"])
+    RESULT_BYTES.observe(len(results), engine=result["engine"])
+    
+    visualization, chart = chart_for_result(df, schema_name, chart_format)
+    
+    return {
+        "results": results,
+        "visualization": visualization,
+        "chart_spec": chart,
+        **result
+    }
+
+def explain_query(schema_name, sql):
+    """Plan a query and apply the cost guard without executing it"""
+    conn = initialize_schema_database(schema_name)
+    sql = preprocess_sql_for_sqlite(sql.strip())
+    try:
+        with DB_LOCKS[schema_name]:
+            guarded_sql, estimate = QUERY_GUARD.check(schema_name, conn, sql)
+        return {"sql": guarded_sql, "cost_estimate": estimate, "allowed": True}
+    except QueryRejected as rejected:
+        return {"sql": sql, "cost_estimate": rejected.estimate, "allowed": False, "reason": str(rejected)}
+    except sqlite3.Error as plan_error:
+        raise HTTPException(status_code=400, detail=f"Could not plan query: {str(plan_error)}")
+
+def apply_indexes(schema_name):
+    return INDEX_ADVISOR.apply(schema_name, initialize_schema_database(schema_name), DB_LOCKS[schema_name])
+
+# Code regions memory reports can be limited to (?scope=)
+MEMORY_PROFILER.scopes = {
+    "execute_query": profiling.code_ranges(execute_query, run_query),
+    "history": profiling.code_ranges(HistoryStore),
+}
+
+def profile_cpu(_, seconds, interval_ms, idle):
+    try:
+        stacks, samples = CPU_PROFILER.sample(seconds, interval_ms, idle)
+    except profiling.ProfilerBusy as busy:
+        raise HTTPException(status_code=409, detail=str(busy))
+    return {"stacks": stacks, "samples": samples, "pid": os.getpid()}
+
+def profile_memory(_, action, *args):
+    try:
+        return getattr(MEMORY_PROFILER, action)(*args)
+    except KeyError as missing:
+        raise HTTPException(status_code=404, detail=missing.args[0])
+
+def run_in_sandbox(_, sandbox_id, sql):
+    """Run one statement of any kind against a session's sandbox
+
+    Returns the response with the result rows as a DataFrame under "df".
+    This is the part of POST /sandboxes/{id}/execute that needs the sandbox,
+    and runs in the execution worker holding it when there are any.
+    """
+    sandbox = get_sandbox(sandbox_id)
+    statement = preprocess_sql_for_sqlite(sql.strip())
+    is_select = statement.upper().startswith(("SELECT", "WITH"))
+    guard_key = f"sandbox:{sandbox.id}"
+    cost_estimate = None
+    with sandbox.lock:
+        try:
+            if QUERY_GUARD_ENABLED and is_select:
+                statement, cost_estimate = QUERY_GUARD.check(guard_key, sandbox.conn, statement)
+            query_start = time.perf_counter()
+            cursor = sandbox.conn.execute(statement)
+            columns = [column[0] for column in cursor.description] if cursor.description else None
+            rows = cursor.fetchmany(QUERY_GUARD.max_rows + 1) if columns else []
+            sandbox.conn.commit()
+            query_time = time.perf_counter() - query_start
+        except QueryRejected as rejected:
+            raise HTTPException(status_code=400, detail=str(rejected))
+        except (sqlite3.Error, sqlite3.Warning) as db_error:
+            sandbox.conn.rollback()
+            raise HTTPException(status_code=400, detail=f"SQL execution error: {str(db_error)}")
+        finally:
+            if not is_select:
+                # Table sizes may have changed
+                QUERY_GUARD.forget(guard_key)
+    SANDBOXES.resized(sandbox)
+    
+    response = {
+        "sandbox_id": sandbox.id,
+        "schema_name": sandbox.schema_name,
+        "execution_time": query_time,
+        "rows_affected": cursor.rowcount if not columns else None,
+        "results": None,
+        "truncated": False,
+        "visualization": None,
+        "chart_spec": None,
+        "cost_estimate": cost_estimate,
+        "size_bytes": sandbox.size,
+        "df": None
+    }
+    if columns:
+        import pandas as pd
+        response["truncated"] = len(rows) > QUERY_GUARD.max_rows
+        # Self-joins repeat column names, which records can't hold
+        seen = {}
+        for i, column in enumerate(columns):
+            seen[column] = seen.get(column, 0) + 1
+            if seen[column] > 1:
+                columns[i] = f"{column}_{seen[column]}"
+        response["df"] = pd.DataFrame.from_records(rows[:QUERY_GUARD.max_rows], columns=columns)
+    return response
+
+def sandbox_response(result, chart_format):
+    """Turn run_in_sandbox's rows into results JSON and a chart"""
+    df = result.pop("df")
+    if df is not None:
+        result["results"] = df.to_json(orient="records")
+        result["visualization"], result["chart_spec"] = chart_for_result(df, result["schema_name"], chart_format)
+    return result
+
+def get_sandbox(sandbox_id):
+    sandbox = SANDBOXES.get(sandbox_id)
+    if sandbox is None:
+        raise HTTPException(status_code=404, detail="Sandbox not found or expired")
+    return sandbox
+
+def clone_sandbox(schema_name):
+    """Clone a schema's database into a new sandbox, in the process that holds the database"""
+    conn = initialize_schema_database(schema_name)
+    start = time.perf_counter()
+    try:
+        sandbox = SANDBOXES.create(schema_name, DB_VERSIONS[schema_name], conn, DB_LOCKS[schema_name])
+    except SandboxLimit as limit:
+        raise HTTPException(status_code=507, detail=str(limit))
+    return {**sandbox.info(), "clone_ms": (time.perf_counter() - start) * 1000}
+
+def drop_sandbox(_, sandbox_id):
+    if not SANDBOXES.delete(sandbox_id):
+        raise HTTPException(status_code=404, detail="Sandbox not found or expired")
+    QUERY_GUARD.forget(f"sandbox:{sandbox_id}")
+    return {"id": sandbox_id, "deleted": True}
+
+# What execution workers can be asked to do, as op -> fn(schema_name, *args).
+# Ops for every worker (GET /index_advisor/reports) or for one worker by index
+# (sandboxes, profiling) get None as the schema.
+WORKER_OPS = {
+    "warm": warm_schema,
+    "drop": forget_schema,
+    "rebuild": lambda schema_name: schedule_schema_rebuild(schema_name).result(),
+    "execute": run_query,
+    "explain": explain_query,
+    "index_recommendations": INDEX_ADVISOR.get_recommendations,
+    "index_apply": apply_indexes,
+    "index_reports": lambda _: list(INDEX_ADVISOR.reports),
+    "profile": profile_cpu,
+    "memory": profile_memory,
+    "sandbox_create": clone_sandbox,
+    "sandbox_execute": run_in_sandbox,
+    "sandbox_info": lambda _, sandbox_id: get_sandbox(sandbox_id).info(),
+    "sandbox_delete": drop_sandbox,
+    "sandbox_list": lambda _: {"sandboxes": SANDBOXES.list(), "stats": SANDBOXES.stats()},
+}
+
+def handle_worker_call(op, schema_name, *args):
+    """Run an operation inside an execution worker process
+
+    HTTP errors are returned rather than raised, since they don't pickle.
+    """
+    try:
+        return {"result": WORKER_OPS[op](schema_name, *args)}
+    except HTTPException as http_error:
+        return {"status_code": http_error.status_code, "detail": http_error.detail}
+
+def worker_result(reply):
+    if "status_code" in reply:
+        raise HTTPException(status_code=reply["status_code"], detail=reply["detail"])
+    return reply["result"]
+
+def unwrap_worker_reply(future):
+    try:
+        reply = future.result()
+    except WorkerError as worker_error:
+        raise HTTPException(status_code=500, detail=f"Execution worker failed: {str(worker_error)}")
+    return worker_result(reply)
+
+async def await_worker_reply(future):
+    """unwrap_worker_reply for async handlers: waits without blocking the event loop"""
+    try:
+        reply = await asyncio.wrap_future(future)
+    except WorkerError as worker_error:
+        raise HTTPException(status_code=500, detail=f"Execution worker failed: {str(worker_error)}")
+    return worker_result(reply)
+
+def call_worker(op, schema_name, *args):
+    """Run an operation on the execution worker that owns a schema (from a thread)"""
+    return unwrap_worker_reply(WORKER_POOL.call(schema_name, op, *args))
+
+async def call_worker_async(op, schema_name, *args):
+    """Run an operation on the execution worker that owns a schema (from a handler)"""
+    return await await_worker_reply(WORKER_POOL.call(schema_name, op, *args))
+
+async def call_all_workers(op, *args):
+    """Run an operation on every execution worker; returns their results"""
+    return await asyncio.gather(*(await_worker_reply(future) for future in WORKER_POOL.broadcast(op, *args)))
+
+async def run_profiling_op(worker, op, *args):
+    """Run a profiling op in this process, or in execution worker `worker`"""
+    if worker is None:
+        return await asyncio.get_running_loop().run_in_executor(None, WORKER_OPS[op], None, *args)
+    if not WORKER_POOL:
+        raise HTTPException(status_code=400, detail="Execution workers are disabled")
+    try:
+        future = WORKER_POOL.call_index(worker, op, *args)
+    except IndexError as missing:
+        raise HTTPException(status_code=404, detail=str(missing))
+    return await await_worker_reply(future)
+
 @app.get("/")
 async def root():
     return {
@@ -615,6 +1315,67 @@ async def root():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Counters and latency histograms in the Prometheus text format"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/slow")
+async def get_slow_requests(limit: Optional[int] = None):
+    """Requests slower than SLOW_REQUEST_MS, newest first, with their span trees"""
+    return {"threshold_ms": TRACER.slow_ms, "requests": TRACER.slow(limit)}
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_cpu_endpoint(seconds: float = 10, interval_ms: float = profiling.DEFAULT_INTERVAL_MS,
+                               idle: bool = False, worker: Optional[int] = None):
+    """Sample every thread's stack for `seconds`; returns collapsed stacks for a flamegraph"""
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+    profile = await run_profiling_op(worker, "profile", seconds, interval_ms, idle)
+    filename = f"profile-{profile['pid']}-{int(time.time())}.collapsed"
+    return Response(
+        content=profile["stacks"],
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "X-Profile-Samples": str(profile["samples"])}
+    )
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def get_memory_status(worker: Optional[int] = None):
+    """Whether tracemalloc is running, its traced memory and the kept snapshots"""
+    return await run_profiling_op(worker, "memory", "status")
+
+@app.post("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+async def take_memory_snapshot(worker: Optional[int] = None):
+    """Take a tracemalloc snapshot, starting tracemalloc first if needed"""
+    return {"snapshot": await run_profiling_op(worker, "memory", "snapshot")}
+
+@app.get("/admin/memory/snapshots/{snapshot_id}", dependencies=[Depends(require_admin)])
+async def get_memory_snapshot(snapshot_id: int, scope: Optional[str] = None, limit: int = 20,
+                              worker: Optional[int] = None):
+    """Top allocation sites in a snapshot, optionally only inside a scope"""
+    return await run_profiling_op(worker, "memory", "top", snapshot_id, scope, limit)
+
+@app.get("/admin/memory/diff", dependencies=[Depends(require_admin)])
+async def diff_memory_snapshots(base: int, snapshot: int, scope: Optional[str] = None, limit: int = 20,
+                                worker: Optional[int] = None):
+    """Allocation sites that changed the most between two snapshots"""
+    return await run_profiling_op(worker, "memory", "diff", base, snapshot, scope, limit)
+
+@app.delete("/admin/memory", dependencies=[Depends(require_admin)])
+async def stop_memory_tracing(worker: Optional[int] = None):
+    """Stop tracemalloc and drop its snapshots"""
+    await run_profiling_op(worker, "memory", "stop")
+    return {"tracing": False}
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: 503 until startup warm-up is done, with its timings"""
+    report = WARMUP.report()
+    return JSONResponse(content=report, status_code=200 if report["ready"] else 503)
+
 @app.get("/models")
 async def list_models():
     """List all available models and the currently selected one"""
@@ -628,25 +1389,300 @@ async def get_schemas():
     """Get all available database schemas"""
     return list(SCHEMAS.keys())
 
-@app.get("/schemas/{name}", response_model=Schema)
+@app.get("/schemas/{name}", response_model=SchemaInfo)
 async def get_schema(name: str):
-    """Get a specific database schema"""
+    """Get a specific database schema and its version"""
+    entry = SCHEMAS.get_with_version(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    schema, version = entry
+    return SchemaInfo(name=schema.name, definition=schema.definition, version=version)
+
+@app.get("/schemas/{name}/catalog")
+async def get_schema_catalog(name: str):
+    """Tables, columns, types, keys and indexes of a schema"""
     if name not in SCHEMAS:
         raise HTTPException(status_code=404, detail="Schema not found")
-    return SCHEMAS[name]
+    catalog = get_catalog(name)
+    return {"name": name, "version": SCHEMA_CATALOGS[name][0], **catalog.to_dict()}
 
 @app.post("/schemas", response_model=Schema)
 async def create_schema(schema: Schema):
     """Create a new database schema"""
-    if schema.name in SCHEMAS:
+    try:
+        SCHEMAS.create(schema)
+    except VersionConflict:
         raise HTTPException(status_code=400, detail="Schema already exists")
-    SCHEMAS[schema.name] = schema
     return schema
 
-@app.get("/history", response_model=List[QueryHistory])
-async def get_history():
-    """Get query history"""
-    return QUERY_HISTORY
+async def call_sandbox(op, sandbox_id, *args):
+    """Run a sandbox op here, or on the execution worker holding the sandbox"""
+    if not WORKER_POOL:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, tracing.in_context(WORKER_OPS[op]), None, sandbox_id, *args)
+    match = SANDBOX_WORKER_PATTERN.match(sandbox_id)
+    if match is None or int(match.group(1)) >= WORKER_POOL.size:
+        raise HTTPException(status_code=404, detail="Sandbox not found or expired")
+    return await await_worker_reply(WORKER_POOL.call_index(int(match.group(1)), op, sandbox_id, *args))
+
+@app.post("/sandboxes")
+async def create_sandbox(request: SandboxCreateRequest):
+    """Clone a schema's database into a private sandbox for this session
+
+    Statements run in a sandbox (CREATE, INSERT, UPDATE, DELETE, ...) are
+    only visible to whoever holds its id.
+    """
+    schema_name = request.schema_name or "default"
+    if schema_name not in SCHEMAS:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    if WORKER_POOL:
+        return await call_worker_async("sandbox_create", schema_name)
+    return await asyncio.get_running_loop().run_in_executor(None, tracing.in_context(clone_sandbox), schema_name)
+
+@app.get("/sandboxes")
+async def list_sandboxes():
+    """Live sandboxes and their memory use"""
+    if not WORKER_POOL:
+        return {"sandboxes": SANDBOXES.list(), "stats": SANDBOXES.stats()}
+    replies = await call_all_workers("sandbox_list")
+    stats = dict(replies[0]["stats"])
+    for field in ("sandboxes", "images", "used_bytes", "max_bytes"):
+        stats[field] = sum(reply["stats"][field] for reply in replies)
+    return {"sandboxes": [sandbox for reply in replies for sandbox in reply["sandboxes"]], "stats": stats}
+
+@app.get("/sandboxes/{sandbox_id}")
+async def get_sandbox_info(sandbox_id: str):
+    return await call_sandbox("sandbox_info", sandbox_id)
+
+@app.post("/sandboxes/{sandbox_id}/execute")
+async def execute_sandbox_sql(sandbox_id: str, request: SandboxExecuteRequest):
+    """Run a statement in a sandbox"""
+    chart_format = check_chart_format(request.chart_format)
+    result = await call_sandbox("sandbox_execute", sandbox_id, request.sql)
+    return await asyncio.get_running_loop().run_in_executor(
+        None, tracing.in_context(sandbox_response), result, chart_format)
+
+@app.delete("/sandboxes/{sandbox_id}")
+async def delete_sandbox(sandbox_id: str):
+    return await call_sandbox("sandbox_delete", sandbox_id)
+
+def check_schema_definition(definition):
+    """Reject DDL that doesn't run against an empty database"""
+    try:
+        Catalog.from_ddl(definition)
+    except (sqlite3.Error, sqlite3.Warning) as ddl_error:
+        raise HTTPException(status_code=400, detail=f"Invalid schema definition: {str(ddl_error)}")
+
+async def schema_changed(schema, version, wait):
+    """Rebuild a changed schema's database in the background, optionally waiting for the swap"""
+    if WORKER_POOL:
+        # The schema's owner rebuilds it
+        future = WORKER_POOL.call(schema.name, "rebuild")
+        built = await asyncio.wrap_future(future) if wait else None
+        rebuild = "done" if built and built.get("result") == version else "pending"
+        return SchemaInfo(name=schema.name, definition=schema.definition, version=version, rebuild=rebuild)
+    future = schedule_schema_rebuild(schema.name)
+    if wait:
+        await asyncio.wrap_future(future)
+    rebuild = "done" if DB_VERSIONS.get(schema.name) == version else "pending"
+    return SchemaInfo(name=schema.name, definition=schema.definition, version=version, rebuild=rebuild)
+
+@app.put("/schemas/{name}", response_model=SchemaInfo)
+async def replace_schema(name: str, update: SchemaUpdate, wait: bool = False):
+    """Create or replace a schema's definition
+
+    The database is rebuilt in the background; queries use the previous
+    version until it's swapped in (`wait=true` returns after the swap).
+    """
+    check_schema_definition(update.definition)
+    schema = Schema(name=name, definition=update.definition)
+    try:
+        if name in SCHEMAS:
+            version = SCHEMAS.replace(schema, expected_version=update.expected_version)
+        elif update.expected_version:
+            raise HTTPException(status_code=404, detail="Schema not found")
+        else:
+            version = SCHEMAS.create(schema)
+    except VersionConflict as conflict:
+        raise HTTPException(status_code=409, detail=str(conflict))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    return await schema_changed(schema, version, wait)
+
+@app.patch("/schemas/{name}", response_model=SchemaInfo)
+async def patch_schema(name: str, patch: SchemaPatch, wait: bool = False):
+    """Append DDL to a schema (new tables, columns, indexes)
+
+    Workers migrate a copy of their current database with just these
+    statements instead of rebuilding it, keeping its rows.
+    """
+    ddl = patch.ddl.strip()
+    if not ddl:
+        raise HTTPException(status_code=400, detail="No DDL to apply")
+    if not ddl.endswith(";"):
+        ddl += ";"
+    current = SCHEMAS.get(name)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    check_schema_definition(f"{current.definition}\n{ddl}")
+    try:
+        schema, version = SCHEMAS.append(name, ddl, expected_version=patch.expected_version)
+    except VersionConflict as conflict:
+        raise HTTPException(status_code=409, detail=str(conflict))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    return await schema_changed(schema, version, wait)
+
+@app.delete("/schemas/{name}")
+async def delete_schema(name: str, expected_version: Optional[int] = None):
+    """Delete a schema and drop its database and caches"""
+    try:
+        version = SCHEMAS.delete(name, expected_version=expected_version)
+    except VersionConflict as conflict:
+        raise HTTPException(status_code=409, detail=str(conflict))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    forget_schema(name)
+    return {"name": name, "version": version, "deleted": True}
+
+@app.get("/history")
+async def get_history(
+    limit: int = 100,
+    cursor: Optional[int] = None,
+    schema_name: Optional[str] = None,
+    view: str = "full",
+    fields: Optional[str] = None
+):
+    """Get query history, newest first
+
+    `view=summary` leaves out results, charts and reasoning steps (adding
+    has_results / has_visualization flags instead), and `fields` selects
+    specific fields. When there are more entries, the X-Next-Cursor header
+    holds the `cursor` for the next page.
+    """
+    if limit < 1 or limit > HISTORY_PAGE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_PAGE_LIMIT}")
+    if view not in ("full", "summary"):
+        raise HTTPException(status_code=400, detail="view must be 'full' or 'summary'")
+    
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(selected) - set(HISTORY_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        selected = HISTORY_SUMMARY_FIELDS if view == "summary" else HISTORY_FIELDS
+    
+    records, next_cursor = QUERY_HISTORY.page(
+        limit=limit,
+        cursor=cursor,
+        schema_name=schema_name,
+        fields=selected,
+        flags=view == "summary"
+    )
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return JSONResponse(content=records, headers=headers)
+
+@app.get("/history/{query_id}", response_model=QueryHistory)
+async def get_history_entry(query_id: str):
+    """Get a single query history entry"""
+    query = QUERY_HISTORY.get(query_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail="Query not found in history")
+    return query
+
+@app.get("/blobs/{blob_hash}")
+async def get_blob(blob_hash: str, request: Request):
+    """Get a stored result or chart by its content hash"""
+    # The content behind a hash never changes, so clients can cache it forever
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{blob_hash}"'}
+    # Evicted blobs are gone even for clients holding a cached copy
+    if request.headers.get("if-none-match") == headers["ETag"] and BLOB_STORE.exists(blob_hash):
+        return Response(status_code=304, headers=headers)
+    blob = BLOB_STORE.get(blob_hash)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    data, content_type = blob
+    return Response(content=data, media_type=content_type, headers=headers)
+
+@app.get("/charts/{chart_key}.{fmt}")
+async def get_chart(chart_key: str, fmt: str, request: Request):
+    """Render a query result chart as PNG or SVG"""
+    if fmt not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported chart format: {fmt}")
+    # A key always names the same data and spec, but its blob can be evicted,
+    # so clients revalidate rather than trusting the URL forever
+    headers = {"Cache-Control": "public, no-cache", "ETag": f'"{chart_key}.{fmt}"'}
+    if request.headers.get("if-none-match") == headers["ETag"] and BLOB_STORE.exists(chart_key):
+        return Response(status_code=304, headers=headers)
+    try:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, tracing.in_context(CHART_RENDERER.render), chart_key, fmt)
+    except ChartRenderTimeout as timeout_error:
+        raise HTTPException(status_code=504, detail=str(timeout_error))
+    except ChartRenderError as render_error:
+        raise HTTPException(status_code=500, detail=str(render_error))
+    if data is None:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    return Response(content=data, media_type=CHART_FORMATS[fmt], headers=headers)
+
+@app.post("/explain_sql")
+async def explain_sql(request: ExplainSQLRequest):
+    """Plan a query and estimate its cost without executing it"""
+    schema_name = request.schema_name if request.schema_name else "default"
+    if not QUERY_GUARD_ENABLED:
+        raise HTTPException(status_code=400, detail="The query cost guard is disabled. Set QUERY_GUARD_ENABLED=true to use it")
+    if schema_name not in SCHEMAS:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    if WORKER_POOL:
+        return await call_worker_async("explain", schema_name, request.sql)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, tracing.in_context(explain_query), schema_name, request.sql)
+
+@app.get("/index_advisor/recommendations")
+async def get_index_recommendations(schema_name: Optional[str] = None):
+    """List index recommendations collected from executed queries"""
+    if schema_name and schema_name not in SCHEMAS:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    if WORKER_POOL and schema_name:
+        recommendations = await call_worker_async("index_recommendations", schema_name)
+    elif WORKER_POOL:
+        recommendations = sorted(
+            (r for results in await call_all_workers("index_recommendations") for r in results),
+            key=lambda r: r["total_time"], reverse=True
+        )
+    else:
+        recommendations = INDEX_ADVISOR.get_recommendations(schema_name)
+    return {
+        "recommendations": recommendations,
+        "auto_create": INDEX_ADVISOR.auto_create
+    }
+
+@app.post("/index_advisor/apply")
+async def apply_index_recommendations(schema_name: str = Body(..., embed=True)):
+    """Create the recommended indexes for a schema and report before/after timings"""
+    if schema_name not in SCHEMAS:
+        raise HTTPException(status_code=404, detail="Schema not found")
+    if WORKER_POOL:
+        reports = await call_worker_async("index_apply", schema_name)
+    else:
+        reports = await asyncio.get_running_loop().run_in_executor(executor, apply_indexes, schema_name)
+    return {"created": reports}
+
+@app.get("/index_advisor/reports")
+async def get_index_reports():
+    """Before/after timings of every index the advisor has created"""
+    if WORKER_POOL:
+        return sorted((r for reports in await call_all_workers("index_reports") for r in reports),
+                      key=lambda r: r["created_at"])
+    return list(INDEX_ADVISOR.reports)
+
+@app.get("/workers")
+async def get_workers():
+    """Execution workers, the schemas each one owns and their load"""
+    if not WORKER_POOL:
+        return {"enabled": False}
+    return {"enabled": True, **WORKER_POOL.stats()}
 
 async def generate_explanation(sql: str, schema: str):
     """Generate a natural language explanation of the SQL query"""
@@ -664,7 +1700,7 @@ Provide a clear, concise explanation of what this query does, avoiding technical
 """
 
         # Initialize client
-        client = InferenceClient(
+        client = get_inference_client(
             model=MODEL_NAME,
             token=HF_API_TOKEN
         )
@@ -672,7 +1708,7 @@ Provide a clear, concise explanation of what this query does, avoiding technical
         explanation = ""
         # Try with conversational endpoint first
         try:
-            response = client.chat_completion(
+            response = await run_model_call(client.chat_completion,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=256,
                 temperature=0.1,
@@ -684,8 +1720,8 @@ Provide a clear, concise explanation of what this query does, avoiding technical
                 explanation = response.content if hasattr(response, 'content') else str(response)
         except Exception as e:
             # Fallback to text_generation if chat_completion fails
-            print(f"Chat completion failed for explanation, trying text_generation: {str(e)}")
-            explanation = client.text_generation(
+            logger.debug("Chat completion failed for explanation, trying text_generation: %s", e)
+            explanation = await run_model_call(client.text_generation,
                 prompt,
                 max_new_tokens=256,
                 temperature=0.1,
@@ -693,7 +1729,7 @@ Provide a clear, concise explanation of what this query does, avoiding technical
         
         return explanation.strip()
     except Exception as e:
-        print(f"Error generating explanation: {e}")
+        logger.warning("Error generating explanation: %s", e)
         return "Could not generate explanation due to an error."
 
 async def suggest_visualization(sql: str, question: str):
@@ -713,7 +1749,7 @@ Explain in 1-2 sentences why this visualization would be effective. Be specific
 """
 
         # Initialize client
-        client = InferenceClient(
+        client = get_inference_client(
             model=MODEL_NAME,
             token=HF_API_TOKEN
         )
@@ -721,7 +1757,7 @@ Explain in 1-2 sentences why this visualization would be effective. Be specific
         suggestion = ""
         # Try with conversational endpoint first
         try:
-            response = client.chat_completion(
+            response = await run_model_call(client.chat_completion,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=150,
                 temperature=0.1,
@@ -733,8 +1769,8 @@ Explain in 1-2 sentences why this visualization would be effective. Be specific
                 suggestion = response.content if hasattr(response, 'content') else str(response)
         except Exception as e:
             # Fallback to text_generation if chat_completion fails
-            print(f"Chat completion failed for visualization, trying text_generation: {str(e)}")
-            suggestion = client.text_generation(
+            logger.debug("Chat completion failed for visualization, trying text_generation: %s", e)
+            suggestion = await run_model_call(client.text_generation,
                 prompt,
                 max_new_tokens=150,
                 temperature=0.1,
@@ -742,13 +1778,37 @@ Explain in 1-2 sentences why this visualization would be effective. Be specific
         
         return suggestion.strip()
     except Exception as e:
-        print(f"Error suggesting visualization: {e}")
+        logger.warning("Error suggesting visualization: %s", e)
         return "Could not generate visualization suggestion due to an error."
 
+def catalog_has(catalog, *tables):
+    """Whether a fast-path rule's tables exist (always, when there's no catalog)"""
+    return catalog is None or catalog.has_table(*tables)
+
+def fallback_sql(prompt, schema_content, catalog=None):
+    """A simple query to fall back on when every model failed"""
+    # Extract potential table names from the prompt
+    table_pattern = r"\b(table|from)\s+([a-zA-Z0-9_]+)\b"
+    table_match = re.search(table_pattern, prompt, re.IGNORECASE)
+    
+    if table_match and catalog_has(catalog, table_match.group(2)):
+        table_name = catalog.table_name(table_match.group(2)) if catalog else table_match.group(2)
+        return f"SELECT * FROM {table_name} LIMIT 10;"
+    if catalog and catalog.tables:
+        # The schema's first table (books for library, customers for default)
+        return f"SELECT * FROM {next(iter(catalog.tables))} LIMIT 10;"
+    # Generic fallback based on schema content
+    if "library" in schema_content.lower():
+        return "SELECT * FROM books LIMIT 10;"
+    elif "customers" in schema_content.lower():
+        return "SELECT * FROM customers LIMIT 10;"
+    # Super generic fallback
+    return "SELECT name FROM sqlite_master WHERE type='table';"
+
 # Function to call HuggingFace using InferenceClient
-async def generate_sql_with_api(prompt, schema_content):
+async def generate_sql_with_api(prompt, schema_content, catalog=None):
     """Generate SQL query using HuggingFace Inference API"""
-        start_time = time.time()
+    start_time = time.time()
     original_model = MODEL_NAME
     
     # List of models to try in order of preference
@@ -758,8 +1818,8 @@ async def generate_sql_with_api(prompt, schema_content):
         "gaussalgo/T5-LM-Large-text2sql-spider"  # Small specialized text2sql model
     ]
     
-        # Create a structured prompt with stronger formatting instructions
-        complete_prompt = f"""You are an expert SQL developer. Convert the following natural language question into a SQL query based on the provided schema.
+    # Create a structured prompt with stronger formatting instructions
+    complete_prompt = f"""You are an expert SQL developer. Convert the following natural language question into a SQL query based on the provided schema.
 
 SCHEMA:
 {schema_content}
@@ -781,72 +1841,74 @@ SELECT columns FROM table WHERE condition;
 8. For "last month" queries, use date('now', '-1 month') comparison."""
 
     # First check for special cases
-        # Special case handling for common queries
-        if "purchases in the last month" in prompt.lower() or "ordered in the last month" in prompt.lower():
-            sql = """
-            SELECT c.name, c.email 
-            FROM customers c 
-            JOIN orders o ON c.customer_id = o.customer_id 
-            WHERE o.order_date >= date('now', '-1 month');
-            """
-            return {
-                "sql": sql.strip(),
+    # Special case handling for common queries
+    if ("purchases in the last month" in prompt.lower() or "ordered in the last month" in prompt.lower()) \
+            and catalog_has(catalog, "customers", "orders"):
+        sql = """
+        SELECT c.name, c.email 
+        FROM customers c 
+        JOIN orders o ON c.customer_id = o.customer_id 
+        WHERE o.order_date >= date('now', '-1 month');
+        """
+        return {
+            "sql": sql.strip(),
             "model": f"{original_model} (optimized)",
             "execution_time": time.time() - start_time
-            }
-            
-        # Special case for average order value per customer query
-        if "average order value" in prompt.lower() and "per customer" in prompt.lower():
-            sql = """
-            SELECT c.customer_id, c.name, AVG(o.total_amount) as average_order_value
-            FROM customers c 
-            JOIN orders o ON c.customer_id = o.customer_id 
-            GROUP BY c.customer_id, c.name
-            ORDER BY average_order_value DESC;
-            """
-            return {
-                "sql": sql.strip(),
+        }
+        
+    # Special case for average order value per customer query
+    if "average order value" in prompt.lower() and "per customer" in prompt.lower() \
+            and catalog_has(catalog, "customers", "orders"):
+        sql = """
+        SELECT c.customer_id, c.name, AVG(o.total_amount) as average_order_value
+        FROM customers c 
+        JOIN orders o ON c.customer_id = o.customer_id 
+        GROUP BY c.customer_id, c.name
+        ORDER BY average_order_value DESC;
+        """
+        return {
+            "sql": sql.strip(),
             "model": f"{original_model} (optimized)",
             "execution_time": time.time() - start_time
-            }
-            
-        # Special case for books by author
-        if "books by" in prompt.lower() and "author" in prompt.lower():
-            author_name = None
-            # Try to extract author name from quotes
-            author_match = re.search(r"'([^']+)'|\"([^\"]+)\"", prompt)
-            if author_match:
-                # Safely access groups by checking which group matched
-                author_name = author_match.group(1) if author_match.group(1) is not None else author_match.group(2)
-            
-            # Default query if we can't extract a specific author
-            sql = """
+        }
+        
+    # Special case for books by author
+    if "books by" in prompt.lower() and "author" in prompt.lower() and catalog_has(catalog, "books", "authors"):
+        author_name = None
+        # Try to extract author name from quotes
+        author_match = re.search(r"'([^']+)'|\"([^\"]+)\"", prompt)
+        if author_match:
+            # Safely access groups by checking which group matched
+            author_name = author_match.group(1) if author_match.group(1) is not None else author_match.group(2)
+        
+        # Default query if we can't extract a specific author
+        sql = """
+        SELECT b.title, b.publication_year, b.isbn, b.genre
+        FROM books b
+        JOIN authors a ON b.author_id = a.author_id
+        WHERE a.name LIKE '%J.K. Rowling%';
+        """
+        
+        # If we found an author name, use it in the query
+        if author_name:
+            sql = f"""
             SELECT b.title, b.publication_year, b.isbn, b.genre
             FROM books b
             JOIN authors a ON b.author_id = a.author_id
-            WHERE a.name LIKE '%J.K. Rowling%';
+            WHERE a.name LIKE '%{author_name}%';
             """
             
-            # If we found an author name, use it in the query
-            if author_name:
-                sql = f"""
-                SELECT b.title, b.publication_year, b.isbn, b.genre
-                FROM books b
-                JOIN authors a ON b.author_id = a.author_id
-                WHERE a.name LIKE '%{author_name}%';
-                """
-                
-            return {
-                "sql": sql.strip(),
+        return {
+            "sql": sql.strip(),
             "model": f"{original_model} (optimized)",
             "execution_time": time.time() - start_time
         }
     
     # Special case for "show all X from table Y" pattern
     show_table_match = re.search(r"show all (.*?) from table (?:call(?:ed)? )?([a-zA-Z0-9_]+)", prompt.lower())
-    if show_table_match:
+    if show_table_match and catalog_has(catalog, show_table_match.group(2)):
         item_type = show_table_match.group(1).strip()
-        table_name = show_table_match.group(2).strip()
+        table_name = catalog.table_name(show_table_match.group(2)) if catalog else show_table_match.group(2).strip()
         
         # Generate a simple SELECT * query
         sql = f"""
@@ -860,12 +1922,12 @@ SELECT columns FROM table WHERE condition;
     
     # Try each model in sequence until one works
     last_error = None
-    for model in models_to_try:
+    for depth, model in enumerate(models_to_try):
         try:
-            print(f"Trying to generate SQL using model {model}")
+            logger.debug("Trying to generate SQL using model %s", model)
             
             # Initialize client with current model
-            client = InferenceClient(
+            client = get_inference_client(
                 model=model,
                 token=HF_API_TOKEN
             )
@@ -873,7 +1935,7 @@ SELECT columns FROM table WHERE condition;
             response_text = ""
             # Try with conversational endpoint first (chat_completion)
             try:
-                response = client.chat_completion(
+                response = await run_model_call(client.chat_completion,
                     messages=[{"role": "user", "content": complete_prompt}],
                     max_tokens=512,
                     temperature=0.1,
@@ -885,27 +1947,27 @@ SELECT columns FROM table WHERE condition;
                 else:
                     response_text = response.content if hasattr(response, 'content') else str(response)
                     
-                print(f"Successfully generated response with {model} using chat_completion")
+                logger.debug("Successfully generated response with %s using chat_completion", model)
                 
             except Exception as chat_error:
                 # Log the error
-                print(f"Chat completion failed with {model}: {str(chat_error)}")
+                logger.debug("Chat completion failed with %s: %s", model, chat_error)
                 
                 # Try text_generation as fallback only if the error suggests it might work
                 # (Some models only support one or the other)
                 if "not supported" not in str(chat_error).lower():
                     try:
-                        print(f"Trying text_generation with {model}")
-                        response_text = client.text_generation(
+                        logger.debug("Trying text_generation with %s", model)
+                        response_text = await run_model_call(client.text_generation,
                             complete_prompt,
                             max_new_tokens=512,
                             temperature=0.1,
                             top_p=0.95,
                         )
-                        print(f"Successfully generated response with {model} using text_generation")
+                        logger.debug("Successfully generated response with %s using text_generation", model)
                     except Exception as text_error:
                         # Both methods failed for this model, try the next one
-                        print(f"Text generation also failed with {model}: {str(text_error)}")
+                        logger.warning("Text generation also failed with %s: %s", model, text_error)
                         last_error = text_error
                         continue
                 else:
@@ -916,90 +1978,75 @@ SELECT columns FROM table WHERE condition;
             # If we got here, we have a response_text to process
             elapsed_time = time.time() - start_time
             
-            # Print full response for debugging
-            print(f"Full model response from {model}: {response_text[:200]}...")
+            logger.debug("Model response from %s: %.200s", model, response_text)
         
-        # Extract SQL from response using multiple patterns
-        sql_patterns = [
-            r"```sql\s*(.*?)\s*```",  # Standard code block
-            r"```\s*(SELECT.*?;)\s*```",  # SQL without explicit language tag
-            r"(SELECT.*?;)",  # Just find a SELECT statement
-            r"The SQL query for this would be:\s*(SELECT.*?;)",  # SQL with explanatory prefix
-            r"Here's the SQL query:\s*(SELECT.*?;)",  # Another common prefix
-            r"SQL:\s*(SELECT.*?;)"  # Simple SQL prefix
-        ]
-        
-        sql = ""
-        for pattern in sql_patterns:
-            sql_match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
-            if sql_match and sql_match.groups():  # Make sure there are groups
-                sql = sql_match.group(1).strip()
-                # Make sure SQL ends with a semicolon
-                if not sql.endswith(';'):
-                    sql += ';'
-                break
-                
-        # If no SQL block is found, use the entire response as SQL
-        if not sql and "SELECT" in response_text:
-            # Last resort: just look for a SELECT statement in the text
-            select_pos = response_text.find("SELECT")
-            sql = response_text[select_pos:].strip()
+            # Extract SQL from response using multiple patterns
+            sql_patterns = [
+                r"```sql\s*(.*?)\s*```",  # Standard code block
+                r"```\s*(SELECT.*?;)\s*```",  # SQL without explicit language tag
+                r"(SELECT.*?;)",  # Just find a SELECT statement
+                r"The SQL query for this would be:\s*(SELECT.*?;)",  # SQL with explanatory prefix
+                r"Here's the SQL query:\s*(SELECT.*?;)",  # Another common prefix
+                r"SQL:\s*(SELECT.*?;)"  # Simple SQL prefix
+            ]
             
-            # Try to end at the first occurrence of a double newline, semicolon or closing backtick
-            end_markers = ["\n\n", ";", "```"]
-            for marker in end_markers:
-                end_pos = sql.find(marker)
-                if end_pos > 0:
-                    sql = sql[:end_pos].strip()
+            sql = ""
+            for pattern in sql_patterns:
+                sql_match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
+                if sql_match and sql_match.groups():  # Make sure there are groups
+                    sql = sql_match.group(1).strip()
+                    # Make sure SQL ends with a semicolon
+                    if not sql.endswith(';'):
+                        sql += ';'
                     break
                     
-            # Ensure semicolon
-            if not sql.endswith(';'):
-                sql += ';'
+            # If no SQL block is found, use the entire response as SQL
+            if not sql and "SELECT" in response_text:
+                # Last resort: just look for a SELECT statement in the text
+                select_pos = response_text.find("SELECT")
+                sql = response_text[select_pos:].strip()
                 
+                # Try to end at the first occurrence of a double newline, semicolon or closing backtick
+                end_markers = ["\n\n", ";", "```"]
+                for marker in end_markers:
+                    end_pos = sql.find(marker)
+                    if end_pos > 0:
+                        sql = sql[:end_pos].strip()
+                        break
+                        
+                # Ensure semicolon
+                if not sql.endswith(';'):
+                    sql += ';'
+                    
             if sql:
-                print(f"SQL generated in {elapsed_time:.2f}s using model {model}")
-        return {
-            "sql": sql,
-                    "model": model,
-            "execution_time": elapsed_time
-        }
-        
-    except Exception as e:
-            print(f"Error with model {model}: {str(e)}")
+                logger.debug("SQL generated in %.2fs using model %s", elapsed_time, model)
+            return {
+                "sql": sql,
+                "model": model,
+                "execution_time": elapsed_time,
+                "fallback_depth": depth
+            }
+            
+        except Exception as e:
+            logger.warning("Error with model %s: %s", model, e)
             last_error = e
             continue
     
     # If we get here, all models failed
     elapsed_time = time.time() - start_time
     
-    # Try to generate a simple query based on the prompt
-    # Extract potential table names from the prompt
-    table_pattern = r"\b(table|from)\s+([a-zA-Z0-9_]+)\b"
-    table_match = re.search(table_pattern, prompt, re.IGNORECASE)
-    
-    if table_match:
-        table_name = table_match.group(2)
-        sql = f"SELECT * FROM {table_name} LIMIT 10;"
-    else:
-        # Generic fallback based on schema content
-        if "library" in schema_content.lower():
-            sql = "SELECT * FROM books LIMIT 10;"
-        elif "customers" in schema_content.lower():
-            sql = "SELECT * FROM customers LIMIT 10;"
-        else:
-            # Super generic fallback
-            sql = "SELECT name FROM sqlite_master WHERE type='table';"
+    sql = fallback_sql(prompt, schema_content, catalog)
     
     error_message = str(last_error) if last_error else "All models failed to generate SQL"
-        return {
+    return {
         "sql": f"-- Error generating SQL: {error_message}\n-- Falling back to rule-based generation\n{sql}",
         "model": "rule-based-fallback",
-            "execution_time": elapsed_time
-        }
+        "execution_time": elapsed_time,
+        "fallback_depth": len(models_to_try)
+    }
 
 # Enhanced SQL generation with reasoning steps
-async def generate_sql_with_reasoning(prompt, schema_content):
+async def generate_sql_with_reasoning(prompt, schema_content, catalog=None):
     """Generate SQL with step-by-step reasoning"""
     start_time = time.time()
     original_model = MODEL_NAME
@@ -1011,100 +2058,102 @@ async def generate_sql_with_reasoning(prompt, schema_content):
         "gaussalgo/T5-LM-Large-text2sql-spider"  # Small specialized text2sql model
     ]
     
-        # Special case handling for common queries
-        if "purchases in the last month" in prompt.lower() or "ordered in the last month" in prompt.lower():
-            # Direct hardcoded handling for the demo to avoid issues
-            sql = """
-            SELECT c.name, c.email 
-            FROM customers c 
-            JOIN orders o ON c.customer_id = o.customer_id 
-            WHERE o.order_date >= date('now', '-1 month');
-            """
-            
-            reasoning_steps = [
+    # Special case handling for common queries
+    if ("purchases in the last month" in prompt.lower() or "ordered in the last month" in prompt.lower()) \
+            and catalog_has(catalog, "customers", "orders"):
+        # Direct hardcoded handling for the demo to avoid issues
+        sql = """
+        SELECT c.name, c.email 
+        FROM customers c 
+        JOIN orders o ON c.customer_id = o.customer_id 
+        WHERE o.order_date >= date('now', '-1 month');
+        """
+        
+        reasoning_steps = [
             "First, I need to identify which tables contain customer and order information. The schema shows we need 'customers' for customer details and 'orders' for order dates.",
-                "Next, I need to join these tables. The relationship is through customer_id which appears in both tables.",
+            "Next, I need to join these tables. The relationship is through customer_id which appears in both tables.",
             "To find purchases in the last month, I need to filter orders where the order_date is greater than or equal to the current date minus one month.",
             "For this filter, I'll use the SQLite date function: date('now', '-1 month')."
-            ]
-            
-            return {
-                "sql": sql.strip(),
-                "reasoning_steps": reasoning_steps,
+        ]
+        
+        return {
+            "sql": sql.strip(),
+            "reasoning_steps": reasoning_steps,
             "execution_time": time.time() - start_time,
             "model": f"{original_model} (optimized)"
-            }
-            
-        # Special case for average order value per customer query
-        if "average order value" in prompt.lower() and "per customer" in prompt.lower():
-            sql = """
-            SELECT c.customer_id, c.name, AVG(o.total_amount) as average_order_value
-            FROM customers c 
-            JOIN orders o ON c.customer_id = o.customer_id 
-            GROUP BY c.customer_id, c.name
-            ORDER BY average_order_value DESC;
-            """
-            
-            reasoning_steps = [
+        }
+        
+    # Special case for average order value per customer query
+    if "average order value" in prompt.lower() and "per customer" in prompt.lower() \
+            and catalog_has(catalog, "customers", "orders"):
+        sql = """
+        SELECT c.customer_id, c.name, AVG(o.total_amount) as average_order_value
+        FROM customers c 
+        JOIN orders o ON c.customer_id = o.customer_id 
+        GROUP BY c.customer_id, c.name
+        ORDER BY average_order_value DESC;
+        """
+        
+        reasoning_steps = [
             "First, I need to identify which tables contain customer and order information. The schema shows we need 'customers' for customer details and 'orders' for order amounts.",
             "Next, I need to join these tables. The relationship is through customer_id which appears in both tables.",
             "To calculate the average order value per customer, I need to use the AVG() function on the total_amount column from the orders table.",
-                "I need to GROUP BY customer_id and name to get individual averages for each customer.",
-                "Finally, I'll sort the results in descending order to see customers with the highest average order values first."
-            ]
-            
-            return {
-                "sql": sql.strip(),
-                "reasoning_steps": reasoning_steps,
+            "I need to GROUP BY customer_id and name to get individual averages for each customer.",
+            "Finally, I'll sort the results in descending order to see customers with the highest average order values first."
+        ]
+        
+        return {
+            "sql": sql.strip(),
+            "reasoning_steps": reasoning_steps,
             "execution_time": time.time() - start_time,
             "model": f"{original_model} (optimized)"
-            }
+        }
+    
+    # Special case for books by author
+    if "books by" in prompt.lower() and "author" in prompt.lower() and catalog_has(catalog, "books", "authors"):
+        author_name = None
+        # Try to extract author name from quotes
+        author_match = re.search(r"'([^']+)'|\"([^\"]+)\"", prompt)
+        if author_match:
+            # Safely access groups by checking which group matched
+            author_name = author_match.group(1) if author_match.group(1) is not None else author_match.group(2)
         
-        # Special case for books by author
-        if "books by" in prompt.lower() and "author" in prompt.lower():
-            author_name = None
-            # Try to extract author name from quotes
-            author_match = re.search(r"'([^']+)'|\"([^\"]+)\"", prompt)
-            if author_match:
-                # Safely access groups by checking which group matched
-                author_name = author_match.group(1) if author_match.group(1) is not None else author_match.group(2)
-            
-            # Default query if we can't extract a specific author
-            sql = """
+        # Default query if we can't extract a specific author
+        sql = """
+        SELECT b.title, b.publication_year, b.isbn, b.genre
+        FROM books b
+        JOIN authors a ON b.author_id = a.author_id
+        WHERE a.name LIKE '%J.K. Rowling%';
+        """
+        
+        # If we found an author name, use it in the query
+        if author_name:
+            sql = f"""
             SELECT b.title, b.publication_year, b.isbn, b.genre
             FROM books b
             JOIN authors a ON b.author_id = a.author_id
-            WHERE a.name LIKE '%J.K. Rowling%';
+            WHERE a.name LIKE '%{author_name}%';
             """
-            
-            # If we found an author name, use it in the query
-            if author_name:
-                sql = f"""
-                SELECT b.title, b.publication_year, b.isbn, b.genre
-                FROM books b
-                JOIN authors a ON b.author_id = a.author_id
-                WHERE a.name LIKE '%{author_name}%';
-                """
-            
-            reasoning_steps = [
-                "First, I need to identify which tables contain book and author information. The schema shows we need 'books' for book details and 'authors' for author information.",
-                "Next, I need to join these tables. The relationship is through author_id which appears in both tables.",
-                "To find books by a specific author, I need to filter where the author's name matches the author mentioned in the question.",
-                "Finally, I'll select the relevant book information such as title, publication year, ISBN, and genre."
-            ]
-            
-            return {
-                "sql": sql.strip(),
-                "reasoning_steps": reasoning_steps,
+        
+        reasoning_steps = [
+            "First, I need to identify which tables contain book and author information. The schema shows we need 'books' for book details and 'authors' for author information.",
+            "Next, I need to join these tables. The relationship is through author_id which appears in both tables.",
+            "To find books by a specific author, I need to filter where the author's name matches the author mentioned in the question.",
+            "Finally, I'll select the relevant book information such as title, publication year, ISBN, and genre."
+        ]
+        
+        return {
+            "sql": sql.strip(),
+            "reasoning_steps": reasoning_steps,
             "execution_time": time.time() - start_time,
             "model": f"{original_model} (optimized)"
         }
     
     # Special case for "show all X from table Y" pattern
     show_table_match = re.search(r"show all (.*?) from table (?:call(?:ed)? )?([a-zA-Z0-9_]+)", prompt.lower())
-    if show_table_match:
+    if show_table_match and catalog_has(catalog, show_table_match.group(2)):
         item_type = show_table_match.group(1).strip()
-        table_name = show_table_match.group(2).strip()
+        table_name = catalog.table_name(show_table_match.group(2)) if catalog else show_table_match.group(2).strip()
         
         # Generate a simple SELECT * query
         sql = f"""
@@ -1122,10 +2171,10 @@ async def generate_sql_with_reasoning(prompt, schema_content):
             "reasoning_steps": reasoning_steps,
             "execution_time": time.time() - start_time,
             "model": f"{original_model} (pattern-matched)"
-            }
+        }
     
-        # Enhanced prompt with reasoning request
-        reasoning_prompt = f"""You are an expert SQL developer. Given the following database schema and a question, generate SQL that answers the question.
+    # Enhanced prompt with reasoning request
+    reasoning_prompt = f"""You are an expert SQL developer. Given the following database schema and a question, generate SQL that answers the question.
 
 DATABASE SCHEMA:
 {schema_content}
@@ -1159,50 +2208,50 @@ Ensure the query is optimized, correct, and directly addresses the user's questi
 
     # Try each model in sequence until one works
     last_error = None
-    for model in models_to_try:
+    for depth, model in enumerate(models_to_try):
         try:
-            print(f"Trying to generate SQL with reasoning using model {model}")
+            logger.debug("Trying to generate SQL with reasoning using model %s", model)
 
-        # Call API with appropriate task and parameters
-        client = InferenceClient(
+            # Call API with appropriate task and parameters
+            client = get_inference_client(
                 model=model,
-            token=HF_API_TOKEN
-        )
-        
-        # Try with conversational endpoint first
-        try:
-            response = client.chat_completion(
-                messages=[{"role": "user", "content": reasoning_prompt}],
-                max_tokens=1024,
-                    temperature=0.1,
-                top_p=0.95,
+                token=HF_API_TOKEN
             )
-            # Extract content from response
-            if hasattr(response, 'choices') and response.choices and len(response.choices) > 0:
-                response = response.choices[0].message.content
-            else:
-                response = response.content if hasattr(response, 'content') else str(response)
+            
+            # Try with conversational endpoint first
+            try:
+                response = await run_model_call(client.chat_completion,
+                    messages=[{"role": "user", "content": reasoning_prompt}],
+                    max_tokens=1024,
+                    temperature=0.1,
+                    top_p=0.95,
+                )
+                # Extract content from response
+                if hasattr(response, 'choices') and response.choices and len(response.choices) > 0:
+                    response = response.choices[0].message.content
+                else:
+                    response = response.content if hasattr(response, 'content') else str(response)
                     
-                print(f"Successfully generated response with {model} using chat_completion")
+                logger.debug("Successfully generated response with %s using chat_completion", model)
                 
             except Exception as chat_error:
                 # Log the error
-                print(f"Chat completion failed with {model}: {str(chat_error)}")
+                logger.debug("Chat completion failed with %s: %s", model, chat_error)
                 
                 # Try text_generation as fallback only if the error suggests it might work
                 if "not supported" not in str(chat_error).lower():
                     try:
-                        print(f"Trying text_generation with {model}")
-            response = client.text_generation(
-                reasoning_prompt,
-                max_new_tokens=1024,
-                temperature=0.1,
-                top_p=0.95,
-            )
-                        print(f"Successfully generated response with {model} using text_generation")
+                        logger.debug("Trying text_generation with %s", model)
+                        response = await run_model_call(client.text_generation,
+                            reasoning_prompt,
+                            max_new_tokens=1024,
+                            temperature=0.1,
+                            top_p=0.95,
+                        )
+                        logger.debug("Successfully generated response with %s using text_generation", model)
                     except Exception as text_error:
                         # Both methods failed for this model, try the next one
-                        print(f"Text generation also failed with {model}: {str(text_error)}")
+                        logger.warning("Text generation also failed with %s: %s", model, text_error)
                         last_error = text_error
                         continue
                 else:
@@ -1210,46 +2259,45 @@ Ensure the query is optimized, correct, and directly addresses the user's questi
                     last_error = chat_error
                     continue
             
-        end_time = time.time()
-        
-        # Print full response for debugging
-            print(f"Full model response from {model}: {response[:200]}...")
-        
-        # Extract the SQL from the response using multiple patterns
-        sql = ""
-        sql_patterns = [
-            r"```sql\s+(.*?)\s+```",  # Standard code block
-            r"```\s*(SELECT.*?;)\s*```",  # SQL without explicit language tag
-            r"(SELECT.*?;)"  # Just find a SELECT statement
-        ]
-        
-        for pattern in sql_patterns:
-            sql_match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
-            if sql_match and sql_match.groups():  # Make sure there are groups
-                sql = sql_match.group(1).strip()
-                # Make sure SQL ends with a semicolon
-                if not sql.endswith(';'):
-                    sql += ';'
-                break
-        
-        if not sql:
+            end_time = time.time()
+            
+            logger.debug("Model response from %s: %.200s", model, response)
+            
+            # Extract the SQL from the response using multiple patterns
+            sql = ""
+            sql_patterns = [
+                r"```sql\s+(.*?)\s+```",  # Standard code block
+                r"```\s*(SELECT.*?;)\s*```",  # SQL without explicit language tag
+                r"(SELECT.*?;)"  # Just find a SELECT statement
+            ]
+            
+            for pattern in sql_patterns:
+                sql_match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
+                if sql_match and sql_match.groups():  # Make sure there are groups
+                    sql = sql_match.group(1).strip()
+                    # Make sure SQL ends with a semicolon
+                    if not sql.endswith(';'):
+                        sql += ';'
+                    break
+            
+            if not sql:
                 # If no SQL block is found, try to find a SELECT statement
                 if "SELECT" in response:
-            select_pos = response.find("SELECT")
-            sql = response[select_pos:].strip()
+                    select_pos = response.find("SELECT")
+                    sql = response[select_pos:].strip()
                     
-            # Try to end at the first occurrence of a double newline or semicolon
+                    # Try to end at the first occurrence of a double newline or semicolon
                     end_markers = ["\n\n", ";", "```"]
                     for marker in end_markers:
                         end_pos = sql.find(marker)
-            if end_pos > 0:
-                sql = sql[:end_pos].strip()
+                        if end_pos > 0:
+                            sql = sql[:end_pos].strip()
                             break
                             
-            # Ensure semicolon
-            if not sql.endswith(';'):
-                sql += ';'
-        
+                    # Ensure semicolon
+                    if not sql.endswith(';'):
+                        sql += ';'
+            
             # Now extract reasoning steps
             reasoning_steps = []
             
@@ -1272,15 +2320,15 @@ Ensure the query is optimized, correct, and directly addresses the user's questi
                     break
                     
             # Try to extract steps using different patterns
-        step_patterns = [
+            step_patterns = [
                 # Look for numbered steps (1. Step description)
                 (r"\b(\d+)\.\s+(.*?)(?=\b\d+\.|$)", "numbered"),
                 # Look for steps labeled as "Step X"
                 (r"step\s+(\d+):?\s+(.*?)(?=step\s+\d+:?|$)", "labeled"),
                 # Look for sections with headers
                 (r"(tables needed|fields needed|joins needed|filters needed|aggregations needed|calculations needed|query formulation):?\s+(.*?)(?=tables needed|fields needed|joins needed|filters needed|aggregations needed|calculations needed|query formulation|$)", "sections")
-        ]
-        
+            ]
+            
             for pattern, step_type in step_patterns:
                 matches = re.findall(pattern, content_for_reasoning, re.DOTALL | re.IGNORECASE)
                 if matches:
@@ -1291,49 +2339,34 @@ Ensure the query is optimized, correct, and directly addresses the user's questi
                     else:
                         # For sections, just add them in order found
                         reasoning_steps = [f"{section[0]}: {section[1].strip()}" for section in matches]
-                break
+                    break
                 
             # If we couldn't extract structured steps, try to get paragraphs
-        if not reasoning_steps:
+            if not reasoning_steps:
                 paragraphs = re.split(r'\n\s*\n', content_for_reasoning)
                 reasoning_steps = [p.strip() for p in paragraphs if len(p.strip()) > 20]
-        
+            
             # Limit to reasonable number of steps
             reasoning_steps = reasoning_steps[:5]
             
             if sql:
-        return {
+                return {
                     "sql": sql.strip(),
-            "reasoning_steps": reasoning_steps,
-            "execution_time": end_time - start_time,
-                    "model": model
-        }
+                    "reasoning_steps": reasoning_steps,
+                    "execution_time": end_time - start_time,
+                    "model": model,
+                    "fallback_depth": depth
+                }
                 
-    except Exception as e:
-            print(f"Error with model {model}: {str(e)}")
+        except Exception as e:
+            logger.warning("Error with model %s: %s", model, e)
             last_error = e
             continue
     
     # If all models failed, create a fallback response
     elapsed_time = time.time() - start_time
     
-    # Try to generate a simple query based on the prompt
-    # Extract potential table names from the prompt
-    table_pattern = r"\b(table|from)\s+([a-zA-Z0-9_]+)\b"
-    table_match = re.search(table_pattern, prompt, re.IGNORECASE)
-    
-    if table_match:
-        table_name = table_match.group(2)
-        sql = f"SELECT * FROM {table_name} LIMIT 10;"
-    else:
-        # Generic fallback based on schema content
-        if "library" in schema_content.lower():
-            sql = "SELECT * FROM books LIMIT 10;"
-        elif "customers" in schema_content.lower():
-            sql = "SELECT * FROM customers LIMIT 10;"
-        else:
-            # Super generic fallback
-            sql = "SELECT name FROM sqlite_master WHERE type='table';"
+    sql = fallback_sql(prompt, schema_content, catalog)
     
     reasoning_steps = [
         "Unable to generate detailed reasoning due to model limitations.",
@@ -1342,12 +2375,14 @@ Ensure the query is optimized, correct, and directly addresses the user's questi
     
     error_message = str(last_error) if last_error else "All models failed to generate SQL with reasoning"
     
-                return {
+    return {
         "sql": f"-- Error generating SQL: {error_message}\n-- Falling back to rule-based generation\n{sql}",
         "reasoning_steps": reasoning_steps,
         "execution_time": elapsed_time,
-        "model": "rule-based-fallback"
-            }
+        "model": "rule-based-fallback",
+        "fallback_depth": len(models_to_try)
+    }
+
 
 def extract_reasoning_and_sql(response_text):
     """Extract reasoning steps and SQL from the model response"""
@@ -1483,6 +2518,200 @@ def extract_reasoning_and_sql(response_text):
     
     return reasoning_steps, sql
 
+def extract_sql(response_text):
+    """Extract just the SQL statement from a model response, or "" if there is none"""
+    sql_patterns = [
+        r"```sql\s*(.*?)\s*```",  # Standard code block
+        r"```\s*(SELECT.*?;)\s*```",  # SQL without explicit language tag
+        r"(SELECT.*?;)",  # Just find a SELECT statement
+        r"(SELECT.*)"  # Unterminated SELECT statement
+    ]
+    for pattern in sql_patterns:
+        sql_match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
+        if sql_match:
+            sql = sql_match.group(1).strip()
+            if not sql.endswith(';'):
+                sql += ';'
+            return sql
+    return ""
+
+def call_model(model, prompt, max_tokens):
+    """Run a prompt through chat_completion, falling back to text_generation"""
+    client = get_inference_client(
+        model=model,
+        token=HF_API_TOKEN
+    )
+    try:
+        response = client.chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=0.1,
+        )
+        if hasattr(response, 'choices') and response.choices and len(response.choices) > 0:
+            return response.choices[0].message.content
+        return response.content if hasattr(response, 'content') else str(response)
+    except Exception as chat_error:
+        logger.debug("Chat completion failed with %s, trying text_generation: %s", model, chat_error)
+        return client.text_generation(
+            prompt,
+            max_new_tokens=max_tokens,
+            temperature=0.1,
+        )
+
+async def validate_and_repair_sql(sql, question, schema_name, schema_content, model):
+    """Compile generated SQL against the schema and ask the model to fix it on error"""
+    catalog = get_catalog(schema_name)
+    validation = SQL_VALIDATOR.validate(schema_name, schema_content, sql, catalog)
+    validation_ms = validation["validation_ms"]
+    attempts = 0
+    
+    # Repair with the model that wrote the SQL. Rule-based fallback SQL is only
+    # produced once every model has failed, so it isn't sent back to one
+    repair_model = model.split(" (")[0]
+    if "/" not in repair_model:
+        repair_model = MODEL_NAME
+    max_attempts = 0 if model == "rule-based-fallback" else MAX_REPAIR_ATTEMPTS
+    
+    while not validation["valid"] and attempts < max_attempts:
+        attempts += 1
+        logger.info("Generated SQL failed validation (%s), repair attempt %d", validation["error"], attempts)
+        repair_prompt = f"""You are an expert SQL developer. The following SQL query fails to compile against the database schema.
+
+DATABASE SCHEMA:
+{schema_content}
+
+QUESTION:
+{question}
+
+SQL QUERY:
+{sql}
+
+ERROR:
+{validation['error']}
+
+Fix the query so that it answers the question and compiles against the schema.
+Return ONLY the corrected SQL query formatted like this:
+```sql
+SELECT columns FROM table WHERE condition;
+```
+Write ONLY standard SQL that works with SQLite."""
+        try:
+            repaired_sql = extract_sql(await run_model_call(call_model, repair_model, repair_prompt, 512))
+        except Exception as repair_error:
+            logger.warning("Repair attempt failed with %s: %s", repair_model, repair_error)
+            break
+        if not repaired_sql:
+            continue
+        sql = repaired_sql
+        validation = SQL_VALIDATOR.validate(schema_name, schema_content, sql, catalog)
+        validation_ms += validation["validation_ms"]
+    
+    SQL_VALIDATOR.record_outcome(attempts, validation["valid"])
+    return sql, {
+        "valid": validation["valid"],
+        "error": validation["error"],
+        "validation_ms": validation_ms,
+        "repair_attempts": attempts,
+        "repaired": attempts > 0 and validation["valid"]
+    }
+
+@app.get("/validation/stats")
+async def get_validation_stats():
+    """Validation latency and repair success metrics"""
+    return SQL_VALIDATOR.stats()
+
+def record_generation(result):
+    """Count where generated SQL came from: a fast-path rule, a model, or the rule-based fallback"""
+    if "fallback_depth" not in result:
+        outcome = "fast_path"
+    elif result["model"] == "rule-based-fallback":
+        outcome = "rule_based"
+    else:
+        outcome = "model"
+    GENERATIONS.inc(outcome=outcome)
+    GENERATION_SECONDS.observe(result["execution_time"], outcome=outcome)
+    if "fallback_depth" in result:
+        FALLBACK_DEPTH.observe(result["fallback_depth"])
+
+def lookup_semantic_cache(question, schema_name, schema_version, schema_content, include_reasoning, catalog):
+    """(entry, similarity, validation) for a cached answer to a similar question, or Nones
+
+    A hit's SQL is validated again, and dropped from the cache if it no
+    longer compiles. Requests for reasoning only take entries that have it.
+    """
+    accept = (lambda entry: entry["reasoning"]) if include_reasoning else None
+    entry, similarity = SEMANTIC_CACHE.lookup(schema_name, schema_version, question, accept)
+    SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+    outcome, validation = "miss", None
+    if entry is not None:
+        validation = SQL_VALIDATOR.validate(schema_name, schema_content, entry["sql"], catalog)
+        if validation["valid"]:
+            outcome = "hit"
+        else:
+            SEMANTIC_CACHE.discard(schema_name, entry["id"])
+            outcome = "rejected"
+    SEMANTIC_CACHE.record(outcome)
+    SEMANTIC_CACHE_LOOKUPS.inc(result=outcome)
+    if outcome != "hit":
+        return None, similarity, None
+    return entry, similarity, {**validation, "repair_attempts": 0, "repaired": False}
+
+def result_rows(schema_name, sql):
+    """A query's rows, sorted, for comparing results regardless of order and column names"""
+    result = call_worker("execute", schema_name, sql) if WORKER_POOL else run_query(schema_name, sql)
+    return sorted(repr(row) for row in result["df"].itertuples(index=False, name=None))
+
+async def audit_semantic_cache_hit(entry, question, schema_name, schema_content, include_reasoning):
+    """Generate SQL for a question answered from the cache, and check both give the same results"""
+    try:
+        catalog = get_catalog(schema_name)
+        if include_reasoning:
+            result = await generate_sql_with_reasoning(question, schema_content, catalog)
+        else:
+            result = await generate_sql_with_api(question, schema_content, catalog)
+        if result["model"] == "rule-based-fallback":
+            return
+        sql, validation = await validate_and_repair_sql(result["sql"], question, schema_name, schema_content,
+                                                        result["model"])
+        if not validation["valid"]:
+            return
+        agreed = " ".join(sql.split()).rstrip(";") == " ".join(entry["sql"].split()).rstrip(";")
+        if not agreed:
+            loop = asyncio.get_running_loop()
+            fresh_rows, cached_rows = await asyncio.gather(
+                loop.run_in_executor(None, result_rows, schema_name, sql),
+                loop.run_in_executor(None, result_rows, schema_name, entry["sql"]))
+            agreed = fresh_rows == cached_rows
+    except Exception as audit_error:
+        # Inconclusive, e.g. the model or one of the queries failed
+        logger.info("Semantic cache audit failed: %s", audit_error)
+        return
+    SEMANTIC_CACHE.record("audit_agreed" if agreed else "audit_disagreed")
+    if not agreed:
+        SEMANTIC_CACHE.discard(schema_name, entry["id"])
+        SEMANTIC_CACHE_FALSE_HITS.inc(source="audit")
+        logger.warning("Semantic cache answered %r with the SQL for %r; dropped the entry",
+                       question, entry["question"], extra={"schema_name": schema_name})
+
+def schedule_semantic_cache_audit(*args):
+    # Outside the request's trace, which has ended by the time this finishes
+    task = contextvars.Context().run(asyncio.create_task, audit_semantic_cache_hit(*args))
+    SEMANTIC_CACHE_AUDITS.add(task)
+    task.add_done_callback(SEMANTIC_CACHE_AUDITS.discard)
+
+@app.get("/semantic_cache/stats")
+async def get_semantic_cache_stats():
+    """Semantic cache size, hit rate and estimated false-hit rate"""
+    return {"enabled": SEMANTIC_CACHE_ENABLED, "audit_rate": SEMANTIC_CACHE_AUDIT_RATE, **SEMANTIC_CACHE.stats()}
+
+@app.post("/semantic_cache/false_hits")
+async def report_semantic_cache_false_hit(report: SemanticCacheFalseHit):
+    """Report that a query answered from the semantic cache got the wrong SQL"""
+    if not SEMANTIC_CACHE.report_false_hit(report.query_id):
+        raise HTTPException(status_code=404, detail="Query was not answered from the semantic cache")
+    SEMANTIC_CACHE_FALSE_HITS.inc(source="reported")
+    return {"status": "success", "query_id": report.query_id}
+
 @app.post("/generate_sql", response_model=GenerateSQLResponse)
 async def generate_sql(request: GenerateSQLRequest):
     """Generate SQL query from natural language question"""
@@ -1492,70 +2721,114 @@ async def generate_sql(request: GenerateSQLRequest):
     
     # Get schema
     schema_name = request.schema_name if request.schema_name else "default"
-    if schema_name not in SCHEMAS:
-        raise HTTPException(status_code=404, detail="Schema not found")
-    
-    schema_content = SCHEMAS[schema_name].definition
+    schema, schema_version = get_schema_entry(schema_name)
+    schema_content = schema.definition
     
     explanation = ""
     visualization_suggestion = ""
     try:
-        # Generate SQL with reasoning if requested
-        if request.include_reasoning:
-            result = await generate_sql_with_reasoning(question, schema_content)
-        else:
-            result = await generate_sql_with_api(question, schema_content)
-        
-        sql = result["sql"]
-        model = result["model"]
-        execution_time = result["execution_time"]
-        reasoning_steps = result.get("reasoning_steps", [])
+        # Reuse the SQL generated for a similar enough question, if any
+        cached = None
+        if SEMANTIC_CACHE_ENABLED:
+            lookup_start = time.perf_counter()
+            with tracing.span("semantic_cache") as stage:
+                cached, similarity, validation = lookup_semantic_cache(
+                    question, schema_name, schema_version, schema_content, request.include_reasoning,
+                    get_catalog(schema_name))
+                stage.set(hit=cached is not None, similarity=round(similarity, 4))
         
-        # Generate explanation - execute in the background to avoid blocking
-        explanation_task = asyncio.create_task(generate_explanation(sql, schema_content))
-        
-        # Generate visualization suggestion - execute in the background
-        visualization_task = asyncio.create_task(suggest_visualization(sql, question))
+        if cached:
+            sql = cached["sql"]
+            model = cached["model"]
+            execution_time = time.perf_counter() - lookup_start
+            reasoning_steps = cached["reasoning_steps"]
+            explanation = cached["explanation"]
+            visualization_suggestion = cached["visualization_suggestion"]
+        else:
+            # Generate SQL with reasoning if requested
+            with tracing.span("generate", reasoning=bool(request.include_reasoning)) as stage:
+                if request.include_reasoning:
+                    result = await generate_sql_with_reasoning(question, schema_content, get_catalog(schema_name))
+                else:
+                    result = await generate_sql_with_api(question, schema_content, get_catalog(schema_name))
+                stage.set(model=result["model"], fallback_depth=result.get("fallback_depth", -1))
+            
+            sql = result["sql"]
+            model = result["model"]
+            execution_time = result["execution_time"]
+            reasoning_steps = result.get("reasoning_steps", [])
+            record_generation(result)
+            
+            # Make sure the SQL compiles against the schema, repairing it if needed
+            with tracing.span("validate"):
+                sql, validation = await validate_and_repair_sql(sql, question, schema_name, schema_content, model)
+            
+            # Generate explanation - execute in the background to avoid blocking
+            explanation_task = asyncio.create_task(
+                tracing.traced("explanation", generate_explanation(sql, schema_content)))
+            
+            # Generate visualization suggestion - execute in the background
+            visualization_task = asyncio.create_task(
+                tracing.traced("visualization_suggestion", suggest_visualization(sql, question)))
         
         # Execute query if requested
         query_results = None
         result_visualization = None
-        if request.execute_query:
+        result_chart_spec = None
+        cost_estimate = None
+        if request.execute_query and validation["valid"]:
             try:
-                execution_result = execute_query(sql, schema_name)
+                execution_result = await execute_query(sql, schema_name, request.chart_format)
                 query_results = execution_result.get("results")
                 result_visualization = execution_result.get("visualization")
+                result_chart_spec = execution_result.get("chart_spec")
+                cost_estimate = execution_result.get("cost_estimate")
             except Exception as exec_error:
-                print(f"Query execution failed: {str(exec_error)}")
+                logger.info("Query execution failed: %s", exec_error)
                 # Continue even if execution fails
         
         # Wait for explanation and visualization to complete
+        if not cached:
             explanation = await explanation_task
-        visualization_suggestion = await visualization_task
+            visualization_suggestion = await visualization_task
         
         # Create query ID
         query_id = str(uuid.uuid4())
         
+        cache_info = None
+        if cached:
+            SEMANTIC_CACHE.served(query_id, schema_name, cached["id"])
+            cache_info = {"hit": True, "similarity": round(similarity, 4), "question": cached["question"],
+                          "query_id": cached["query_id"]}
+            if random.random() < SEMANTIC_CACHE_AUDIT_RATE:
+                schedule_semantic_cache_audit(cached, question, schema_name, schema_content,
+                                              request.include_reasoning)
+        elif SEMANTIC_CACHE_ENABLED and validation["valid"] and model != "rule-based-fallback":
+            SEMANTIC_CACHE.add(
+                schema_name, schema_version, question,
+                sql=sql, model=model, reasoning=bool(request.include_reasoning),
+                reasoning_steps=reasoning_steps, explanation=explanation,
+                visualization_suggestion=visualization_suggestion, query_id=query_id
+            )
+        
         # Record in history
         query_record = QueryHistory(
             id=query_id,
             question=question,
             sql=sql,
             timestamp=datetime.datetime.now().isoformat(),
+            schema_name=schema_name,
             model_used=model,
             execution_time=execution_time,
-            results=query_results,
+            reasoning_steps=reasoning_steps,
             visualization=result_visualization,
-            reasoning_steps=reasoning_steps
+            chart_spec=result_chart_spec,
+            results_blob=BLOB_STORE.put_artifact(query_results)
         )
         
-        # Add to history
+        # Add to history (entries past HISTORY_RETENTION are dropped)
         QUERY_HISTORY.append(query_record)
         
-        # Keep history at reasonable size
-        if len(QUERY_HISTORY) > 100:
-            QUERY_HISTORY.pop(0)
-        
         return GenerateSQLResponse(
             sql=sql,
             model=model,
@@ -1565,11 +2838,18 @@ async def generate_sql(request: GenerateSQLRequest):
             execution_time=execution_time,
             reasoning_steps=reasoning_steps,
             results=query_results,
-            result_visualization=result_visualization
+            result_visualization=result_visualization,
+            chart_spec=result_chart_spec,
+            cost_estimate=cost_estimate,
+            validation=validation,
+            semantic_cache=cache_info
         )
             
+    except HTTPException:
+        # E.g. the schema was deleted while the question was being answered
+        raise
     except Exception as e:
-        print(f"Error generating SQL: {str(e)}")
+        logger.error("Error generating SQL: %s", e, exc_info=True)
         # Always return a response with explanation and visualization_suggestion defined
         raise HTTPException(status_code=500, detail=f"Failed to generate SQL: {str(e)}. Explanation: {explanation}. Visualization: {visualization_suggestion}")
 
@@ -1577,39 +2857,39 @@ async def generate_sql(request: GenerateSQLRequest):
 @app.post("/execute_sql")
 async def execute_sql_endpoint(
     query_id: str = Body(...),
-    schema_name: str = Body(...)
+    schema_name: str = Body(...),
+    chart_format: Optional[str] = Body(None)
 ):
     """Execute a previously generated SQL query"""
     try:
         # Find the query in history
-        query = None
-        for q in QUERY_HISTORY:
-            if q.id == query_id:
-                query = q
-                break
+        query = QUERY_HISTORY.get(query_id)
         
         if not query:
             raise HTTPException(status_code=404, detail="Query not found in history")
         
-        print(f"Executing query: {query.sql}")
+        logger.debug("Executing query: %s", query.sql)
         
         try:
-            result = execute_query(query.sql, schema_name)
+            result = await execute_query(query.sql, schema_name, chart_format)
             
             # Update query history with results
-            for q in QUERY_HISTORY:
-                if q.id == query_id:
-                    q.results = result.get("results")
-                    q.visualization = result.get("visualization")
+            QUERY_HISTORY.update(
+                query_id,
+                results_blob=BLOB_STORE.put_artifact(result.get("results")),
+                visualization=result.get("visualization"),
+                chart_spec=result.get("chart_spec")
+            )
             
             return {
                 "results": result.get("results"),
                 "visualization": result.get("visualization"),
+                "chart_spec": result.get("chart_spec"),
+                "cost_estimate": result.get("cost_estimate"),
                 "status": "success"
             }
         except Exception as e:
-            print(f"Error during query execution: {e}")
-            print(traceback.format_exc())
+            logger.info("Error during query execution: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             
             # Even if execution fails, return a structured response that the frontend can handle
             return {
@@ -1619,16 +2899,15 @@ async def execute_sql_endpoint(
                 "error_message": str(e)
             }
     except Exception as e:
-        print(f"Error in execute_sql endpoint: {e}")
-        print(traceback.format_exc())
+        logger.error("Error in execute_sql endpoint: %s", e, exc_info=True)
         
         # Return a structured error that the frontend can handle
-    return {
+        return {
             "results": "[]",  # Empty JSON array as string
             "visualization": None,
             "status": "error",
             "error_message": str(e)
-    }
+        }
 
 # For local development
 if __name__ == "__main__":
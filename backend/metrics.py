@@ -0,0 +1,199 @@
+"""
+In-process metrics in the Prometheus text format (GET /metrics).
+
+A small registry of counters, gauges and histograms, with no dependencies so
+that it can be imported anywhere without slowing startup. Modules declare
+their metrics once at import time:
+
+    QUERY_SECONDS = metrics.histogram("nl2sql_query_seconds", "Query execution time", ["engine"])
+    QUERY_SECONDS.observe(0.012, engine="sqlite")
+
+Recording is a dict lookup, a bisect and an increment under a per-metric
+lock, so it is cheap enough for the hot paths. Each process has its own
+registry: with several uvicorn workers, scrape each one (or aggregate).
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond SQLite work up to slow model calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A count that only goes up, e.g. requests or cache hits"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, set directly or read from `fn` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                return []
+            return [(self.name, "", value)]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, e.g. latencies"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (plus +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent in a `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+class Registry:
+    """Named metrics, rendered together in the text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Modules may be imported twice (e.g. as __main__ and main)
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), fn=None):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, fn))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
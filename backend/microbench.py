@@ -0,0 +1,302 @@
+"""
+Micro-benchmarks for the CPU-bound hot paths, with a history of results.
+
+Covers the request work that isn't waiting on a model or the database:
+
+- extract_reasoning_and_sql on small, medium and pathological model responses
+- preprocess_sql_for_sqlite on short to very long statements
+- reading a query result into a DataFrame (SQLiteEngine.execute)
+- DataFrame to JSON conversion (the `results` of every executed query)
+- chart preparation (choosing and reducing what to plot)
+- chart rendering with matplotlib, to PNG
+
+Result sets range from 10 to 1M rows (--max-rows). Each benchmark is timed
+like timeit: enough loops to run for --min-time, repeated --repeat times.
+It reports the median and the best time per call. Every run is appended to
+a JSON lines history file with the git commit and a machine fingerprint.
+It is compared with the latest earlier run from the same machine (or with
+--compare <commit>). Best times that got slower by more than --threshold
+are flagged.
+
+    python microbench.py                         # everything
+    python microbench.py --filter json --max-rows 100000
+    python microbench.py --fail-on-regression    # for CI
+"""
+
+import argparse
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(BACKEND_DIR, "benchmarks", "microbench_history.jsonl")
+ROW_COUNTS = (10, 1_000, 100_000, 1_000_000)
+
+REASONING = """Let me work through this step by step.
+
+1. First, identify the tables and fields needed to answer the question.
+The question asks about employee salaries by department, so we need the employees
+table (salary, department_id) and the departments table (department_name).
+
+2. Consider any necessary joins between tables.
+employees.department_id references departments.department_id, so we join on it.
+
+3. Determine any filtering conditions needed.
+No filtering is needed; every department is included.
+
+4. Decide what aggregations or calculations might be required.
+AVG(salary) grouped by department, rounded to two decimals.
+
+5. Formulate the SQL query.
+"""
+
+RESPONSES = {
+    "small": "```sql\nSELECT * FROM employees;\n```",
+    "medium": REASONING + """
+```sql
+SELECT d.department_name, ROUND(AVG(e.salary), 2) AS average_salary
+FROM employees e
+JOIN departments d ON d.department_id = e.department_id
+GROUP BY d.department_name
+ORDER BY average_salary DESC;
+```
+""",
+    # Long, rambling and never closing its code blocks: every pattern scans
+    # to the end of the text before the next one is tried
+    "pathological": (REASONING * 40) + ("```sql\nSELECT name, salary FROM employees WHERE salary > 1000 " * 400)
+                    + "and the final answer would be SELECT department_name FROM departments",
+}
+
+SQL_STATEMENTS = {
+    "short": "SELECT * FROM orders WHERE order_date >= NOW() - INTERVAL '1 month';",
+    "medium": """
+SELECT c.name, EXTRACT(YEAR FROM o.order_date) AS year, SUM(o.total_amount) AS total,
+       ILIKE(c.email, '%@example.com') AS internal
+FROM customers c JOIN orders o ON o.customer_id = c.customer_id
+WHERE o.order_date BETWEEN CURRENT_DATE - INTERVAL '12 months' AND CURRENT_DATE
+  AND c.name ILIKE '%smith%'
+GROUP BY c.name, EXTRACT(YEAR FROM o.order_date)
+HAVING SUM(o.total_amount) > 100
+ORDER BY total DESC NULLS LAST
+LIMIT 50;
+""",
+}
+SQL_STATEMENTS["long"] = "SELECT * FROM (" + " UNION ALL ".join(
+    f"SELECT order_id, total_amount FROM orders WHERE order_date >= NOW() - INTERVAL '{n} days'"
+    for n in range(1, 201)
+) + ") AS recent;"
+
+
+def _timeit(fn, min_time, repeat):
+    """(seconds per call for each repeat, loops per repeat)"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - started) / loops)
+    return times, loops
+
+
+def _result_frame(rows):
+    """A typical query result: ids, a category, amounts and dates"""
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(rows)
+    days = np.datetime64("2024-01-01") + rng.integers(0, 730, rows).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "order_id": np.arange(rows),
+        "category": rng.choice([f"category {i}" for i in range(50)], rows),
+        "total_amount": rng.gamma(2.0, 40.0, rows).round(2),
+        "order_date": np.datetime_as_string(days),
+    })
+
+
+def _result_database(rows):
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    _result_frame(rows).to_sql("orders", conn, index=False)
+    return conn
+
+
+def benchmarks(app, max_rows):
+    """(name, setup) pairs; setup() returns the function to time"""
+    import charts
+    from engines import SQLiteEngine
+
+    cases = []
+    for size, response in RESPONSES.items():
+        cases.append((f"extract_reasoning_and_sql[{size}]",
+                      lambda response=response: lambda: app.extract_reasoning_and_sql(response)))
+    for size, sql in SQL_STATEMENTS.items():
+        cases.append((f"preprocess_sql_for_sqlite[{size}]",
+                      lambda sql=sql: lambda: app.preprocess_sql_for_sqlite(sql)))
+    for rows in (r for r in ROW_COUNTS if r <= max_rows):
+        def read(rows=rows):
+            engine = SQLiteEngine(_result_database(rows), threading.Lock())
+            return lambda: engine.execute("SELECT * FROM orders")
+
+        def to_json(rows=rows):
+            df = _result_frame(rows)
+            return lambda: df.to_json(orient="records")
+
+        def prepare_bar(rows=rows):
+            df = _result_frame(rows)[["category", "total_amount"]]
+            return lambda: charts.prepare_chart(df)
+
+        def prepare_scatter(rows=rows):
+            df = _result_frame(rows)[["order_id", "total_amount"]].sample(frac=1, random_state=0)
+            return lambda: charts.prepare_chart(df)
+
+        cases += [
+            (f"read_result[{rows}]", read),
+            (f"results_to_json[{rows}]", to_json),
+            (f"prepare_chart_bar[{rows}]", prepare_bar),
+            (f"prepare_chart_scatter[{rows}]", prepare_scatter),
+        ]
+    # Rendering works on prepared (reduced) data, so its size is bounded
+    for rows in (r for r in ROW_COUNTS if r <= max_rows):
+        def render(rows=rows):
+            df = _result_frame(rows)[["order_id", "total_amount"]].sample(frac=1, random_state=0)
+            spec, data = charts.prepare_chart(df)
+            source = charts.chart_source(data, spec)
+            return lambda: charts.render_chart(source, "png")
+        cases.append((f"render_chart_png[{rows}]", render))
+    return cases
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_fingerprint():
+    """Runs are only compared with runs from the same machine and Python"""
+    description = f"{platform.node()}|{platform.machine()}|{platform.processor()}|{platform.python_version()}"
+    return hashlib.sha256(description.encode()).hexdigest()[:12]
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def pick_reference(history, machine, commit=None):
+    for run in reversed(history):
+        if run["machine"] == machine and (commit is None or (run["commit"] or "").startswith(commit)):
+            return run
+    return None
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g}{unit}"
+    return f"{seconds / 1e-9:.3g}ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filter", help="Only run benchmarks whose name matches this regular expression")
+    parser.add_argument("--max-rows", type=int, default=ROW_COUNTS[-1])
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timed repeat, at least")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Don't append this run to the history")
+    parser.add_argument("--compare", help="Compare with the latest run of this commit instead of the previous run")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Slowdown to flag, as a fraction")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    # Before importing main: a throwaway state store and no background work
+    state_dir = tempfile.mkdtemp(prefix="nl2sql-microbench-")
+    os.environ.update({
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "WARMUP_SCHEMAS": "",
+        "WARMUP_MODELS": "",
+        "EXECUTION_WORKERS": "0",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("HUGGINGFACE_API_TOKEN", "microbench")
+    app = importlib.import_module("main")
+
+    cases = benchmarks(app, args.max_rows)
+    if args.filter:
+        cases = [(name, setup) for name, setup in cases if re.search(args.filter, name)]
+    if args.list:
+        print("\n".join(name for name, _ in cases))
+        return 0
+
+    machine = machine_fingerprint()
+    history = load_history(args.history)
+    reference = pick_reference(history, machine, args.compare)
+    previous = {result["name"]: result for result in reference["results"]} if reference else {}
+    if args.compare and reference is None:
+        print(f"No earlier run of {args.compare} on this machine in {args.history}")
+
+    results, regressions = [], []
+    print(f"{'benchmark':<38} {'median':>10} {'best':>10} {'loops':>8}  change")
+    for name, setup in cases:
+        fn = setup()
+        times, loops = _timeit(fn, args.min_time, args.repeat)
+        result = {"name": name, "median": statistics.median(times), "best": min(times), "loops": loops}
+        results.append(result)
+        change = ""
+        before = previous.get(name)
+        if before:
+            # Best times are the least affected by other load on the machine
+            ratio = result["best"] / before["best"] - 1
+            change = f"{ratio:+.1%}"
+            if ratio > args.threshold:
+                change += "  SLOWER"
+                regressions.append(f"{name} {ratio:+.1%} ({_format_seconds(before['best'])} -> "
+                                   f"{_format_seconds(result['best'])})")
+            elif ratio < -args.threshold:
+                change += "  faster"
+        print(f"{name:<38} {_format_seconds(result['median']):>10} {_format_seconds(result['best']):>10} "
+              f"{loops:>8}  {change}", flush=True)
+
+    if reference:
+        print(f"compared with {reference['commit'] or 'an unknown commit'} from {reference['timestamp']}")
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a") as history_file:
+            history_file.write(json.dumps({
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "commit": _git_commit(),
+                "machine": machine,
+                "python": platform.python_version(),
+                "results": results,
+            }) + "\n")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+End-to-end NL-to-SQL benchmark: execution-match accuracy and stage timings.
+
+Runs every question in benchmarks/corpus.json through POST /generate_sql
+(in-process, with execution) and checks the generated SQL by running it
+next to the case's gold SQL on the same schema database. The two results
+must contain the same rows, in any order (execution match). A case can give
+`gold_rows` instead of `gold_sql`. Stage timings come from each response's
+Server-Timing header (see tracing.py).
+
+Model calls are served from cassettes, benchmarks/cassettes/<schema>.json,
+keyed by model, endpoint and prompt. Runs are therefore deterministic and
+need neither a token nor the network:
+
+    python nl2sql_benchmark.py                    # replay, compare with the baseline
+    python nl2sql_benchmark.py --record missing   # call the models for calls not recorded yet
+    python nl2sql_benchmark.py --record all       # re-record everything
+    python nl2sql_benchmark.py --save-baseline    # make this run the baseline
+
+Recording calls the real models (HUGGINGFACE_API_TOKEN), or HF_INFERENCE_URL
+when it is set. A change to a prompt changes its key, so replaying reports
+the calls that are missing from the cassettes; record them with
+`--record missing`. Each run is compared with benchmarks/baseline.json. The
+comparison flags lower accuracy, cases that no longer match and stages that
+got slower. The exit status is non-zero when there are regressions or
+missing calls.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, "corpus.json")
+CASSETTE_DIR = os.path.join(BENCHMARK_DIR, "cassettes")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+SERVER_TIMING_ENTRY = re.compile(r"([^;,\s]+);dur=([\d.]+)")
+
+
+class CassetteMiss(Exception):
+    """Raised when replaying a model call that was never recorded"""
+
+
+class RecordedError(Exception):
+    """A model call that failed when it was recorded, failing the same way again"""
+
+
+class Cassettes:
+    """Recorded model responses, one file per schema"""
+
+    def __init__(self, directory, record=None):
+        self.directory = directory
+        self.record = record  # None (replay), "missing" or "all"
+        self.schema = None
+        self.misses = {}  # key -> (schema, model, endpoint)
+        self.recorded = 0
+        self._tapes = {}
+        self._changed = set()
+
+    def _tape(self, schema):
+        if schema not in self._tapes:
+            path = os.path.join(self.directory, f"{schema}.json")
+            tape = {}
+            if self.record != "all" and os.path.exists(path):
+                with open(path) as tape_file:
+                    tape = json.load(tape_file)
+            self._tapes[schema] = tape
+        return self._tapes[schema]
+
+    @staticmethod
+    def key(model, endpoint, prompt):
+        return hashlib.sha256(json.dumps([model, endpoint, prompt]).encode()).hexdigest()[:24]
+
+    def play(self, model, endpoint, prompt, call):
+        """The recorded response text for a call, recording it with `call()` if allowed"""
+        tape = self._tape(self.schema)
+        key = self.key(model, endpoint, prompt)
+        if key not in tape:
+            if self.record is None:
+                self.misses[key] = (self.schema, model, endpoint)
+                raise CassetteMiss(f"No recorded {endpoint} response from {model}")
+            entry = {"model": model, "endpoint": endpoint, "prompt_start": prompt[:120]}
+            try:
+                entry["response"] = call()
+            except Exception as e:
+                entry["error"] = str(e)
+            tape[key] = entry
+            self._changed.add(self.schema)
+            self.recorded += 1
+        entry = tape[key]
+        if "error" in entry:
+            raise RecordedError(entry["error"])
+        return entry["response"]
+
+    def client_factory(self, real_factory):
+        """A factory for main.INFERENCE_CLIENT_FACTORY serving calls from the cassettes"""
+        cassettes = self
+
+        class CassetteClient:
+            def __init__(self, model, token):
+                self.model = model
+                self.token = token
+                self._real = None
+
+            def _client(self):
+                if self._real is None:
+                    self._real = real_factory(self.model, self.token)
+                return self._real
+
+            def chat_completion(self, messages, **params):
+                prompt = "\n\n".join(message["content"] for message in messages)
+
+                def call():
+                    response = self._client().chat_completion(messages=messages, **params)
+                    return response.choices[0].message.content
+
+                content = cassettes.play(self.model, "chat_completion", prompt, call)
+                return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+            def text_generation(self, prompt, **params):
+                return cassettes.play(self.model, "text_generation", prompt,
+                                      lambda: self._client().text_generation(prompt, **params))
+
+        return CassetteClient
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for schema in sorted(self._changed):
+            with open(os.path.join(self.directory, f"{schema}.json"), "w") as tape_file:
+                json.dump(self._tapes[schema], tape_file, indent=1, sort_keys=True)
+                tape_file.write("\n")
+
+
+def _normalize(rows):
+    """Rows as a multiset, with floats rounded so equal aggregates compare equal"""
+    return Counter(tuple(round(value, 4) if isinstance(value, float) else value for value in row) for row in rows)
+
+
+def _run_sql(app, schema, sql):
+    conn = app.initialize_schema_database(schema)
+    with app.DB_LOCKS[schema]:
+        return conn.execute(app.preprocess_sql_for_sqlite(sql)).fetchall()
+
+
+def parse_server_timing(header):
+    return {name: float(ms) for name, ms in SERVER_TIMING_ENTRY.findall(header or "")}
+
+
+def run_case(app, client, case, repeat, warmup=True):
+    """Generate SQL for a case `repeat` times; returns its result with median stage timings
+
+    With `warmup`, an extra first run (cold caches, first execution of the
+    query) is left out of the timings.
+    """
+    timings = []
+    body = None
+    for _ in range(repeat + (1 if warmup else 0)):
+        response = client.post("/generate_sql", json={
+            "question": case["question"], "schema_name": case["schema"],
+            "include_reasoning": True, "execute_query": True,
+        })
+        if response.status_code != 200:
+            return {"id": case["id"], "match": False, "error": f"HTTP {response.status_code}: {response.text[:200]}"}
+        body = response.json()
+        timings.append(parse_server_timing(response.headers.get("server-timing")))
+    if warmup:
+        timings = timings[1:]
+
+    result = {"id": case["id"], "sql": body["sql"], "model": body["model"]}
+    stages = {name for timing in timings for name in timing}
+    result["stages_ms"] = {name: round(statistics.median(t.get(name, 0.0) for t in timings), 3) for name in stages}
+    try:
+        gold = case["gold_rows"] if "gold_rows" in case else _run_sql(app, case["schema"], case["gold_sql"])
+        predicted = _run_sql(app, case["schema"], body["sql"])
+        result["match"] = _normalize(predicted) == _normalize(gold)
+    except Exception as e:
+        result["match"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def summarize(results):
+    stage_names = sorted({name for result in results for name in result.get("stages_ms", {})})
+    timed = [result for result in results if "stages_ms" in result]
+    return {
+        "cases": len(results),
+        "matched": sum(1 for result in results if result["match"]),
+        "accuracy": round(sum(1 for result in results if result["match"]) / len(results), 4) if results else 0.0,
+        "stages_mean_ms": {
+            name: round(statistics.mean(result["stages_ms"].get(name, 0.0) for result in timed), 3)
+            for name in stage_names
+        } if timed else {},
+        "results": {result["id"]: result for result in results},
+    }
+
+
+def compare(report, baseline, accuracy_tolerance, latency_tolerance, min_delta_ms):
+    """(regressions, improvements) of a run against the baseline"""
+    regressions, improvements = [], []
+    # Over the cases both runs have, so a run of some of the cases compares fairly
+    common = [case_id for case_id in report["results"] if case_id in baseline["results"]]
+    if common:
+        accuracy = sum(report["results"][case_id]["match"] for case_id in common) / len(common)
+        baseline_accuracy = sum(baseline["results"][case_id]["match"] for case_id in common) / len(common)
+        if accuracy < baseline_accuracy - accuracy_tolerance:
+            regressions.append(f"accuracy {accuracy:.1%} < baseline {baseline_accuracy:.1%} "
+                               f"on {len(common)} cases")
+    for case_id, result in report["results"].items():
+        before = baseline["results"].get(case_id)
+        if before is None:
+            continue
+        if before["match"] and not result["match"]:
+            regressions.append(f"{case_id} no longer matches ({result.get('error') or result.get('sql')})")
+        elif result["match"] and not before["match"]:
+            improvements.append(f"{case_id} now matches")
+    # Stage means over the same cases too
+    timed = [case_id for case_id in common
+             if "stages_ms" in report["results"][case_id] and "stages_ms" in baseline["results"][case_id]]
+    for name in report["stages_mean_ms"]:
+        if not timed or not any(name in baseline["results"][case_id]["stages_ms"] for case_id in timed):
+            continue
+        ms, before = (
+            statistics.mean(run["results"][case_id]["stages_ms"].get(name, 0.0) for case_id in timed)
+            for run in (report, baseline)
+        )
+        if ms > before * (1 + latency_tolerance) and ms - before > min_delta_ms:
+            regressions.append(f"stage {name} slower: {ms:.2f}ms vs {before:.2f}ms")
+        elif ms < before / (1 + latency_tolerance) and before - ms > min_delta_ms:
+            improvements.append(f"stage {name} faster: {ms:.2f}ms vs {before:.2f}ms")
+    return regressions, improvements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--record", choices=["missing", "all"], help="Call the models and record their responses")
+    parser.add_argument("--schemas", help="Comma-separated schemas to run (default: all in the corpus)")
+    parser.add_argument("--cases", help="Comma-separated case ids to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; timings are the median")
+    parser.add_argument("--cassettes", default=CASSETTE_DIR, help="Directory of cassette files")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the baseline")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0)
+    parser.add_argument("--latency-tolerance", type=float, default=0.25,
+                        help="Flag stages slower than the baseline by more than this fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore stage timing changes smaller than this")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as corpus_file:
+        cases = json.load(corpus_file)
+    if args.schemas:
+        cases = [case for case in cases if case["schema"] in args.schemas.split(",")]
+    if args.cases:
+        cases = [case for case in cases if case["id"] in args.cases.split(",")]
+
+    state_dir = tempfile.mkdtemp(prefix="nl2sql-benchmark-")
+    # Before importing main: a throwaway state store, no warm-up, everything
+    # in-process, and no semantic cache (each case runs more than once)
+    os.environ.update({
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "WARMUP_SCHEMAS": "",
+        "WARMUP_MODELS": "",
+        "EXECUTION_WORKERS": "0",
+        "SEMANTIC_CACHE_ENABLED": "false",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("HUGGINGFACE_API_TOKEN", "replay")
+    app = importlib.import_module("main")
+    from fastapi.testclient import TestClient
+
+    cassettes = Cassettes(args.cassettes, args.record)
+    app.INFERENCE_CLIENT_FACTORY = cassettes.client_factory(app.hub_inference_client)
+
+    results = []
+    started = time.perf_counter()
+    with TestClient(app.app) as client:
+        for schema in dict.fromkeys(case["schema"] for case in cases):
+            app.warm_schema(schema)
+        for case in cases:
+            cassettes.schema = case["schema"]
+            result = run_case(app, client, case, 1 if args.record else args.repeat, warmup=not args.record)
+            results.append(result)
+            total = result.get("stages_ms", {}).get("total", 0.0)
+            print(f"{case['id']:<14} {'match' if result['match'] else 'MISS ':<6} {total:>9.1f}ms  "
+                  f"{result.get('error') or ' '.join(result.get('sql', '').split())[:80]}")
+    if args.record:
+        cassettes.save()
+        print(f"recorded {cassettes.recorded} model calls")
+
+    report = summarize(results)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    print(f"accuracy: {report['matched']}/{report['cases']} ({report['accuracy']:.1%})")
+    print("stage means: " + ", ".join(f"{name} {ms:.2f}ms" for name, ms in
+                                      sorted(report["stages_mean_ms"].items(), key=lambda item: -item[1])))
+
+    failures = []
+    if cassettes.misses:
+        failures.append(f"{len(cassettes.misses)} model calls are not in the cassettes "
+                        f"(prompts changed?); record them with --record missing")
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions, improvements = compare(report, baseline, args.accuracy_tolerance,
+                                            args.latency_tolerance, args.min_delta_ms)
+        report["regressions"], report["improvements"] = regressions, improvements
+        for improvement in improvements:
+            print(f"better: {improvement}")
+        failures.extend(regressions)
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=1, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"saved baseline to {args.baseline}")
+    report["failures"] = failures
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+On-demand CPU and memory profiling for a running server.
+
+SamplingProfiler takes a snapshot of every thread's Python stack at a fixed
+interval (sys._current_frames) for a given number of seconds and counts
+identical stacks. The result is in the collapsed-stack format, one
+`thread;outer frame;...;inner frame count` line per stack, which
+flamegraph.pl, speedscope and similar tools read directly. Sampling costs
+one stack walk per thread per interval, and nothing when not running.
+
+MemoryProfiler drives tracemalloc: it starts tracing on the first snapshot,
+keeps the last few snapshots, and reports the top allocation sites of a
+snapshot or of the difference between two. A report can be limited to a
+scope (named code regions such as a function or a class): only allocations
+made while one of its frames was on the stack count, grouped by the line in
+the scope and the line that did the allocating. tracemalloc slows
+allocation down while it runs, so stop() it when done.
+"""
+
+import inspect
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DEFAULT_INTERVAL_MS = 10
+DEFAULT_FRAMES = 25
+MAX_SNAPSHOTS = 5
+
+# Innermost frames of threads that are waiting rather than working (thread
+# pools, queues, the event loop's select); left out unless idle=True
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv"),
+    ("connection.py", "wait"),
+    ("handlers.py", "dequeue"),
+}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+def _short_path(filename):
+    """A file name relative to the sys.path entry it was imported from"""
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(entry) > len(best):
+            best = entry
+    return filename[len(best):].lstrip(os.sep) if best else filename
+
+
+class SamplingProfiler:
+    """Statistical profiler over all threads of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels = {}
+
+    def _label(self, code, lineno):
+        key = (code, lineno)
+        label = self._labels.get(key)
+        if label is None:
+            label = self._labels[key] = f"{code.co_name} ({_short_path(code.co_filename)}:{lineno})"
+        return label
+
+    def sample(self, seconds, interval_ms=DEFAULT_INTERVAL_MS, idle=False):
+        """Sample for `seconds`; returns (collapsed stacks text, sample count)"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds, interval_ms / 1000, idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds, interval, idle):
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(self._label(frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        return "\n".join(lines) + "\n" if lines else "", samples
+
+
+def code_ranges(*objects):
+    """(filename, first line, last line) of functions, classes or modules"""
+    ranges = []
+    for obj in objects:
+        obj = inspect.unwrap(obj)
+        lines, first = inspect.getsourcelines(obj)
+        ranges.append((inspect.getsourcefile(obj), max(first, 1), max(first, 1) + len(lines) - 1))
+    return ranges
+
+
+def _in_range(frame, ranges):
+    for filename, first, last in ranges:
+        if frame.filename == filename and first <= frame.lineno <= last:
+            return True
+    return False
+
+
+def _site(frame):
+    return f"{_short_path(frame.filename)}:{frame.lineno}"
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots, kept by id, and their top allocation sites"""
+
+    def __init__(self, frames=DEFAULT_FRAMES, scopes=None):
+        self.frames = frames
+        # name -> list of code_ranges()
+        self.scopes = scopes or {}
+        self._snapshots = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Take a snapshot (starting tracemalloc if needed); returns its id"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            snapshot = tracemalloc.take_snapshot()
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            for old_id in sorted(self._snapshots)[:-MAX_SNAPSHOTS]:
+                del self._snapshots[old_id]
+            return snapshot_id
+
+    def _get(self, snapshot_id):
+        try:
+            return self._snapshots[snapshot_id][1]
+        except KeyError:
+            raise KeyError(f"No snapshot {snapshot_id}") from None
+
+    def _group(self, snapshot, scope):
+        """{(scope line, allocating line): [bytes, blocks]} for traces inside the scope"""
+        if scope is not None and scope not in self.scopes:
+            raise KeyError(f"Unknown scope '{scope}'. Available: {', '.join(self.scopes)}")
+        ranges = self.scopes.get(scope)
+        groups = {}
+        for trace in snapshot.traces:
+            traceback = trace.traceback
+            if ranges is None:
+                key = (None, _site(traceback[-1]))
+            else:
+                # Tracebacks go from the oldest frame to the most recent
+                inside = [frame for frame in traceback if _in_range(frame, ranges)]
+                if not inside:
+                    continue
+                key = (_site(inside[-1]), _site(traceback[-1]))
+            entry = groups.setdefault(key, [0, 0])
+            entry[0] += trace.size
+            entry[1] += 1
+        return groups
+
+    @staticmethod
+    def _site_entry(key, size, count):
+        entry = {"allocated_at": key[1], "size_bytes": size, "blocks": count}
+        if key[0] is not None:
+            entry["scope_line"] = key[0]
+        return entry
+
+    def top(self, snapshot_id, scope=None, limit=20):
+        """The largest allocation sites in a snapshot"""
+        groups = self._group(self._get(snapshot_id), scope)
+        ordered = sorted(groups.items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            "snapshot": snapshot_id,
+            "scope": scope,
+            "total_bytes": sum(size for size, _ in groups.values()),
+            "sites": [self._site_entry(key, size, count) for key, (size, count) in ordered[:limit]],
+        }
+
+    def diff(self, base_id, snapshot_id, scope=None, limit=20):
+        """Allocation sites that grew or shrank the most between two snapshots"""
+        before = self._group(self._get(base_id), scope)
+        after = self._group(self._get(snapshot_id), scope)
+        changes = []
+        for key in before.keys() | after.keys():
+            size, count = after.get(key, (0, 0))
+            old_size, old_count = before.get(key, (0, 0))
+            if size != old_size or count != old_count:
+                entry = self._site_entry(key, size, count)
+                entry["size_diff_bytes"] = size - old_size
+                entry["blocks_diff"] = count - old_count
+                changes.append(entry)
+        changes.sort(key=lambda entry: abs(entry["size_diff_bytes"]), reverse=True)
+        return {
+            "base": base_id,
+            "snapshot": snapshot_id,
+            "scope": scope,
+            "total_diff_bytes": sum(entry["size_diff_bytes"] for entry in changes),
+            "sites": changes[:limit],
+        }
+
+    def status(self):
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": self.frames,
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "snapshots": [{"id": i, "taken_at": taken_at} for i, (taken_at, _) in sorted(self._snapshots.items())],
+            "scopes": sorted(self.scopes),
+        }
+
+    def stop(self):
+        """Stop tracemalloc and drop the snapshots"""
+        with self._lock:
+            self._snapshots.clear()
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
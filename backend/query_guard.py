@@ -0,0 +1,259 @@
+"""
+Pre-execution cost guard for generated SQL.
+
+Plans a statement with EXPLAIN QUERY PLAN before it runs and estimates how
+many rows it will visit, using sqlite_stat1 (when ANALYZE has run) and table
+sizes. A table scan that the WHERE clause filters is assumed to pass a tenth
+of its rows on. Statements over the cost budget are rejected, or given a LIMIT when
+the plan streams rows and a LIMIT actually bounds the work; large unbounded
+result sets get a LIMIT as well.
+"""
+
+import math
+import re
+
+from index_advisor import explain_query_plan, split_clauses, table_aliases
+
+DEFAULT_COST_BUDGET = 50_000_000
+DEFAULT_MAX_ROWS = 10_000
+
+# Rows SQLite itself assumes an equality lookup returns when there are no stats
+DEFAULT_ROWS_PER_LOOKUP = 10
+
+# Fraction of an index a range constraint (col > ?) is assumed to select
+RANGE_SELECTIVITY = 0.25
+
+# Fraction of a scanned table's rows assumed to pass the WHERE clause
+FILTER_SELECTIVITY = 0.1
+
+# Size assumed for a subquery or CTE whose rows we couldn't estimate
+DEFAULT_SUBQUERY_ROWS = 1_000
+
+SEARCH_PATTERN = re.compile(
+    r"^SEARCH (\w+)(?: AS \w+)? USING (?:(AUTOMATIC )?(?:COVERING |PARTIAL )*INDEX (\w+)|INTEGER PRIMARY KEY)\s*\((.*)\)",
+    re.IGNORECASE,
+)
+SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE |SUBQUERY )?\(?(\S+?)\)?(?: AS \w+)?(?: |$)", re.IGNORECASE)
+COLUMN_REF_PATTERN = re.compile(r'(?:"?(\w+)"?\.)?"?(\w+)"?')
+AGGREGATE_PATTERN = re.compile(r"\b(COUNT|SUM|AVG|MIN|MAX|GROUP_CONCAT|TOTAL)\s*\(|\bDISTINCT\b", re.IGNORECASE)
+
+
+def strip_comments(sql):
+    """Remove -- and /* */ comments, leaving string literals and quoted names alone"""
+    result, i, length = [], 0, len(sql)
+    while i < length:
+        char = sql[i]
+        if char in "'\"`[":
+            close = "]" if char == "[" else char
+            end = sql.find(close, i + 1)
+            # Doubled quotes inside a literal ('it''s') just continue it
+            while end != -1 and close != "]" and sql[end + 1:end + 2] == close:
+                end = sql.find(close, end + 2)
+            end = length if end == -1 else end + 1
+            result.append(sql[i:end])
+            i = end
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = length if end == -1 else end
+            result.append(" ")
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            result.append(" ")
+        else:
+            result.append(char)
+            i += 1
+    return "".join(result)
+
+
+class QueryRejected(Exception):
+    """Raised when a statement's estimated cost is over the budget"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+class QueryGuard:
+    """Estimates statement cost from the query plan and enforces a budget"""
+
+    def __init__(self, cost_budget=DEFAULT_COST_BUDGET, max_rows=DEFAULT_MAX_ROWS, action="limit"):
+        self.cost_budget = cost_budget
+        self.max_rows = max_rows
+        self.action = action
+        self._row_counts = {}
+
+    def forget(self, schema_name):
+        """Drop cached table sizes for a schema (e.g. after its database is rebuilt)"""
+        self._row_counts = {k: v for k, v in self._row_counts.items() if k[0] != schema_name}
+
+    def prime(self, schema_name, conn):
+        """Count the rows of tables ANALYZE has no statistics for, ahead of the first query"""
+        table_rows, _ = self._statistics(schema_name, conn)
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in tables:
+            self._table_rows(schema_name, conn, table, table_rows)
+        return len(tables)
+
+    def _statistics(self, schema_name, conn):
+        """Table row counts and per-index rows-per-key from sqlite_stat1"""
+        table_rows, index_stats = {}, {}
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+                numbers = [int(n) for n in stat.split() if n.isdigit()]
+                if not numbers:
+                    continue
+                table_rows[table] = numbers[0]
+                if index:
+                    index_stats[index] = numbers
+        return table_rows, index_stats
+
+    def _table_rows(self, schema_name, conn, table, table_rows):
+        if table in table_rows:
+            return table_rows[table]
+        key = (schema_name, table)
+        if key not in self._row_counts:
+            try:
+                self._row_counts[key] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            except Exception:
+                self._row_counts[key] = DEFAULT_SUBQUERY_ROWS
+        return self._row_counts[key]
+
+    def estimate(self, schema_name, conn, sql):
+        """Plan a statement and estimate the rows it returns and the rows it visits"""
+        plan = explain_query_plan(conn, sql)
+        aliases = table_aliases(sql)
+        table_rows, index_stats = self._statistics(schema_name, conn)
+        children = {}
+        for step in plan:
+            children.setdefault(step["parent"], []).append(step)
+        materialized = {}
+        filter_refs = self._where_references(sql)
+        table_columns = {}
+
+        def filtered(name):
+            """Whether the WHERE clause constrains a scanned table (or alias)"""
+            table = aliases.get(name.lower(), name)
+            if table not in table_columns:
+                table_columns[table] = {row[1].lower() for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            return any(
+                qualifier in (name.lower(), table.lower()) if qualifier else column in table_columns[table]
+                for qualifier, column in filter_refs
+            )
+
+        def rows_of(name):
+            if name in materialized:
+                return materialized[name]
+            table = aliases.get(name.lower(), name)
+            return self._table_rows(schema_name, conn, table, table_rows)
+
+        def search_rows(match):
+            name, automatic, index, constraints = match.groups()
+            total = rows_of(name)
+            equalities = len(re.findall(r"=\?", constraints)) - len(re.findall(r"[<>]=\?", constraints))
+            has_range = bool(re.search(r"[<>]", constraints))
+            if index is None:  # INTEGER PRIMARY KEY
+                rows = 1 if equalities else total
+            elif index in index_stats and equalities:
+                stat = index_stats[index]
+                rows = stat[min(equalities, len(stat) - 1)]
+            elif equalities:
+                rows = min(total, DEFAULT_ROWS_PER_LOOKUP)
+            else:
+                rows = total
+            if has_range:
+                rows *= RANGE_SELECTIVITY
+            # An automatic index is built by scanning the whole table first
+            build_cost = total if automatic else 0
+            return max(rows, 1), build_cost
+
+        def walk(steps, outer_rows):
+            rows, cost = outer_rows, 0.0
+            for step in steps:
+                detail = step["detail"]
+                upper = detail.upper()
+                kids = children.get(step["id"], [])
+                search = SEARCH_PATTERN.match(detail)
+                scan = SCAN_PATTERN.match(detail)
+                if search:
+                    step_rows, build_cost = search_rows(search)
+                    cost += build_cost
+                    rows *= step_rows
+                    cost += rows
+                elif scan:
+                    rows *= max(rows_of(scan.group(1)), 1)
+                    cost += rows
+                    # Every row is visited, but only the ones matching the filter go on
+                    if scan.group(1).lower() not in materialized and filtered(scan.group(1)):
+                        rows *= FILTER_SELECTIVITY
+                elif upper.startswith("USE TEMP B-TREE") or "USING TEMP B-TREE" in upper:
+                    cost += rows * math.log2(max(rows, 2))
+                elif upper.startswith(("CO-ROUTINE", "MATERIALIZE")):
+                    sub_rows, sub_cost = walk(kids, 1)
+                    materialized[detail.split()[-1].lower()] = sub_rows
+                    cost += sub_cost
+                elif upper.startswith("COMPOUND"):
+                    compound_rows = 0
+                    for branch in kids:
+                        branch_rows, branch_cost = walk(children.get(branch["id"], []), 1)
+                        compound_rows += branch_rows
+                        cost += branch_cost
+                    rows *= max(compound_rows, 1)
+                elif kids:
+                    sub_rows, sub_cost = walk(kids, 1)
+                    # A correlated subquery runs once per outer row
+                    cost += sub_cost * (rows if "CORRELATED" in upper else 1)
+            return rows, cost
+
+        estimated_rows, estimated_cost = walk(children.get(0, []), 1)
+        return {
+            "plan": [step["detail"] for step in plan],
+            "estimated_rows": int(estimated_rows),
+            "estimated_cost": int(estimated_cost),
+            "cost_budget": self.cost_budget,
+            "used_statistics": bool(index_stats),
+        }
+
+    @staticmethod
+    def _where_references(sql):
+        """(qualifier or None, column) pairs, lowercased, referenced by the top-level WHERE"""
+        where = split_clauses(strip_comments(sql)).get("WHERE", "")
+        where = re.sub(r"'(?:[^']|'')*'", "''", where)  # Not inside string literals
+        return [((qualifier or "").lower() or None, column.lower())
+                for qualifier, column in COLUMN_REF_PATTERN.findall(where)]
+
+    def check(self, schema_name, conn, sql):
+        """Estimate a statement and apply the budget before it is executed
+
+        Returns the (possibly LIMIT-ed) SQL and the estimate; raises
+        QueryRejected when the statement is over budget and can't be bounded.
+        """
+        estimate = self.estimate(schema_name, conn, sql)
+        # Comments could hide a LIMIT, or swallow one appended after them
+        statement = strip_comments(sql).strip().rstrip(";").strip()
+        clauses = split_clauses(statement)
+        has_limit = "LIMIT" in clauses
+        aggregated = "GROUP BY" in clauses or bool(AGGREGATE_PATTERN.search(clauses.get("SELECT", "")))
+        # Only a plan that streams rows (no sort or grouping) stops early at a LIMIT
+        streams = not aggregated and not any("TEMP B-TREE" in d.upper() for d in estimate["plan"])
+        estimate["limit_injected"] = False
+
+        if estimate["estimated_cost"] > self.cost_budget:
+            if not (self.action == "limit" and streams and not has_limit):
+                raise QueryRejected(
+                    f"Query rejected: estimated cost of {estimate['estimated_cost']:,} rows visited "
+                    f"exceeds the budget of {self.cost_budget:,}",
+                    estimate,
+                )
+            estimate["limit_injected"] = True
+        elif estimate["estimated_rows"] > self.max_rows and not has_limit and not aggregated:
+            estimate["limit_injected"] = True
+
+        if estimate["limit_injected"]:
+            sql = f"{statement} LIMIT {self.max_rows};"
+        return sql, estimate
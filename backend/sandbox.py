@@ -0,0 +1,208 @@
+"""
+Per-session sandbox copies of the schema databases.
+
+A sandbox is a private, writable clone of a schema's database, where a user
+can create temp tables, insert what-if rows or drop things without anyone
+else seeing it. Clones are made from an image of the schema database that is
+serialized once per schema version (Connection.serialize, Python 3.11+), so
+creating one is a memcpy rather than a rebuild. Without serialize, the
+backup API copies the live database instead.
+
+Sandboxes are kept least recently used first: ones idle for longer than the
+idle timeout are dropped, and the oldest are evicted while the sandboxes
+and images together would exceed the memory cap. A sandbox's main and temp
+databases are each limited to that cap with max_page_count (temp tables
+are kept in memory too), so a runaway INSERT fails with "database or disk
+is full" instead of using up the process's memory.
+"""
+
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_IDLE_SECONDS = 15 * 60
+
+
+class SandboxLimit(Exception):
+    """Raised when a sandbox can't fit within the memory cap"""
+
+
+# Pragmas that take an argument but only describe the schema (the cost guard
+# reads table_info)
+INTROSPECTION_PRAGMAS = {"table_info", "table_xinfo", "index_list", "index_info", "index_xinfo", "foreign_key_list"}
+
+
+def _authorize(action, arg1, arg2, db_name, source):
+    # No reaching outside the in-memory copy (ATTACH, VACUUM INTO) and no
+    # changing pragmas such as max_page_count; reading pragmas is fine
+    if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_PRAGMA and arg2 is not None and arg1.lower() not in INTROSPECTION_PRAGMAS:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def database_size(conn):
+    """Bytes used by a connection's main and temp databases"""
+    size = 0
+    for schema in ("main", "temp"):
+        page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+        size += page_count * page_size
+    return size
+
+
+class Sandbox:
+    """One session's private copy of a schema database"""
+
+    def __init__(self, schema_name, version, conn, id_prefix=""):
+        self.id = id_prefix + uuid.uuid4().hex
+        self.schema_name = schema_name
+        self.version = version
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.size = database_size(conn)
+
+    def info(self):
+        return {
+            "id": self.id,
+            "schema_name": self.schema_name,
+            "version": self.version,
+            "size_bytes": self.size,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+
+
+class SandboxPool:
+    """Creates sandboxes from cached schema images and bounds their memory"""
+
+    def __init__(self, connect, max_bytes=DEFAULT_MAX_BYTES, idle_seconds=DEFAULT_IDLE_SECONDS, id_prefix=""):
+        # `connect()` opens a connection with the settings schema databases use
+        self.connect = connect
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.id_prefix = id_prefix  # Starts every sandbox id, e.g. to say which process holds it
+        self._sandboxes = OrderedDict()
+        self._images = {}
+        self._lock = threading.Lock()
+        self.serialize_supported = hasattr(sqlite3.Connection, "serialize")
+
+    def _used_bytes(self):
+        return sum(s.size for s in self._sandboxes.values()) + sum(len(i) for i in self._images.values())
+
+    def _expire(self):
+        now = time.time()
+        for sandbox_id, sandbox in list(self._sandboxes.items()):
+            if now - sandbox.last_used > self.idle_seconds:
+                del self._sandboxes[sandbox_id]
+
+    def _make_room(self, needed, keep=None):
+        """Evict least recently used sandboxes until `needed` more bytes fit
+
+        Nothing is evicted when `needed` couldn't fit even with every other
+        sandbox gone.
+        """
+        self._expire()
+        fixed = sum(len(i) for i in self._images.values())
+        if keep in self._sandboxes:
+            fixed += self._sandboxes[keep].size
+        if fixed + needed > self.max_bytes:
+            raise SandboxLimit(f"Sandboxes are limited to {self.max_bytes // (1024 * 1024)}MB in total")
+        for sandbox_id in list(self._sandboxes):
+            if self._used_bytes() + needed <= self.max_bytes:
+                break
+            if sandbox_id != keep:
+                del self._sandboxes[sandbox_id]
+
+    def _image(self, schema_name, version, source_conn, source_lock):
+        """(image, cached) for a schema version; new images are cached by _keep_image()"""
+        image = self._images.get((schema_name, version))
+        if image is not None:
+            return image, True
+        with source_lock:
+            return source_conn.serialize(), False
+
+    def _keep_image(self, schema_name, version, image):
+        # Only the latest version of each schema is cloned from
+        self._images = {k: v for k, v in self._images.items() if k[0] != schema_name}
+        self._images[(schema_name, version)] = image
+
+    def create(self, schema_name, version, source_conn, source_lock):
+        """Clone a schema's database into a new sandbox"""
+        conn = self.connect()
+        with self._lock:
+            if self.serialize_supported:
+                image, cached = self._image(schema_name, version, source_conn, source_lock)
+                needed = len(image)
+                if not cached:
+                    # The new image is kept too, replacing the schema's older one
+                    replaced = sum(len(v) for k, v in self._images.items() if k[0] == schema_name)
+                    needed += len(image) - replaced
+                self._make_room(needed)
+                conn.deserialize(image)
+                if not cached:
+                    self._keep_image(schema_name, version, image)
+            else:
+                with source_lock:
+                    self._make_room(database_size(source_conn))
+                    source_conn.backup(conn)
+            conn.execute("PRAGMA temp_store = MEMORY")
+            for schema in ("main", "temp"):
+                page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+                conn.execute(f"PRAGMA {schema}.max_page_count = {max(1, self.max_bytes // page_size)}")
+            conn.set_authorizer(_authorize)
+            sandbox = Sandbox(schema_name, version, conn, self.id_prefix)
+            self._sandboxes[sandbox.id] = sandbox
+        return sandbox
+
+    def get(self, sandbox_id):
+        """Return a sandbox and mark it as used, or None when it's gone"""
+        with self._lock:
+            self._expire()
+            sandbox = self._sandboxes.get(sandbox_id)
+            if sandbox is not None:
+                sandbox.last_used = time.time()
+                self._sandboxes.move_to_end(sandbox_id)
+            return sandbox
+
+    def resized(self, sandbox):
+        """Account for a sandbox's new size after it ran a statement"""
+        with self._lock:
+            sandbox.size = database_size(sandbox.conn)
+            if sandbox.id in self._sandboxes:
+                try:
+                    self._make_room(0, keep=sandbox.id)
+                except SandboxLimit:
+                    pass  # max_page_count already bounds the sandbox itself
+
+    def delete(self, sandbox_id):
+        with self._lock:
+            return self._sandboxes.pop(sandbox_id, None) is not None
+
+    def forget(self, schema_name):
+        """Drop a schema's cached image (existing sandboxes keep their copy)"""
+        with self._lock:
+            self._images = {k: v for k, v in self._images.items() if k[0] != schema_name}
+
+    def list(self):
+        with self._lock:
+            self._expire()
+            return [sandbox.info() for sandbox in self._sandboxes.values()]
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {
+                "sandboxes": len(self._sandboxes),
+                "images": len(self._images),
+                "used_bytes": self._used_bytes(),
+                "max_bytes": self.max_bytes,
+                "idle_seconds": self.idle_seconds,
+                "clone_method": "deserialize" if self.serialize_supported else "backup",
+            }
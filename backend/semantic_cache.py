@@ -0,0 +1,264 @@
+"""
+Semantic cache of generated SQL, matched on what a question means.
+
+Questions are turned into hashed feature vectors: word unigrams and bigrams
+plus character trigrams, taken after normalizing the text. Normalizing
+lowercases the text, drops filler words, maps common abbreviations and
+synonyms to one form ("avg" and "mean" to "average", "per" to "by", "dept"
+to "department") and strips plural endings. "avg salary per dept" and
+"what's the average salary by department" therefore end up with the same
+features. Each schema version has its own index, a matrix of normalized
+vectors searched by cosine similarity. An entry is a hit when it is at least
+`threshold` similar and its guard words match exactly. Guard words are the
+numbers, quoted strings, negations and direction words (most/least,
+before/after, ...) that flip a question's meaning without moving its vector
+much.
+
+A schema change starts a new, empty index for the new version. Callers still
+re-validate a hit's SQL before using it. Each index holds up to
+`max_entries` entries, evicting the least recently used.
+"""
+
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 1000
+DIMENSIONS = 1024
+# Query ids served from the cache that a false hit can still be reported for
+MAX_SERVED = 10_000
+
+PHRASES = [
+    (r"\bhow many\b", "number"),
+    (r"\bnumber of\b", "number"),
+    (r"\bgreater than\b", "above"),
+    (r"\bmore than\b", "above"),
+    (r"\bless than\b", "below"),
+    (r"\bfewer than\b", "below"),
+    (r"\bfor each\b", "by"),
+    (r"\bgrouped by\b", "by"),
+    (r"\bbroken down by\b", "by"),
+]
+SYNONYMS = {
+    "avg": "average", "mean": "average", "per": "by", "each": "by",
+    "dept": "department", "depts": "department", "emp": "employee", "emps": "employee",
+    "staff": "employee", "qty": "quantity", "amt": "amount", "num": "number", "count": "number",
+    "max": "maximum", "highest": "maximum", "largest": "maximum", "biggest": "maximum",
+    "min": "minimum", "lowest": "minimum", "smallest": "minimum",
+    "top": "most", "greatest": "most", "fewest": "least",
+    "sum": "total", "overall": "total", "pay": "salary", "wage": "salary", "earning": "salary",
+    "client": "customer", "purchase": "order", "bought": "order",
+}
+STOPWORDS = {
+    "a", "an", "the", "what", "whats", "is", "are", "was", "were", "be", "of", "for", "in", "on", "me",
+    "show", "list", "give", "get", "find", "display", "return", "please", "tell", "all", "i", "we",
+    "want", "need", "to", "see", "can", "you", "could", "would", "do", "does", "which", "who",
+    "there", "their", "its", "it", "that", "this", "these", "those", "with", "from", "and",
+    "has", "have", "had", "been", "yet", "currently",
+}
+# Words that change a question's answer without changing its vector much
+GUARD_WORDS = {
+    "not", "no", "without", "never", "except", "excluding", "exclude",
+    "most", "least", "maximum", "minimum", "above", "below", "before", "after",
+    "first", "last", "ascending", "descending", "asc", "desc", "oldest", "newest", "earliest", "latest",
+}
+LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokens(question):
+    """A question's normalized words"""
+    text = question.lower().replace("'", "").replace("’", "")
+    for pattern, replacement in PHRASES:
+        text = re.sub(pattern, replacement, text)
+    words = []
+    for word in WORD.findall(text):
+        word = SYNONYMS.get(word, word)
+        word = SYNONYMS.get(_stem(word), _stem(word))
+        if word not in STOPWORDS:
+            words.append(word)
+    return words
+
+
+def guard(question):
+    """What must match exactly between a question and a cached one"""
+    words = tokens(question)
+    literals = [literal.lower().strip("'\"") for literal in LITERAL.findall(question)]
+    return tuple(sorted(set(literals) | {word for word in words if word in GUARD_WORDS}))
+
+
+def features(question):
+    """Weighted hashed features of a question: {index: weight}"""
+    words = tokens(question)
+    weighted = Counter()
+    for word in words:
+        weighted[f"w:{word}"] += 1.0
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            weighted[f"c:{padded[i:i + 3]}"] += 0.25
+    for first, second in zip(words, words[1:]):
+        weighted[f"b:{first} {second}"] += 1.0
+    hashed = {}
+    for feature, weight in weighted.items():
+        digest = zlib.crc32(feature.encode())
+        index = digest % DIMENSIONS
+        sign = 1.0 if digest & 0x80000000 else -1.0  # Signed hashing evens out collisions
+        hashed[index] = hashed.get(index, 0.0) + sign * weight
+    return hashed
+
+
+def vectorize(question):
+    """A question's unit-length feature vector"""
+    import numpy as np
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for index, weight in features(question).items():
+        vector[index] = weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Index:
+    """One schema version's entries and their vectors, one row per entry"""
+
+    def __init__(self, version):
+        self.version = version
+        self.entries = []
+        self.matrix = None
+
+    def add(self, entry, vector):
+        import numpy as np
+        self.entries.append(entry)
+        self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+
+    def remove(self, position):
+        import numpy as np
+        del self.entries[position]
+        self.matrix = np.delete(self.matrix, position, axis=0) if self.entries else None
+
+
+class SemanticCache:
+    """Generated SQL per schema version, looked up by question similarity"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.counts = Counter()
+        self._indexes = {}  # schema -> _Index for its latest version
+        self._served = OrderedDict()  # query id -> (schema, entry id)
+        self._lock = threading.Lock()
+
+    def _index(self, schema_name, version):
+        index = self._indexes.get(schema_name)
+        if index is None or index.version != version:
+            index = self._indexes[schema_name] = _Index(version)
+        return index
+
+    def lookup(self, schema_name, version, question, accept=None):
+        """(entry, similarity) of the best acceptable match, or (None, best similarity)"""
+        vector = vectorize(question)
+        question_guard = guard(question)
+        with self._lock:
+            index = self._indexes.get(schema_name)
+            if index is None or index.version != version or index.matrix is None:
+                return None, 0.0
+            similarities = index.matrix @ vector
+            best = float(similarities.max())
+            for position in similarities.argsort()[::-1]:
+                similarity = float(similarities[position])
+                if similarity < self.threshold:
+                    break
+                entry = index.entries[position]
+                if entry["guard"] == question_guard and (accept is None or accept(entry)):
+                    entry["hits"] += 1
+                    entry["last_used"] = time.time()
+                    return entry, similarity
+            return None, best
+
+    def add(self, schema_name, version, question, **payload):
+        """Cache what was generated for a question; returns the entry"""
+        vector = vectorize(question)
+        entry = {
+            "id": uuid.uuid4().hex,
+            "question": question,
+            "guard": guard(question),
+            "hits": 0,
+            "created_at": time.time(),
+            "last_used": time.time(),
+            **payload,
+        }
+        with self._lock:
+            index = self._index(schema_name, version)
+            while len(index.entries) >= self.max_entries:
+                oldest = min(range(len(index.entries)), key=lambda i: index.entries[i]["last_used"])
+                index.remove(oldest)
+            index.add(entry, vector)
+        return entry
+
+    def discard(self, schema_name, entry_id):
+        with self._lock:
+            index = self._indexes.get(schema_name)
+            if index is None:
+                return False
+            for position, entry in enumerate(index.entries):
+                if entry["id"] == entry_id:
+                    index.remove(position)
+                    return True
+            return False
+
+    def served(self, query_id, schema_name, entry_id):
+        """Remember which entry answered a query, for report_false_hit()"""
+        with self._lock:
+            self._served[query_id] = (schema_name, entry_id)
+            while len(self._served) > MAX_SERVED:
+                self._served.popitem(last=False)
+
+    def report_false_hit(self, query_id):
+        """Count a wrong answer served from the cache and drop its entry"""
+        with self._lock:
+            served = self._served.pop(query_id, None)
+        if served is None:
+            return False
+        self.record("reported_false_hit")
+        self.discard(*served)
+        return True
+
+    def record(self, result):
+        """Count a lookup's result (hit, miss or rejected) or an audit's (audit_agreed or audit_disagreed)"""
+        with self._lock:
+            self.counts[result] += 1
+
+    def forget(self, schema_name):
+        with self._lock:
+            self._indexes.pop(schema_name, None)
+
+    def stats(self):
+        counts = self.counts
+        lookups = counts["hit"] + counts["miss"] + counts["rejected"]
+        audits = counts["audit_agreed"] + counts["audit_disagreed"]
+        with self._lock:
+            entries = {name: len(index.entries) for name, index in self._indexes.items()}
+        return {
+            "threshold": self.threshold,
+            "entries": entries,
+            "hits": counts["hit"],
+            "misses": counts["miss"],
+            "rejected": counts["rejected"],
+            "hit_rate": round(counts["hit"] / lookups, 4) if lookups else None,
+            "audits": audits,
+            "audit_disagreements": counts["audit_disagreed"],
+            "reported_false_hits": counts["reported_false_hit"],
+            # Estimated from audits of a sample of hits
+            "false_hit_rate": round(counts["audit_disagreed"] / audits, 4) if audits else None,
+        }
@@ -0,0 +1,126 @@
+"""
+Compile-only validation of generated SQL.
+
+Each schema gets a cached in-memory SQLite connection holding only its DDL (no
+rows). A statement is validated by compiling it there with EXPLAIN, which
+resolves every table, column and function without reading any data, so a typo
+is caught in microseconds instead of after a full execution round-trip.
+"""
+
+import sqlite3
+import threading
+import time
+import datetime
+import re
+
+from query_guard import strip_comments
+
+# SQLite's message for a misspelled table or column, e.g. "no such column: o.order_dte"
+UNKNOWN_NAME_PATTERN = re.compile(r"^no such (?:table|column): (?:\w+\.)?(\w+)$")
+
+# What compiling a query may do; anything else (e.g. the DELETE in
+# `WITH t AS (...) DELETE ...`) is refused while the statement is prepared
+READ_ONLY_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _read_only(action, arg1, arg2, db_name, source):
+    return sqlite3.SQLITE_OK if action in READ_ONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+
+class SQLValidator:
+    """Validates statements against empty copies of the schemas and keeps repair metrics"""
+
+    def __init__(self, preprocess=None):
+        # Same SQLite-compatibility rewriting that execution applies
+        self.preprocess = preprocess or (lambda sql: sql)
+        self._connections = {}
+        self._lock = threading.Lock()
+        self.metrics = {
+            "validations": 0,
+            "invalid": 0,
+            "validation_ms_total": 0.0,
+            "generations": 0,
+            "valid_first_try": 0,
+            "repaired": 0,
+            "repair_failed": 0,
+            "repair_attempts": 0,
+        }
+
+    def _connection(self, schema_name, schema_def):
+        key = (schema_name, hash(schema_def))
+        conn = self._connections.get(key)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.create_function("CURRENT_DATE", 0, lambda: datetime.datetime.now().strftime("%Y-%m-%d"))
+            conn.executescript(schema_def)
+            conn.set_authorizer(_read_only)
+            # Only one version of each schema is ever needed
+            self._connections = {k: v for k, v in self._connections.items() if k[0] != schema_name}
+            self._connections[key] = conn
+        return conn
+
+    def prime(self, schema_name, schema_def):
+        """Build the empty-schema connection ahead of the first validation"""
+        with self._lock:
+            self._connection(schema_name, schema_def)
+
+    def forget(self, schema_name):
+        """Drop the cached empty-schema connection for a schema"""
+        with self._lock:
+            self._connections = {k: v for k, v in self._connections.items() if k[0] != schema_name}
+
+    def validate(self, schema_name, schema_def, sql, catalog=None):
+        """Compile a statement against the schema without running it
+
+        Returns {"valid", "error", "validation_ms"}; `error` is SQLite's own
+        message (e.g. "no such column: o.order_dte") so it can be fed back to
+        the model verbatim, followed by the closest names in the schema's
+        `catalog` when one is given.
+        """
+        start = time.perf_counter()
+        error = None
+        statement = strip_comments(self.preprocess(sql.strip())).strip().rstrip(";").strip()
+        if not statement:
+            error = "The query is empty"
+        elif statement.split(None, 1)[0].upper() not in ("SELECT", "WITH"):
+            error = "Only SELECT queries are allowed"
+        else:
+            try:
+                with self._lock:
+                    self._connection(schema_name, schema_def).execute(f"EXPLAIN {statement}")
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                error = str(e)
+                if error == "not authorized":
+                    # A write inside a WITH statement
+                    error = "Only SELECT queries are allowed"
+                unknown = UNKNOWN_NAME_PATTERN.match(error)
+                suggestions = catalog.suggest(unknown.group(1)) if catalog and unknown else []
+                if suggestions:
+                    error += f" (did you mean {' or '.join(suggestions)}?)"
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.metrics["validations"] += 1
+        self.metrics["validation_ms_total"] += elapsed_ms
+        if error:
+            self.metrics["invalid"] += 1
+        return {"valid": error is None, "error": error, "validation_ms": elapsed_ms}
+
+    def record_outcome(self, attempts, valid):
+        """Count the result of one generation's validate-and-repair loop"""
+        self.metrics["generations"] += 1
+        self.metrics["repair_attempts"] += attempts
+        if valid and attempts == 0:
+            self.metrics["valid_first_try"] += 1
+        elif valid:
+            self.metrics["repaired"] += 1
+        else:
+            self.metrics["repair_failed"] += 1
+
+    def stats(self):
+        """Validation latency and repair success rates"""
+        metrics = dict(self.metrics)
+        validations = metrics["validations"] or 1
+        needed_repair = metrics["repaired"] + metrics["repair_failed"]
+        metrics["avg_validation_ms"] = metrics["validation_ms_total"] / validations
+        metrics["repair_success_rate"] = metrics["repaired"] / needed_repair if needed_repair else None
+        return metrics
@@ -0,0 +1,159 @@
+"""
+Startup benchmark for the API process.
+
+Measures two things, each in fresh interpreters so nothing is cached:
+
+- import time: `python -X importtime -c "import main"`, median over several
+  runs, with the slowest top-level imports listed
+- time to first request: from launching uvicorn until GET / answers
+
+It also checks that heavy optional dependencies (pandas, numpy, matplotlib,
+duckdb, huggingface_hub, requests) are not imported by `import main`, and exits
+non-zero when a check fails or a measurement is over its budget, so it can
+run in CI:
+
+    python startup_benchmark.py --runs 5 --import-budget-ms 800
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that should only load when the first request needs them
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "duckdb", "huggingface_hub", "requests"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _env(state_dir):
+    env = dict(os.environ)
+    env["STATE_DB_PATH"] = os.path.join(state_dir, "state.db")
+    env.setdefault("HUGGINGFACE_API_TOKEN", "benchmark")
+    return env
+
+
+def measure_import(env):
+    """Import main once; return (cumulative_ms, top-level imports, heavy modules loaded)"""
+    probe = f"import sys, json, main; print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{proc.stderr[-2000:]}")
+
+    main_us = None
+    children = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if name == "main":
+            main_us = cumulative
+            break
+        if indent == 1:
+            # A finished top-level import of the probe itself, not of main
+            children = []
+        elif indent == 3:
+            # importtime prints children before their parent
+            children.append((cumulative, name))
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return main_us / 1000, children, loaded
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env, timeout=30):
+    """Start uvicorn and return milliseconds until GET / succeeds"""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving a request")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"No response from uvicorn within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--import-budget-ms", type=float,
+                        default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "800")))
+    parser.add_argument("--first-request-budget-ms", type=float,
+                        default=float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_MS", "3000")))
+    parser.add_argument("--skip-server", action="store_true", help="Only measure import time")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = _env(state_dir)
+        import_times, children, loaded = [], [], []
+        for _ in range(args.runs):
+            ms, children, loaded = measure_import(env)
+            import_times.append(ms)
+        first_request = None if args.skip_server else measure_first_request(env)
+
+    import_ms = statistics.median(import_times)
+    top = sorted(children, reverse=True)[:args.top]
+    report = {
+        "import_ms": round(import_ms, 1),
+        "import_runs_ms": [round(ms, 1) for ms in import_times],
+        "first_request_ms": round(first_request, 1) if first_request is not None else None,
+        "slowest_imports": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in top],
+        "heavy_modules_loaded": loaded,
+    }
+
+    if loaded:
+        failures.append(f"heavy modules imported at startup: {', '.join(loaded)}")
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import main took {import_ms:.0f}ms (budget {args.import_budget_ms:.0f}ms)")
+    if first_request is not None and first_request > args.first_request_budget_ms:
+        failures.append(f"first request took {first_request:.0f}ms (budget {args.first_request_budget_ms:.0f}ms)")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import main:   {import_ms:.0f}ms median of {args.runs} (budget {args.import_budget_ms:.0f}ms)")
+        if first_request is not None:
+            print(f"first request: {first_request:.0f}ms (budget {args.first_request_budget_ms:.0f}ms)")
+        print("slowest imports:")
+        for entry in report["slowest_imports"]:
+            print(f"  {entry['cumulative_ms']:>8.1f}ms  {entry['module']}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
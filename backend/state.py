@@ -0,0 +1,314 @@
+"""
+Shared application state for running several API workers.
+
+Schemas live in a key-value store instead of a module-level dict, so a
+schema created by one worker is visible to every other worker (`uvicorn
+--workers N`, or several hosts sharing a volume). Query history is kept in
+the same SQLite file (see history.py).
+
+Stores implement a small versioned KV interface:
+
+- SQLiteKVStore: a local SQLite file in WAL mode (default), shared by all
+  processes that point at the same path
+- MemoryKVStore: an in-process stand-in for single-worker runs
+
+Every write bumps the key's version, and writes can be made conditional on
+the version the caller last read, so concurrent updates never silently
+overwrite each other.
+"""
+
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+DEFAULT_STATE_DB_PATH = "nl2sql_state.db"
+
+# Milliseconds a writer waits for another process's write lock
+BUSY_TIMEOUT_MS = 5000
+
+
+class VersionConflict(Exception):
+    """Raised when a conditional write finds a different version than expected"""
+
+
+class KVStore(ABC):
+    """Versioned key-value store, values are JSON-serializable
+
+    `expected_version` on put: None writes unconditionally, 0 requires the key
+    to be absent, any other number requires the key to be at that version.
+    """
+
+    @abstractmethod
+    def get(self, namespace, key):
+        """Return (value, version), or None when the key doesn't exist"""
+
+    @abstractmethod
+    def put(self, namespace, key, value, expected_version=None):
+        """Write a value and return its new version"""
+
+    @abstractmethod
+    def delete(self, namespace, key):
+        """Remove a key; a missing key is not an error"""
+
+    @abstractmethod
+    def items(self, namespace):
+        """Return [(key, value, version)] in insertion order"""
+
+    def update(self, namespace, key, change, retries=10):
+        """Read-modify-write a value with `change(value)`, retrying on conflicts"""
+        for _ in range(retries):
+            current = self.get(namespace, key)
+            if current is None:
+                return None
+            value, version = current
+            try:
+                new_value = change(value)
+                return new_value, self.put(namespace, key, new_value, expected_version=version)
+            except VersionConflict:
+                continue
+        raise VersionConflict(f"Too many concurrent updates to {namespace}/{key}")
+
+
+class MemoryKVStore(KVStore):
+    """Process-local store, for single-worker runs and tests"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            return (json.loads(entry[0]), entry[1]) if entry else None
+
+    def put(self, namespace, key, value, expected_version=None):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            version = entry[1] if entry else 0
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(f"{namespace}/{key} is at version {version}, expected {expected_version}")
+            # Stored as JSON so callers never share mutable values
+            self._data[(namespace, key)] = (json.dumps(value), version + 1)
+            return version + 1
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def items(self, namespace):
+        with self._lock:
+            return [(k, json.loads(v), version) for (ns, k), (v, version) in self._data.items() if ns == namespace]
+
+
+class SQLiteKVStore(KVStore):
+    """Store backed by a SQLite file that several processes can share"""
+
+    def __init__(self, path=DEFAULT_STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+
+    def _connection(self):
+        # One connection per thread; SQLite handles locking between processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value, version FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, namespace, key, value, expected_version=None):
+        conn = self._connection()
+        # Take the write lock up front so the version check and write are atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            version = row[0] if row else 0
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(f"{namespace}/{key} is at version {version}, expected {expected_version}")
+            # ON CONFLICT keeps the rowid, so items() stays in insertion order
+            conn.execute(
+                """INSERT INTO kv (namespace, key, value, version, updated_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (namespace, key) DO UPDATE SET
+                       value = excluded.value, version = excluded.version, updated_at = excluded.updated_at""",
+                (namespace, key, json.dumps(value), version + 1, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        rows = self._connection().execute(
+            "SELECT key, value, version FROM kv WHERE namespace = ? ORDER BY rowid", (namespace,)
+        )
+        return [(key, json.loads(value), version) for key, value, version in rows]
+
+
+def open_store(backend="sqlite", path=None):
+    """Create the store selected by STATE_BACKEND ("sqlite" or "memory")"""
+    if backend == "memory":
+        return MemoryKVStore()
+    if backend == "sqlite":
+        return SQLiteKVStore(path or DEFAULT_STATE_DB_PATH)
+    raise ValueError(f"Unknown state backend: {backend}")
+
+
+class SchemaRegistry:
+    """Dict-like view of the schemas in a store, with a version per schema
+
+    Deleting a schema leaves a tombstone (a None value) rather than removing
+    the key, so its version keeps increasing if it is created again and
+    anything cached by (name, version) can never be mistaken for the new one.
+    PATCH-style changes also record the DDL they appended per version, so a
+    worker holding an older version can migrate its database instead of
+    rebuilding it.
+    """
+
+    namespace = "schemas"
+    migrations_namespace = "schema_migrations"
+
+    def __init__(self, store, model):
+        self.store = store
+        self.model = model
+        # Parsed models by (name, version), so repeated reads skip validation
+        self._cache = {}
+
+    def seed(self, schemas):
+        """Add built-in schemas that aren't in the store yet"""
+        for name, schema in schemas.items():
+            try:
+                self.store.put(self.namespace, name, jsonable_encoder(schema), expected_version=0)
+            except VersionConflict:
+                pass
+
+    def create(self, schema):
+        """Add a new schema; raises VersionConflict when the name is taken"""
+        entry = self.store.get(self.namespace, schema.name)
+        if entry is not None and entry[0] is not None:
+            raise VersionConflict(f"Schema {schema.name} already exists")
+        expected_version = entry[1] if entry else 0
+        return self.store.put(self.namespace, schema.name, jsonable_encoder(schema), expected_version=expected_version)
+
+    def _existing(self, name):
+        """(value, version) of a schema; raises KeyError when it doesn't exist"""
+        entry = self.store.get(self.namespace, name)
+        if entry is None or entry[0] is None:
+            raise KeyError(name)
+        return entry
+
+    def replace(self, schema, expected_version=None):
+        """Replace an existing schema's definition and return its new version
+
+        With `expected_version`, raises VersionConflict when the schema has
+        changed since that version was read; without it the last write wins.
+        """
+        self._existing(schema.name)
+        return self.store.put(self.namespace, schema.name, jsonable_encoder(schema), expected_version=expected_version)
+
+    def append(self, name, ddl, expected_version=None, retries=10):
+        """Append DDL to a schema's definition; returns (schema, new version)
+
+        The write is conditional on the definition it extends. Without
+        `expected_version`, a concurrent change is retried on top of instead
+        of raising VersionConflict.
+        """
+        for _ in range(retries):
+            value, version = self._existing(name)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(f"{self.namespace}/{name} is at version {version}, expected {expected_version}")
+            schema = self.model(**value)
+            definition = f"{schema.definition.rstrip()}\n\n{ddl.strip()}\n"
+            new_schema = self.model(**{**jsonable_encoder(schema), "definition": definition})
+            try:
+                version = self.store.put(self.namespace, name, jsonable_encoder(new_schema), expected_version=version)
+                break
+            except VersionConflict:
+                if expected_version is not None:
+                    raise
+        else:
+            raise VersionConflict(f"Too many concurrent updates to {self.namespace}/{name}")
+        # Written after the schema, so a migration is never recorded for a
+        # version that didn't happen; a missing one just means a full rebuild
+        self.store.put(self.migrations_namespace, f"{name}@{version}", ddl.strip())
+        return new_schema, version
+
+    def migrations(self, name, from_version, to_version):
+        """DDL appended between two versions, or None when any step wasn't an append"""
+        steps = []
+        for version in range(from_version + 1, to_version + 1):
+            entry = self.store.get(self.migrations_namespace, f"{name}@{version}")
+            if entry is None:
+                return None
+            steps.append(entry[0])
+        return steps
+
+    def delete(self, name, expected_version=None):
+        """Delete a schema, leaving a tombstone; returns the tombstone's version"""
+        self._existing(name)
+        return self.store.put(self.namespace, name, None, expected_version=expected_version)
+
+    def get_with_version(self, name):
+        """Return (schema, version), or None"""
+        entry = self.store.get(self.namespace, name)
+        if entry is None or entry[0] is None:
+            return None
+        value, version = entry
+        key = (name, version)
+        if key not in self._cache:
+            self._cache = {k: v for k, v in self._cache.items() if k[0] != name}
+            self._cache[key] = self.model(**value)
+        return self._cache[key], version
+
+    def version(self, name):
+        entry = self.get_with_version(name)
+        return entry[1] if entry else None
+
+    def get(self, name, default=None):
+        entry = self.get_with_version(name)
+        return entry[0] if entry else default
+
+    def __getitem__(self, name):
+        entry = self.get_with_version(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry[0]
+
+    def __contains__(self, name):
+        entry = self.store.get(self.namespace, name)
+        return entry is not None and entry[0] is not None
+
+    def keys(self):
+        return [key for key, value, _ in self.store.items(self.namespace) if value is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
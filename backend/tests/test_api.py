@@ -0,0 +1,162 @@
+import os
+
+# Settings are read when main is imported
+os.environ.update({
+    "STATE_BACKEND": "memory",
+    "WARMUP_SCHEMAS": "",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+})
+
+import asyncio
+import threading
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from workers import ShardedPool
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def deleted_mid_request(monkeypatch):
+    """The schema is listed, then gone by the time it is read"""
+    monkeypatch.setattr(type(main.SCHEMAS), "__contains__", lambda self, name: True)
+    monkeypatch.setattr(main.SCHEMAS, "get_with_version", lambda name: None)
+
+
+def test_explain_sql(client):
+    response = client.post("/explain_sql", json={"sql": "SELECT * FROM employees", "schema_name": "hr"})
+    assert response.status_code == 200
+    assert response.json()["allowed"]
+
+
+def test_explain_sql_needs_the_cost_guard(client, monkeypatch):
+    monkeypatch.setattr(main, "QUERY_GUARD_ENABLED", False)
+    response = client.post("/explain_sql", json={"sql": "SELECT * FROM employees", "schema_name": "hr"})
+    assert response.status_code == 400 and "QUERY_GUARD_ENABLED" in response.json()["detail"]
+
+
+def test_schema_deleted_during_generate_sql(client, deleted_mid_request):
+    response = client.post("/generate_sql", json={"question": "how many employees", "schema_name": "hr"})
+    assert response.status_code == 404
+
+
+def test_schema_deleted_during_explain_sql(client, deleted_mid_request):
+    response = client.post("/explain_sql", json={"sql": "SELECT 1", "schema_name": "hr"})
+    assert response.status_code == 404
+
+
+def test_schema_deleted_before_catalog_is_read(client, deleted_mid_request):
+    assert client.get("/schemas/hr/catalog").status_code == 404
+
+
+def test_repairs_call_the_model_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def call_model(model, prompt, max_tokens):
+        threads.append(threading.current_thread().name)
+        return "```sql\nSELECT COUNT(*) FROM employees;\n```"
+
+    monkeypatch.setattr(main, "call_model", call_model)
+    schema = main.SCHEMAS["hr"].definition
+    sql, validation = asyncio.run(main.validate_and_repair_sql(
+        "SELECT nope FROM employees", "how many employees", "hr", schema, main.MODEL_NAME))
+    assert validation["repaired"] and sql == "SELECT COUNT(*) FROM employees;"
+    assert threads and threads[0].startswith("model-call")
+
+
+def test_generation_calls_the_model_off_the_event_loop(monkeypatch):
+    threads = []
+
+    class Client:
+        def chat_completion(self, messages, **params):
+            threads.append(threading.current_thread().name)
+            return types.SimpleNamespace(content="Counts the employees.")
+
+    monkeypatch.setattr(main, "get_inference_client", lambda model, token: Client())
+    assert asyncio.run(main.generate_explanation("SELECT COUNT(*) FROM employees", "")) == "Counts the employees."
+    assert threads and threads[0].startswith("model-call")
+
+
+def test_rule_based_fallback_sql_is_not_sent_for_repair(monkeypatch):
+    monkeypatch.setattr(main, "call_model", lambda *args: pytest.fail("the models already failed"))
+    schema = main.SCHEMAS["hr"].definition
+    sql, validation = asyncio.run(main.validate_and_repair_sql(
+        "SELECT nope FROM employees", "?", "hr", schema, "rule-based-fallback"))
+    assert not validation["valid"] and validation["repair_attempts"] == 0
+
+
+def test_worker_calls_do_not_block_the_event_loop(monkeypatch):
+    pool = ShardedPool(1, "test_workers:handle").start()
+    monkeypatch.setattr(main, "WORKER_POOL", pool)
+    ticks = []
+
+    async def tick():
+        while len(ticks) < 100:
+            ticks.append(None)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        ticker = asyncio.create_task(tick())
+        result = await main.call_worker_async("sleep", "hr", 0.5)
+        ticker.cancel()
+        return result
+
+    try:
+        pool.call("warm-up", "pid").result(30)
+        assert asyncio.run(run()) == "hr"
+    finally:
+        pool.shutdown()
+    assert len(ticks) > 10
+
+
+def test_queries_without_workers_run_off_the_event_loop(monkeypatch):
+    threads = []
+    run_query = main.run_query
+
+    def recording_run_query(schema_name, sql):
+        threads.append(threading.current_thread())
+        return run_query(schema_name, sql)
+
+    monkeypatch.setattr(main, "run_query", recording_run_query)
+    result = asyncio.run(main.execute_query("SELECT COUNT(*) AS n FROM employees", "hr"))
+    assert result["results"].startswith('[{"n"')
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def sandbox_round_trip(client):
+    sandbox_id = client.post("/sandboxes", json={"schema_name": "hr"}).json()["id"]
+    deleted = client.post(f"/sandboxes/{sandbox_id}/execute", json={"sql": "DELETE FROM employees"})
+    assert deleted.json()["rows_affected"] > 0
+    counted = client.post(f"/sandboxes/{sandbox_id}/execute", json={"sql": "SELECT COUNT(*) AS n FROM employees"})
+    assert counted.json()["results"] == '[{"n":0}]'
+    assert client.get("/sandboxes").json()["stats"]["sandboxes"] == 1
+    assert client.delete(f"/sandboxes/{sandbox_id}").json()["deleted"]
+    assert client.get(f"/sandboxes/{sandbox_id}").status_code == 404
+    return sandbox_id
+
+
+def test_sandboxes(client):
+    sandbox_id = sandbox_round_trip(client)
+    assert client.post(f"/sandboxes/{sandbox_id}/execute", json={"sql": "SELECT 1"}).status_code == 404
+
+
+def test_sandboxes_live_in_the_schema_owner(client, monkeypatch):
+    pool = ShardedPool(2, "main:handle_worker_call", warm_op="warm", drop_op="drop").start()
+    monkeypatch.setattr(main, "WORKER_POOL", pool)
+    monkeypatch.setattr(main, "DB_CONNECTIONS", {})
+    try:
+        sandbox_id = sandbox_round_trip(client)
+        assert sandbox_id.startswith(f"w{pool.assignments['hr']}-")
+        assert client.get("/sandboxes/w9-missing").status_code == 404
+    finally:
+        pool.shutdown()
+    assert main.DB_CONNECTIONS == {}
@@ -0,0 +1,94 @@
+import base64
+import os
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from blobs import BlobStore
+from history import HistoryStore
+
+
+class Record(BaseModel):
+    id: str
+    question: str
+    sql: str
+    timestamp: str
+    results_blob: Optional[str] = None
+    visualization: Optional[str] = None
+
+
+@pytest.fixture(params=["memory", "file"])
+def path(request, tmp_path):
+    return ":memory:" if request.param == "memory" else str(tmp_path / "state.db")
+
+
+def test_put_deduplicates_and_round_trips(path):
+    store = BlobStore(path)
+    data = b"x" * 10_000
+    digest = store.put(data, "text/csv")
+    assert store.put(data, "text/csv") == digest
+    assert store.get(digest) == (data, "text/csv")
+    stats = store.stats()
+    assert stats["blobs"] == 1 and stats["bytes"] == 10_000
+    assert stats["stored_bytes"] < 10_000  # Compressed
+    assert store.get("missing") is None
+    assert store.exists(digest) and not store.exists("missing")
+
+
+def test_evicts_least_recently_used(path):
+    evicted = []
+    store = BlobStore(path, max_bytes=300, on_evict=evicted.extend)
+    first, second, third = (store.put(os.urandom(100)) for _ in range(3))
+    store.get(first)  # Now the most recently used
+    fourth = store.put(os.urandom(100))
+    assert evicted == [second]
+    assert store.get(second) is None
+    assert all(store.get(digest) for digest in (first, third, fourth))
+    assert store.stats()["stored_bytes"] == 300
+
+
+def test_oversized_blobs_are_refused_without_evicting(path):
+    evicted = []
+    store = BlobStore(path, max_bytes=300, on_evict=evicted.extend)
+    kept = store.put(os.urandom(200))
+    assert store.put(os.urandom(301)) is None
+    assert store.put_artifact("data:image/png;base64," + base64.b64encode(os.urandom(400)).decode()) is None
+    assert evicted == [] and store.get(kept)
+    newest = store.put(os.urandom(300))  # Fits only once everything else is gone
+    assert evicted == [kept] and store.get(newest)
+    assert store.stats()["blobs"] == 1
+
+
+def test_totals_survive_reopening(tmp_path):
+    path = str(tmp_path / "state.db")
+    digests = [BlobStore(path).put(os.urandom(100)) for _ in range(3)]
+    store = BlobStore(path, max_bytes=250)
+    assert store.stats()["blobs"] == 3
+    store.put(os.urandom(100))
+    stats = store.stats()
+    assert stats["blobs"] == 2 and stats["stored_bytes"] == 200
+    assert store.get(digests[0]) is None
+
+
+def test_totals_for_files_created_before_the_counter(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = BlobStore(path)
+    store.put(os.urandom(100))
+    store.put(os.urandom(50))
+    store.conn.executescript("DROP TABLE blob_usage; DROP TRIGGER blobs_inserted; DROP TRIGGER blobs_deleted;")
+    assert BlobStore(path).stats()["stored_bytes"] == 150
+
+
+def test_eviction_clears_history_references(path):
+    history = HistoryStore(path, Record)
+    store = BlobStore(path, max_bytes=150, on_evict=history.forget_blobs)
+    chart = store.put(os.urandom(40))
+    results = store.put(os.urandom(100))
+    history.append(Record(id="q1", question="?", sql="SELECT 1", timestamp="t", results_blob=results,
+                          visualization=f"/charts/{chart}.png"))
+    history.append(Record(id="q2", question="?", sql="SELECT 2", timestamp="t", visualization="data:image/png;base64,"))
+    store.put(os.urandom(100))
+    first = history.get("q1")
+    assert first.results_blob is None and first.visualization is None
+    assert history.get("q2").visualization == "data:image/png;base64,"
@@ -0,0 +1,57 @@
+from catalog import Catalog, parse_type
+
+SCHEMA = """
+CREATE TABLE departments (department_id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL);
+CREATE TABLE employees (
+    employee_id INTEGER PRIMARY KEY,
+    department_id INTEGER,
+    manager_id INTEGER REFERENCES employees,
+    salary DECIMAL(8, 2),
+    hire_date DATE
+);
+CREATE INDEX idx_employees_salary ON employees (salary);
+"""
+
+
+def test_parse_type():
+    assert parse_type("VARCHAR(50)") == ("text", 50, None, None)
+    assert parse_type("decimal(8,3)") == ("decimal", None, 8, 3)
+    assert parse_type("BIGINT") == ("int", None, None, None)
+    assert parse_type("TIMESTAMP") == ("date", None, None, None)
+    assert parse_type(None) == ("text", None, None, None)
+
+
+def test_lookups_ignore_case():
+    catalog = Catalog.from_ddl(SCHEMA)
+    assert catalog.table_name("EMPLOYEES") == "employees"
+    assert catalog.column("Employees", "SALARY")["kind"] == "decimal"
+    assert catalog.has_table("employees", "departments") and not catalog.has_table("jobs")
+    assert not catalog.has_column("employees", "name") and catalog.column("jobs", "id") is None
+    assert catalog.tables_with_column("DEPARTMENT_ID") == ["departments", "employees"]
+    assert catalog.table_columns(["employees", "jobs"]) == {
+        "employees": {name: name for name in ("employee_id", "department_id", "manager_id", "salary", "hire_date")}
+    }
+
+
+def test_keys_indexes_and_dates():
+    catalog = Catalog.from_ddl(SCHEMA)
+    employees = catalog.table("employees")
+    assert employees["primary_key"] == ["employee_id"]
+    # Declared without a column: points at the parent's primary key
+    assert employees["foreign_keys"]["manager_id"] == ("employees", "employee_id")
+    # Undeclared, but named like another table's primary key
+    assert employees["foreign_keys"]["department_id"] == ("departments", "department_id")
+    assert employees["inferred_foreign_keys"] == ["department_id"]
+    assert [index["columns"] for index in employees["indexes"]] == [["salary"]]
+    assert {"employee_id", "department_id", "manager_id"} <= catalog.key_columns
+    assert catalog.date_columns == {"hire_date"}
+    assert not catalog.column("departments", "name")["nullable"]
+
+
+def test_suggest_and_to_dict():
+    catalog = Catalog.from_ddl(SCHEMA)
+    assert catalog.suggest("salry")[0] == "salary"
+    assert catalog.suggest("xyz") == []
+    tables = {table["name"]: table for table in catalog.to_dict()["tables"]}
+    inferred = {key["column"]: key["inferred"] for key in tables["employees"]["foreign_keys"]}
+    assert inferred == {"manager_id": False, "department_id": True}
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from blobs import BlobStore
+from charts import (
+    MAX_CATEGORIES, MAX_SERIES_POINTS, OTHER_LABEL, ChartRenderer, ChartRenderTimeout, lttb_indices,
+    prepare_chart, vega_lite_spec,
+)
+
+
+def bars(n):
+    return pd.DataFrame({"department": [f"d{i}" for i in range(n)], "salary": range(n)})
+
+
+def test_small_results_are_charted_unchanged():
+    spec, data = prepare_chart(bars(5))
+    assert spec["mark"] == "bar" and "reduction" not in spec
+    assert len(data) == 5
+    assert vega_lite_spec(spec, data)["data"] == {"name": "results"}
+
+
+def test_repeated_categories_are_aggregated():
+    df = pd.DataFrame({"department": ["b", "a", "c"] * 100_000, "salary": [1, 2, 3] * 100_000})
+    spec, data = prepare_chart(df)
+    assert data["department"].tolist() == ["b", "a", "c"]
+    assert data["salary"].tolist() == [100_000, 200_000, 300_000]
+    assert spec["reduction"] == {"method": "sum of salary per department", "rows": 300_000}
+    assert len(vega_lite_spec(spec, data)["data"]["values"]) == 3
+
+
+def test_averages_are_averaged():
+    df = pd.DataFrame({"department": ["a", "a", "b"], "avg_salary": [10.0, 20.0, 5.0]})
+    spec, data = prepare_chart(df)
+    assert data["avg_salary"].tolist() == [15.0, 5.0]
+    assert spec["reduction"]["method"].startswith("mean")
+
+
+def test_many_categories_keep_the_top_and_other():
+    df = pd.DataFrame({"name": [f"n{i}" for i in range(100)] * 2, "total": list(range(100)) * 2})
+    spec, data = prepare_chart(df)
+    assert len(data) == MAX_CATEGORIES
+    assert data["name"].iloc[0] == "n99" and data["total"].iloc[0] == 198
+    assert data["name"].iloc[-1] == OTHER_LABEL
+    assert data["total"].sum() == df["total"].sum()
+
+
+def test_date_categories_are_bucketed():
+    dates = pd.date_range("2024-01-01", periods=1000, freq="D").strftime("%Y-%m-%d")
+    spec, data = prepare_chart(pd.DataFrame({"day": dates, "sales": 1}))
+    assert spec["mark"] == "line" and spec["x_type"] == "temporal"
+    assert spec["reduction"]["method"] == "sum per month"
+    assert data["sales"].sum() == 1000
+
+
+def test_vega_lite_specs():
+    spec, data = prepare_chart(bars(5))
+    vega_lite = vega_lite_spec(spec, data)
+    assert vega_lite["mark"] == {"type": "bar", "tooltip": True}
+    assert vega_lite["encoding"]["x"] == {"field": "department", "type": "nominal", "axis": {"labelAngle": -45}}
+    assert vega_lite["encoding"]["y"] == {"field": "salary", "type": "quantitative"}
+    assert "usermeta" not in vega_lite
+
+    rng = np.random.default_rng(0)
+    spec, data = prepare_chart(pd.DataFrame({"x": rng.random(5_000), "y": rng.random(5_000)}))
+    vega_lite = vega_lite_spec(spec, data)
+    assert vega_lite["encoding"]["size"] == {"field": "count", "type": "quantitative"}
+    assert len(vega_lite["data"]["values"]) == len(data)
+    assert vega_lite["usermeta"]["reduction"] == spec["reduction"]
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(10_000, dtype=float)
+    y = np.zeros(10_000)
+    y[1234], y[8765] = 50.0, -50.0
+    kept = lttb_indices(x, y, threshold=100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 9_999
+    assert 1234 in kept and 8765 in kept
+    assert (np.diff(kept) > 0).all()
+    assert (lttb_indices(x[:50], y[:50], threshold=100) == np.arange(50)).all()
+
+
+def test_large_series_are_downsampled_and_scatters_binned():
+    x = np.arange(5_000, dtype=float)
+    spec, data = prepare_chart(pd.DataFrame({"x": x, "y": np.sin(x / 100)}))
+    assert spec["reduction"]["method"] == "lttb" and len(data) == MAX_SERIES_POINTS
+
+    rng = np.random.default_rng(0)
+    spec, data = prepare_chart(pd.DataFrame({"x": rng.random(5_000), "y": rng.random(5_000)}))
+    assert spec["size"] == "count"
+    assert data["count"].sum() == 5_000
+
+
+@pytest.fixture
+def renderer():
+    renderer = ChartRenderer(BlobStore(":memory:"), workers=2, timeout=30)
+    yield renderer
+    renderer.shutdown()
+
+
+def test_unknown_key_and_memoized_renders(renderer):
+    assert renderer.render("missing") is None
+    key = renderer.register(bars(3))
+    png = renderer.render(key)
+    assert png.startswith(b"\x89PNG")
+    assert renderer.render(key) is png
+    assert renderer.render(key, "svg").lstrip().startswith(b"<?xml")
+
+
+def test_timeout_replaces_only_the_stuck_worker(renderer):
+    # Start both workers: idle workers are handed out in turn
+    renderer.render(renderer.register(bars(3)))
+    renderer.render(renderer.register(bars(4)))
+    first, second = renderer._workers
+    second_pid = second.process.pid
+
+    renderer.timeout = 0.001
+    with pytest.raises(ChartRenderTimeout):
+        renderer.render(renderer.register(bars(5)))
+    assert first.process is None
+    assert second.process.pid == second_pid and second.process.is_alive()
+
+    renderer.timeout = 30
+    assert renderer.render(renderer.register(bars(6)))  # On the surviving worker
+    assert renderer.render(renderer.register(bars(7)))  # On a replacement
+    assert first.process.is_alive()
+
+
+def test_waiting_for_a_worker_does_not_count_against_the_timeout():
+    renderer = ChartRenderer(BlobStore(":memory:"), workers=1, timeout=30)
+    try:
+        renderer.render(renderer.register(bars(3)))
+        renderer.timeout = 1.0
+        busy = renderer._idle.get()
+
+        def release():
+            time.sleep(1.5)
+            renderer._idle.put(busy)
+
+        threading.Thread(target=release).start()
+        assert renderer.render(renderer.register(bars(4)))
+    finally:
+        renderer.shutdown()
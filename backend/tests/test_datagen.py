@@ -0,0 +1,110 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import datagen
+
+SCHEMA = """
+CREATE TABLE authors (
+    author_id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    birth_year INTEGER
+);
+CREATE TABLE genres (
+    code TEXT PRIMARY KEY,
+    genre VARCHAR(50)
+);
+CREATE TABLE books (
+    book_id INTEGER PRIMARY KEY,
+    title VARCHAR(200),
+    author_id INTEGER REFERENCES authors(author_id),
+    genre_code TEXT,
+    publication_year INTEGER,
+    published_date DATE,
+    FOREIGN KEY (genre_code) REFERENCES genres(code)
+);
+"""
+
+
+def build(rows=500, **kwargs):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    counts = datagen.populate_schema(conn, SCHEMA, rows=rows, **kwargs)
+    return conn, counts
+
+
+def dump(conn):
+    return {table: conn.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+            for table in ("authors", "genres", "books")}
+
+
+@pytest.mark.parametrize("value, expected", [("1k", 1_000), ("1M", 1_000_000), ("2.5k", 2_500), ("10_000", 10_000)])
+def test_parse_scale(value, expected):
+    assert datagen.parse_scale(value) == expected
+
+
+def test_parse_scale_rejects_garbage():
+    with pytest.raises(ValueError):
+        datagen.parse_scale("lots")
+
+
+def test_same_seed_same_data():
+    first, _ = build(seed=7)
+    second, _ = build(seed=7)
+    assert dump(first) == dump(second)
+
+
+def test_default_anchor_is_fixed_not_today():
+    default, _ = build()
+    anchored, _ = build(anchor_date=datagen.DEFAULT_ANCHOR_DATE)
+    assert dump(default) == dump(anchored)
+    latest_year = default.execute("SELECT MAX(publication_year), MAX(birth_year) FROM books, authors").fetchone()
+    assert latest_year[0] <= datagen.DEFAULT_ANCHOR_DATE.year
+    assert latest_year[1] <= datagen.DEFAULT_ANCHOR_DATE.year - 18
+    latest_date = default.execute("SELECT MAX(published_date) FROM books").fetchone()[0]
+    assert latest_date <= datagen.DEFAULT_ANCHOR_DATE.isoformat()
+
+
+def test_different_seeds_differ():
+    first, _ = build(seed=1)
+    second, _ = build(seed=2)
+    assert dump(first)["books"] != dump(second)["books"]
+
+
+def test_fact_tables_get_the_requested_rows_and_dimensions_fewer():
+    _, counts = build(rows=800)
+    assert counts["books"] == 800
+    assert counts["authors"] == 800 // datagen.DEFAULT_FANOUT
+    assert counts["genres"] == 800 // datagen.DEFAULT_FANOUT
+
+
+def test_foreign_keys_are_consistent():
+    conn, _ = build()
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_text_primary_keys_are_text_and_referenced_as_text():
+    conn, _ = build()
+    codes = {code for (code,) in conn.execute("SELECT code FROM genres")}
+    assert all(isinstance(code, str) for code in codes)
+    referenced = {code for (code,) in conn.execute("SELECT DISTINCT genre_code FROM books")}
+    assert referenced and referenced <= codes
+
+
+def test_line_items_use_product_prices_and_add_up_to_order_totals():
+    from builtin_schemas import BUILTIN_SCHEMA_DEFINITIONS
+    schema = BUILTIN_SCHEMA_DEFINITIONS["default"]
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(schema)
+    datagen.populate_schema(conn, schema, rows=500)
+    assert conn.execute(
+        "SELECT COUNT(*) FROM order_items JOIN products USING (product_id) WHERE order_items.price <> products.price"
+    ).fetchone()[0] == 0
+    assert conn.execute("""
+        SELECT COUNT(*) FROM orders
+        WHERE ABS(total_amount - COALESCE(
+            (SELECT SUM(quantity * price) FROM order_items WHERE order_items.order_id = orders.order_id), 0)) > 0.005
+    """).fetchone()[0] == 0
+    assert conn.execute("SELECT MIN(total_amount) FROM orders").fetchone()[0] > 0
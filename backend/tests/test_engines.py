@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+
+import pytest
+
+from engines import SQLiteEngine, parse_engine_config
+
+SCHEMA = """
+CREATE TABLE departments (
+    department_id INTEGER PRIMARY KEY,
+    department_name VARCHAR(50) NOT NULL
+);
+CREATE TABLE employees (
+    employee_id INTEGER PRIMARY KEY,
+    name VARCHAR(100),
+    department_id INTEGER REFERENCES departments(department_id),
+    hire_date DATE,
+    salary DECIMAL(10, 2),
+    FOREIGN KEY (department_id) REFERENCES departments(department_id)
+);
+"""
+
+
+@pytest.fixture
+def source():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO departments VALUES (?, ?)", [(1, "IT"), (2, "Sales")])
+    conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?)", [
+        (1, "Ada", 1, "2020-01-15", 120000), (2, "Bob", 2, "2021-06-01", 80000), (3, "Cy", 1, "2022-03-10", 95000),
+    ])
+    return conn
+
+
+def test_parse_engine_config():
+    assert parse_engine_config(" hr=DuckDB, default=sqlite,broken") == {"hr": "duckdb", "default": "sqlite"}
+    assert parse_engine_config("") == {}
+
+
+def test_sqlite_engine(source):
+    df = SQLiteEngine(source, threading.Lock()).execute("SELECT COUNT(*) AS n FROM employees")
+    assert df["n"].tolist() == [3]
+
+
+def duckdb_engine(schema_def, source):
+    pytest.importorskip("duckdb")
+    from engines import DuckDBEngine
+    return DuckDBEngine("hr", schema_def, source_conn=source, source_lock=threading.Lock())
+
+
+def test_duckdb_copies_the_sqlite_data(source):
+    engine = duckdb_engine(SCHEMA, source)
+    df = engine.execute(
+        "SELECT d.department_name, COUNT(*) AS n FROM employees e "
+        "JOIN departments d ON d.department_id = e.department_id GROUP BY 1 ORDER BY 1")
+    assert df.values.tolist() == [["IT", 2], ["Sales", 1]]
+    # Dates come back as ISO strings, like SQLite's
+    assert engine.execute("SELECT hire_date FROM employees ORDER BY 1")["hire_date"].tolist()[0] == "2020-01-15"
+
+
+def test_duckdb_picks_up_added_columns(source):
+    patch = "ALTER TABLE employees ADD COLUMN email VARCHAR(100);"
+    source.execute(patch)
+    source.execute("UPDATE employees SET email = name || '@example.com'")
+    engine = duckdb_engine(SCHEMA + patch, source)
+    assert engine.execute("SELECT email FROM employees WHERE employee_id = 1")["email"].tolist() == ["Ada@example.com"]
+
+
+def test_duckdb_without_a_source_applies_the_whole_definition():
+    engine = duckdb_engine(SCHEMA + "ALTER TABLE employees ADD COLUMN email VARCHAR(100);", None)
+    assert "email" in engine.execute("SELECT * FROM employees").columns
+
+
+def test_duckdb_translates_sqlite_dates(source):
+    engine = duckdb_engine(SCHEMA, source)
+    sql = engine.translate("SELECT strftime('%Y', hire_date) AS year FROM employees WHERE hire_date >= date('now', '-100 years')")
+    assert sorted(engine.execute(sql)["year"].tolist()) == ["2020", "2021", "2022"]
@@ -0,0 +1,57 @@
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+from history import HistoryStore
+
+
+class Record(BaseModel):
+    id: str
+    question: str = "?"
+    sql: str = "SELECT 1"
+    timestamp: str = "2024-01-01T00:00:00"
+    schema_name: Optional[str] = None
+    reasoning_steps: Optional[List[str]] = None
+    results: Optional[str] = None
+
+
+@pytest.fixture
+def history():
+    return HistoryStore(":memory:", Record)
+
+
+def test_round_trip_and_update(history):
+    history.append(Record(id="q1", schema_name="hr", reasoning_steps=["a", "b"]))
+    assert history.get("q1").reasoning_steps == ["a", "b"]
+    assert history.get("missing") is None
+    assert history.update("q1", results="[]")
+    assert history.get("q1").results == "[]"
+    assert not history.update("missing", results="[]")
+    with pytest.raises(ValueError, match="Unknown history fields: bogus"):
+        history.update("q1", bogus=1)
+
+
+def test_pages_are_newest_first_with_a_cursor(history):
+    for i in range(5):
+        history.append(Record(id=f"q{i}", schema_name="hr" if i % 2 else "default"))
+    records, cursor = history.page(limit=2, fields=("id",))
+    assert [record["id"] for record in records] == ["q4", "q3"]
+    records, cursor = history.page(limit=2, cursor=cursor, fields=("id",))
+    assert [record["id"] for record in records] == ["q2", "q1"]
+    records, cursor = history.page(limit=2, cursor=cursor, fields=("id",))
+    assert [record["id"] for record in records] == ["q0"] and cursor is None
+    records, _ = history.page(schema_name="hr", fields=("id",))
+    assert [record["id"] for record in records] == ["q3", "q1"]
+    with pytest.raises(ValueError):
+        history.page(fields=("id", "bogus"))
+
+
+def test_flags_and_retention():
+    history = HistoryStore(":memory:", Record, retention=2)
+    history.append(Record(id="q1"))
+    history.append(Record(id="q2", results="[]"))
+    history.append(Record(id="q3"))
+    records, _ = history.page(fields=("id",), flags=True)
+    assert [(record["id"], record["has_results"]) for record in records] == [("q3", False), ("q2", True)]
+    assert history.get("q1") is None
@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+
+import pytest
+
+from index_advisor import IndexAdvisor, split_clauses, table_aliases
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript("""
+        CREATE TABLE customers (customer_id INTEGER PRIMARY KEY, name TEXT, city TEXT);
+        CREATE TABLE orders (order_id INTEGER PRIMARY KEY, customer_id INTEGER, "index" TEXT, total REAL);
+    """)
+    conn.executemany("INSERT INTO customers VALUES (?, ?, ?)",
+                     [(i, f"name {i}", f"city {i % 50}") for i in range(1, 2001)])
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?)",
+                     [(i, i % 2000 + 1, f"2024-01-{i % 28 + 1:02d}", i * 1.5) for i in range(1, 20001)])
+    return conn
+
+
+def test_split_clauses_ignores_subqueries():
+    clauses = split_clauses("SELECT a FROM t WHERE b IN (SELECT b FROM u WHERE c = 1) ORDER BY a")
+    assert clauses["WHERE"].strip() == "b IN (SELECT b FROM u WHERE c = 1)"
+    assert clauses["ORDER BY"].strip() == "a"
+
+
+def test_table_aliases():
+    aliases = table_aliases("SELECT * FROM orders o JOIN customers AS c ON c.customer_id = o.customer_id")
+    assert aliases == {"orders": "orders", "o": "orders", "customers": "customers", "c": "customers"}
+
+
+def test_recommends_an_index_for_a_filtered_scan(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000)
+    findings = advisor.observe("s", conn, "SELECT order_id, total FROM orders WHERE customer_id = 7", 0.01)
+    assert findings and findings[0]["table"] == "orders"
+    (recommendation,) = advisor.get_recommendations("s")
+    assert recommendation["columns"][0] == "customer_id"
+    assert recommendation["ddl"].endswith('("customer_id", "order_id", "total")')
+
+
+def test_small_tables_are_left_alone(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000)
+    advisor.observe("s", conn, "SELECT * FROM customers WHERE city = 'city 3'", 0.01)
+    assert advisor.get_recommendations("s") == []
+
+
+def test_column_names_are_quoted_in_the_ddl(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000)
+    # A reserved word, which only works as a column name when quoted
+    advisor.observe("s", conn, 'SELECT * FROM orders WHERE "index" = \'2024-01-03\'', 0.01)
+    (recommendation,) = advisor.get_recommendations("s")
+    assert '("index")' in recommendation["ddl"]
+    advisor.apply("s", conn)
+    assert any(row[1] == recommendation["index_name"] for row in conn.execute('PRAGMA index_list("orders")'))
+
+
+def test_apply_creates_the_index_and_reports_timings(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000)
+    sql = "SELECT order_id FROM orders WHERE customer_id = 7"
+    advisor.observe("s", conn, sql, 0.01)
+    (report,) = advisor.apply("s", conn)
+    (query,) = report["queries"]
+    assert query["sql"] == sql and query["before"] > 0 and query["after"] > 0
+    assert advisor.get_recommendations("s")[0]["status"] == "created"
+    # Once indexed, the same query isn't flagged again
+    advisor.observe("s2", conn, sql, 0.01)
+    assert advisor.get_recommendations("s2") == []
+
+
+def test_an_index_is_built_once_and_forgotten_keys_are_skipped(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000)
+    advisor.observe("s", conn, "SELECT order_id FROM orders WHERE customer_id = 7", 0.01)
+    (key,) = advisor.recommendations
+    advisor.recommendations[key]["status"] = "creating"  # Another call is building it
+    assert advisor.create_index(key, conn) is None
+    advisor.recommendations[key]["status"] = "recommended"
+    conn.execute("DROP TABLE orders")
+    with pytest.raises(sqlite3.OperationalError):
+        advisor.create_index(key, conn)  # A failed build can be retried
+    assert advisor.recommendations[key]["status"] == "recommended"
+    advisor.forget("s")
+    assert advisor.create_index(key, conn) is None
+
+
+def test_slow_sample_queries_are_interrupted(conn):
+    advisor = IndexAdvisor(min_table_rows=10_000, sample_timeout=0.0)
+    sql = "SELECT a.order_id FROM orders a, orders b WHERE a.customer_id = 7 AND b.total > a.total"
+    assert advisor._timed(conn, threading.Lock(), sql) is None
+    # The connection is usable again afterwards
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (20000,)
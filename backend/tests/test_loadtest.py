@@ -0,0 +1,87 @@
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fake_inference import FakeInferenceServer, canned_response, parse_latency
+from loadtest import percentile, saturation_point, summarize
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def test_parse_latency():
+    rng = random.Random(0)
+    assert parse_latency("fixed:0.5")(rng) == 0.5
+    assert 1 <= parse_latency("uniform:1,2")(rng) <= 2
+    assert parse_latency("lognormal:0.2,0.5")(rng) > 0
+    for spec in ("fixed", "uniform:1", "normal:1,2", "fixed:x"):
+        with pytest.raises(ValueError, match="Bad latency"):
+            parse_latency(spec)
+
+
+def test_canned_responses():
+    schema = "CREATE TABLE IF NOT EXISTS `employees` (id INTEGER);"
+    assert canned_response(f"{schema}\nQuestion: ?") == "```sql\nSELECT * FROM employees LIMIT 10;\n```"
+    assert canned_response(f"Think step by step.\n{schema}").endswith("SELECT * FROM employees LIMIT 10;\n```")
+    assert "explain" not in canned_response("You are an SQL educator")
+    responses = [{"match": "average SALARY", "response": "custom"}]
+    assert canned_response(f"{schema}\nWhat is the average salary?", responses) == "custom"
+
+
+def test_server_answers_and_fails_like_the_api():
+    server = FakeInferenceServer(latency="fixed:0", failing_models={"down"}).start()
+    try:
+        chat = post(f"{server.url}/models/org/model/v1/chat/completions",
+                    {"messages": [{"role": "user", "content": "CREATE TABLE books (id INTEGER);"}]})
+        assert chat["model"] == "org/model"
+        assert "FROM books" in chat["choices"][0]["message"]["content"]
+        generated = post(f"{server.url}/models/org/model", {"inputs": "You are a data visualization expert"})
+        assert generated[0]["generated_text"].startswith("A bar chart")
+        with pytest.raises(urllib.error.HTTPError) as failure:
+            post(f"{server.url}/models/down", {"inputs": "?"})
+        assert failure.value.code == 503
+        assert server.stats == {"chat_completion": 1, "text_generation": 2, "failed": 1}
+    finally:
+        server.stop()
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, fraction) for fraction in (0.0, 0.07, 0.5, 0.95, 0.99, 1.0)] == [1, 7, 50, 95, 99, 100]
+    assert percentile([], 0.5) is None
+
+
+def test_summarize():
+    samples = [("/generate_sql", 0.1, True), ("/generate_sql", 0.3, False), ("/execute_sql", 0.2, True)]
+    summary = summarize(4, 2.0, samples)
+    assert summary["requests"] == 3 and summary["errors"] == 1 and summary["throughput_rps"] == 1.5
+    assert summary["p50_ms"] == 200.0
+    assert summary["endpoints"]["/generate_sql"]["error_rate"] == 0.5
+
+
+def level(concurrency, rps, endpoints=None):
+    return {"concurrency": concurrency, "throughput_rps": rps, "endpoints": endpoints or {}}
+
+
+def test_saturation_is_measured_against_the_added_clients():
+    scaling = [level(1, 10), level(2, 19), level(4, 37)]
+    assert saturation_point(scaling, 0.5) is None
+    # 4x the clients for 1.5x the throughput (the gain is over 10%, but far from 4x)
+    saturated, reason = saturation_point([level(1, 1.98), level(4, 3.02), level(16, 3.57)], 0.5)
+    assert saturated["concurrency"] == 1 and "1.53x for 4.00x" in reason
+
+
+def test_saturation_at_an_endpoints_latency_knee():
+    def endpoints(generate_rps, generate_p95, execute_rps):
+        return {"/generate_sql": {"throughput_rps": generate_rps, "p95_ms": generate_p95},
+                "/execute_sql": {"throughput_rps": execute_rps, "p95_ms": 5.0}}
+
+    levels = [level(4, 40, endpoints(1.34, 700, 38)), level(8, 80, endpoints(1.34, 4480, 78))]
+    saturated, reason = saturation_point(levels, 0.5)
+    assert saturated["concurrency"] == 4 and reason.startswith("/generate_sql p95 grew 6.40x")
@@ -0,0 +1,62 @@
+import io
+import json
+import logging
+
+import pytest
+
+import logs
+import tracing
+
+
+@pytest.fixture
+def configure():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+
+    def configure(**options):
+        logs.configure(stream=stream, **options)
+        return stream
+
+    yield configure
+    logs._stop_listener()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def lines(stream):
+    logs._stop_listener()  # Drains the queue
+    return stream.getvalue().splitlines()
+
+
+def test_json_records_carry_the_request_id_and_extras(configure):
+    stream = configure(level="INFO")
+    tracer = tracing.Tracer()
+    root, token = tracer.start("request")
+    logging.getLogger("nl2sql.test").info("Executed %s", "query", extra={"rows": 3})
+    logging.getLogger("nl2sql.test").debug("Hidden")
+    tracer.finish(root, token)
+    (line,) = lines(stream)
+    entry = json.loads(line)
+    assert entry["message"] == "Executed query" and entry["level"] == "INFO"
+    assert entry["request_id"] == root.trace_id and entry["rows"] == 3
+
+
+def test_text_format(configure):
+    stream = configure(fmt="text")
+    logging.getLogger("nl2sql.test").warning("Slow")
+    assert lines(stream)[0].endswith("WARNING nl2sql.test Slow")
+
+
+def test_debug_sampling_is_per_request():
+    sampler = logs.DebugSampler(0.5)
+
+    def record(level, request_id):
+        record = logging.makeLogRecord({"levelno": level})
+        record.request_id = request_id
+        return record
+
+    assert sampler.filter(record(logging.INFO, "ffffffff"))
+    assert sampler.filter(record(logging.DEBUG, "00000000"))
+    assert not sampler.filter(record(logging.DEBUG, "ffffffff"))
+    assert logs.DebugSampler(1.0).filter(record(logging.DEBUG, "ffffffff"))
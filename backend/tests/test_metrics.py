@@ -0,0 +1,51 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counters_render_per_label_set():
+    requests = Counter("requests_total", "Requests", ["path"])
+    requests.inc(path="/a")
+    requests.inc(2, path='/b"c')
+    assert requests.value(path="/a") == 1
+    assert requests.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a"} 1',
+        'requests_total{path="/b\\"c"} 2',
+    ]
+    with pytest.raises(ValueError, match="takes labels"):
+        requests.inc()
+
+
+def test_gauges_are_set_or_read_at_scrape_time():
+    gauge = Gauge("entries", "Entries")
+    gauge.set(1.5)
+    assert gauge.render().endswith("entries 1.5")
+    assert Gauge("size", "Size", fn=lambda: 7).render().endswith("size 7")
+    assert Gauge("broken", "Broken", fn=lambda: 1 / 0).render().count("\n") == 1  # No samples
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage="db")
+    with latency.time(stage="model"):
+        pass
+    assert latency.count(stage="db") == 4 and latency.count(stage="model") == 1
+    lines = latency.render().splitlines()
+    assert lines[2:7] == [
+        'latency_seconds_bucket{stage="db",le="0.1"} 2',
+        'latency_seconds_bucket{stage="db",le="1"} 3',
+        'latency_seconds_bucket{stage="db",le="+Inf"} 4',
+        'latency_seconds_sum{stage="db"} 3.65',
+        'latency_seconds_count{stage="db"} 4',
+    ]
+
+
+def test_registering_twice_returns_the_first_metric():
+    registry = Registry()
+    first = registry.register(Counter("hits_total", "Hits"))
+    assert registry.register(Counter("hits_total", "Hits")) is first
+    first.inc()
+    assert registry.render() == "# HELP hits_total Hits\n# TYPE hits_total counter\nhits_total 1\n"
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from microbench import _format_seconds, _timeit, benchmarks, load_history, pick_reference
+
+
+def test_timeit_grows_loops_to_the_minimum_time():
+    calls = []
+    times, loops = _timeit(lambda: calls.append(None), min_time=0.01, repeat=3)
+    assert len(times) == 3 and loops > 1
+    assert len(calls) >= loops * 3
+
+
+def test_every_benchmark_sets_up_and_runs():
+    app = SimpleNamespace(extract_reasoning_and_sql=len, preprocess_sql_for_sqlite=len)
+    cases = benchmarks(app, max_rows=10)
+    names = [name for name, _ in cases]
+    assert "extract_reasoning_and_sql[pathological]" in names and "render_chart_png[10]" in names
+    assert not any("[1000]" in name for name in names)
+    for _, setup in cases:
+        setup()()
+
+
+def test_reference_is_the_latest_run_from_the_same_machine(tmp_path):
+    history = [
+        {"machine": "m1", "commit": "abc1234"},
+        {"machine": "m2", "commit": "def5678"},
+        {"machine": "m1", "commit": "fed9876"},
+        {"machine": "m1", "commit": None},
+    ]
+    assert pick_reference(history, "m1") is history[3]
+    assert pick_reference(history, "m1", commit="abc") is history[0]
+    assert pick_reference(history, "m3") is None
+    assert load_history(str(tmp_path / "missing.jsonl")) == []
+
+
+def test_format_seconds():
+    assert [_format_seconds(s) for s in (2.5, 0.0125, 3e-6, 4e-8)] == ["2.5s", "12.5ms", "3us", "40ns"]
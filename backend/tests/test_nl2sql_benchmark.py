@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from nl2sql_benchmark import CASSETTE_DIR, CORPUS_PATH, CassetteMiss, Cassettes, RecordedError, compare
+
+
+def run(results):
+    """A report in the shape summarize() returns"""
+    return {
+        "stages_mean_ms": {name: 0.0 for result in results.values() for name in result.get("stages_ms", {})},
+        "results": results,
+    }
+
+
+def test_replay_records_and_misses(tmp_path):
+    recorder = Cassettes(str(tmp_path), record="missing")
+    recorder.schema = "hr"
+    assert recorder.play("m", "chat_completion", "prompt", lambda: "SELECT 1") == "SELECT 1"
+
+    def fail():
+        raise RuntimeError("429")
+
+    with pytest.raises(RecordedError):
+        recorder.play("m", "chat_completion", "other", fail)
+    recorder.save()
+
+    player = Cassettes(str(tmp_path))
+    player.schema = "hr"
+    assert player.play("m", "chat_completion", "prompt", None) == "SELECT 1"
+    with pytest.raises(RecordedError, match="429"):
+        player.play("m", "chat_completion", "other", None)
+    with pytest.raises(CassetteMiss):
+        player.play("m", "text_generation", "prompt", None)
+    assert len(player.misses) == 1
+
+
+def test_committed_cassettes_cover_every_schema_in_the_corpus():
+    with open(CORPUS_PATH) as corpus_file:
+        schemas = {case["schema"] for case in json.load(corpus_file)}
+    assert all(os.path.exists(os.path.join(CASSETTE_DIR, f"{schema}.json")) for schema in schemas)
+
+
+def test_compare_flags_lost_matches_and_slower_stages():
+    baseline = run({"a": {"match": True, "stages_ms": {"db": 10.0}},
+                    "b": {"match": False, "stages_ms": {"db": 10.0}}})
+    report = run({"a": {"match": False, "sql": "SELECT 2", "stages_ms": {"db": 20.0}},
+                  "b": {"match": True, "stages_ms": {"db": 20.0}}})
+    regressions, improvements = compare(report, baseline, 0.0, 0.25, 1.0)
+    assert any(line.startswith("a no longer matches") for line in regressions)
+    assert "stage db slower: 20.00ms vs 10.00ms" in regressions
+    assert improvements == ["b now matches"]
+
+
+def test_compare_uses_only_the_cases_both_runs_have():
+    baseline = run({"fast": {"match": True, "stages_ms": {"db": 1.0}},
+                    "slow": {"match": False, "stages_ms": {"db": 50.0}}})
+    report = run({"slow": {"match": False, "stages_ms": {"db": 50.0}}})
+    assert compare(report, baseline, 0.0, 0.25, 1.0) == ([], [])
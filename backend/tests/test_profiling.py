@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from profiling import MemoryProfiler, ProfilerBusy, SamplingProfiler, code_ranges
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def allocate(store):
+    store.append([bytearray(1000) for _ in range(1000)])
+
+
+def test_sampling_finds_the_busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin, args=(stop,), name="spinner")
+    thread.start()
+    try:
+        stacks, samples = SamplingProfiler().sample(0.2, interval_ms=5)
+    finally:
+        stop.set()
+        thread.join()
+    assert samples > 5
+    spinner = [line for line in stacks.splitlines() if line.startswith("spinner;")]
+    assert spinner and all("spin (" in line for line in spinner)
+    assert int(spinner[0].rsplit(" ", 1)[1]) > 0
+
+
+def test_one_profile_at_a_time():
+    profiler = SamplingProfiler()
+    thread = threading.Thread(target=profiler.sample, args=(0.3,))
+    thread.start()
+    time.sleep(0.05)
+    with pytest.raises(ProfilerBusy):
+        profiler.sample(0.01)
+    thread.join()
+
+
+def test_memory_diff_within_a_scope():
+    profiler = MemoryProfiler(frames=5, scopes={"allocate": code_ranges(allocate)})
+    store = []
+    try:
+        base = profiler.snapshot()
+        allocate(store)
+        after = profiler.snapshot()
+        diff = profiler.diff(base, after, scope="allocate")
+        assert diff["total_diff_bytes"] > 1_000_000
+        assert diff["sites"][0]["scope_line"] == diff["sites"][0]["allocated_at"]
+        assert profiler.top(after)["total_bytes"] >= diff["total_diff_bytes"]
+        with pytest.raises(KeyError, match="Unknown scope"):
+            profiler.top(after, scope="missing")
+        assert [snapshot["id"] for snapshot in profiler.status()["snapshots"]] == [base, after]
+    finally:
+        profiler.stop()
+    assert not profiler.status()["tracing"]
+    with pytest.raises(KeyError, match="No snapshot"):
+        profiler.top(base)
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from query_guard import QueryGuard, QueryRejected, strip_comments
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE customers (customer_id INTEGER PRIMARY KEY, name TEXT, city TEXT);
+        CREATE TABLE orders (order_id INTEGER PRIMARY KEY, customer_id INTEGER, status TEXT, total REAL);
+    """)
+    conn.executemany("INSERT INTO customers VALUES (?, ?, ?)", [(i, f"c{i}", f"city {i % 10}") for i in range(1, 1001)])
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?)",
+                     [(i, i % 1000 + 1, "open" if i % 3 else "closed", i) for i in range(1, 50001)])
+    return conn
+
+
+def test_strip_comments_keeps_literals():
+    sql = "SELECT '--a', \"b--\" FROM t /* x */ WHERE n = 'it''s -- here' -- trailing"
+    assert strip_comments(sql).split() == ["SELECT", "'--a',", '"b--"', "FROM", "t", "WHERE", "n", "=",
+                                           "'it''s", "--", "here'"]
+
+
+def test_primary_key_lookup_is_cheap(conn):
+    estimate = QueryGuard().estimate("s", conn, "SELECT * FROM orders WHERE order_id = 5")
+    assert estimate["estimated_rows"] == 1
+    assert estimate["estimated_cost"] == 1
+
+
+def test_full_scan_visits_every_row(conn):
+    estimate = QueryGuard().estimate("s", conn, "SELECT * FROM orders")
+    assert estimate["estimated_rows"] == 50_000
+    assert estimate["estimated_cost"] == 50_000
+
+
+def test_filtered_scan_visits_every_row_but_returns_fewer(conn):
+    estimate = QueryGuard().estimate("s", conn, "SELECT * FROM orders WHERE status = 'open'")
+    assert estimate["estimated_cost"] == 50_000
+    assert estimate["estimated_rows"] == 5_000
+
+
+def test_string_literals_in_the_filter_are_not_columns(conn):
+    guard = QueryGuard()
+    estimate = guard.estimate("s", conn, "SELECT * FROM orders o WHERE 'city' = 'x'")
+    assert estimate["estimated_rows"] == 50_000
+
+
+def test_filtered_unindexed_query_is_not_limited(conn):
+    sql, estimate = QueryGuard(max_rows=10_000).check("s", conn, "SELECT * FROM orders WHERE status = 'open'")
+    assert not estimate["limit_injected"]
+    assert "LIMIT" not in sql
+
+
+def test_large_unbounded_result_gets_a_limit(conn):
+    sql, estimate = QueryGuard(max_rows=10_000).check("s", conn, "SELECT * FROM orders")
+    assert estimate["limit_injected"]
+    assert len(conn.execute(sql).fetchall()) == 10_000
+
+
+def test_limit_is_not_swallowed_by_a_trailing_comment(conn):
+    sql, estimate = QueryGuard(max_rows=100).check("s", conn, "SELECT * FROM orders; -- all of them")
+    assert estimate["limit_injected"]
+    assert len(conn.execute(sql).fetchall()) == 100
+
+
+def test_limit_in_a_comment_does_not_count(conn):
+    sql, estimate = QueryGuard(max_rows=100).check("s", conn, "SELECT * FROM orders /* LIMIT 5 */")
+    assert estimate["limit_injected"]
+    assert len(conn.execute(sql).fetchall()) == 100
+
+
+def test_aggregates_are_not_limited(conn):
+    sql, estimate = QueryGuard(max_rows=10).check("s", conn, "SELECT COUNT(*) FROM orders")
+    assert not estimate["limit_injected"]
+    assert sql == "SELECT COUNT(*) FROM orders"
+
+
+def test_over_budget_sorts_are_rejected(conn):
+    guard = QueryGuard(cost_budget=1_000)
+    with pytest.raises(QueryRejected) as rejected:
+        guard.check("s", conn, "SELECT * FROM orders ORDER BY total")
+    assert rejected.value.estimate["estimated_cost"] > 1_000
+
+
+def test_over_budget_streaming_query_is_limited(conn):
+    sql, estimate = QueryGuard(cost_budget=1_000, max_rows=10).check("s", conn, "SELECT * FROM orders")
+    assert estimate["limit_injected"]
+    assert sql.endswith("LIMIT 10;")
+
+
+def test_statistics_are_used_after_analyze(conn):
+    conn.execute("CREATE INDEX idx_orders_customer ON orders (customer_id)")
+    conn.execute("ANALYZE")
+    estimate = QueryGuard().estimate("s", conn, "SELECT * FROM orders WHERE customer_id = 3")
+    assert estimate["used_statistics"]
+    assert estimate["estimated_rows"] == 50
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+
+import pytest
+
+from query_guard import QueryGuard
+from sandbox import SandboxLimit, SandboxPool
+
+
+def connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+@pytest.fixture
+def source():
+    conn = connect()
+    conn.executescript("""
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, salary REAL);
+        INSERT INTO employees (name, salary) VALUES ('a', 10), ('b', 20);
+    """)
+    return conn, threading.Lock()
+
+
+def test_sandboxes_are_private_copies(source):
+    pool = SandboxPool(connect)
+    first, second = pool.create("hr", 1, *source), pool.create("hr", 1, *source)
+    first.conn.execute("DELETE FROM employees")
+    assert first.conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0] == 0
+    assert second.conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0] == 2
+    assert source[0].execute("SELECT COUNT(*) FROM employees").fetchone()[0] == 2
+    assert pool.get(first.id) is first and pool.get("missing") is None
+    assert pool.delete(first.id) and pool.get(first.id) is None
+
+
+def test_pragma_changes_and_attach_are_refused(source):
+    sandbox = SandboxPool(connect).create("hr", 1, *source)
+    for statement in ("PRAGMA max_page_count = 100000000", "ATTACH DATABASE ':memory:' AS other"):
+        with pytest.raises(sqlite3.DatabaseError, match="not authorized"):
+            sandbox.conn.execute(statement)
+    assert sandbox.conn.execute("PRAGMA page_count").fetchone()[0] > 0
+    assert [row[1] for row in sandbox.conn.execute("PRAGMA table_info(employees)")] == ["id", "name", "salary"]
+
+
+def test_cost_guard_runs_in_sandboxes(source):
+    sandbox = SandboxPool(connect).create("hr", 1, *source)
+    sql, estimate = QueryGuard().check("sandbox", sandbox.conn, "SELECT * FROM employees WHERE salary > 15")
+    assert estimate is not None
+
+
+def test_least_recently_used_sandboxes_are_evicted(source):
+    probe = SandboxPool(connect).create("hr", 1, *source)
+    image = len(source[0].serialize())
+    pool = SandboxPool(connect, max_bytes=image + 2 * probe.size + probe.size // 2)
+    first, second = pool.create("hr", 1, *source), pool.create("hr", 1, *source)
+    pool.get(first.id)
+    third = pool.create("hr", 1, *source)
+    assert pool.get(second.id) is None
+    assert pool.get(first.id) and pool.get(third.id)
+    with pytest.raises(SandboxLimit):
+        SandboxPool(connect, max_bytes=image).create("hr", 1, *source)
+
+
+def test_sandboxes_that_cannot_fit_evict_nothing(source):
+    image = len(source[0].serialize())
+    pool = SandboxPool(connect, max_bytes=3 * image)
+    first = pool.create("hr", 1, *source)
+    source[0].execute("INSERT INTO employees (name) SELECT hex(randomblob(500)) FROM employees")
+    source[0].executemany("INSERT INTO employees (name) VALUES (?)", [("x" * 500,)] * 50)
+    with pytest.raises(SandboxLimit):
+        pool.create("hr", 2, *source)
+    assert pool.get(first.id) is first
+    assert pool.stats()["used_bytes"] == first.size + image
+
+
+def test_id_prefix(source):
+    assert SandboxPool(connect, id_prefix="w3-").create("hr", 1, *source).id.startswith("w3-")
@@ -0,0 +1,73 @@
+import pytest
+
+from semantic_cache import SemanticCache, guard, tokens
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticCache(threshold=0.8)
+    cache.add("hr", 1, "avg salary per dept", sql="SELECT department, AVG(salary) FROM employees GROUP BY 1")
+    return cache
+
+
+def test_paraphrases_normalize_to_the_same_words():
+    assert tokens("avg salary per dept") == tokens("What's the average salaries by department?")
+
+
+@pytest.mark.parametrize("question", [
+    "What's the average salary by department?",
+    "mean pay for each department",
+])
+def test_paraphrases_hit(cache, question):
+    entry, similarity = cache.lookup("hr", 1, question)
+    assert entry is not None and similarity >= 0.8
+    assert entry["hits"] == 1
+
+
+@pytest.mark.parametrize("first, second", [
+    ("employees hired after 2020", "employees hired before 2020"),
+    ("employees hired after 2020", "employees hired after 2021"),
+    ("customers in 'Paris'", "customers in 'Berlin'"),
+    ("products with the most orders", "products with the least orders"),
+    ("orders with a discount", "orders without a discount"),
+])
+def test_guard_words_must_match(first, second):
+    assert guard(first) != guard(second)
+    cache = SemanticCache(threshold=0.3)
+    cache.add("shop", 1, first, sql="SELECT 1")
+    assert cache.lookup("shop", 1, first)[0] is not None
+    entry, similarity = cache.lookup("shop", 1, second)
+    assert entry is None and similarity >= 0.3
+
+
+def test_versions_and_schemas_are_isolated(cache):
+    assert cache.lookup("hr", 2, "avg salary per dept") == (None, 0.0)
+    assert cache.lookup("library", 1, "avg salary per dept") == (None, 0.0)
+    cache.add("hr", 2, "number of employees", sql="SELECT COUNT(*) FROM employees")
+    # A new version starts an empty index
+    assert cache.lookup("hr", 1, "avg salary per dept") == (None, 0.0)
+    assert cache.stats()["entries"] == {"hr": 1}
+
+
+def test_accept_can_reject_a_match(cache):
+    entry, similarity = cache.lookup("hr", 1, "avg salary per dept", accept=lambda entry: False)
+    assert entry is None and similarity > 0.99
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.add("hr", 1, "number of employees", sql="a")
+    cache.add("hr", 1, "average salary", sql="b")
+    cache.lookup("hr", 1, "number of employees")
+    cache.add("hr", 1, "departments by budget", sql="c")
+    assert cache.lookup("hr", 1, "average salary")[0] is None
+    assert cache.lookup("hr", 1, "number of employees")[0]["sql"] == "a"
+
+
+def test_reported_false_hits_drop_the_entry(cache):
+    entry, _ = cache.lookup("hr", 1, "avg salary per dept")
+    cache.served("q1", "hr", entry["id"])
+    assert cache.report_false_hit("q1")
+    assert not cache.report_false_hit("q1")
+    assert cache.lookup("hr", 1, "avg salary per dept")[0] is None
+    assert cache.stats()["reported_false_hits"] == 1
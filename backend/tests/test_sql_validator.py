@@ -0,0 +1,64 @@
+from catalog import Catalog
+from sql_validator import SQLValidator
+
+SCHEMA = """
+CREATE TABLE orders (id INTEGER PRIMARY KEY, order_date DATE, total REAL);
+"""
+
+
+def test_valid_statements_compile_without_data():
+    validator = SQLValidator()
+    result = validator.validate("shop", SCHEMA, "SELECT COUNT(*) FROM orders WHERE order_date > CURRENT_DATE;")
+    assert result["valid"] and result["error"] is None
+
+
+def test_unknown_names_come_back_with_suggestions():
+    validator = SQLValidator()
+    result = validator.validate("shop", SCHEMA, "SELECT o.order_dte FROM orders o", Catalog.from_ddl(SCHEMA))
+    assert not result["valid"]
+    assert result["error"].startswith("no such column: o.order_dte (did you mean order_date")
+
+
+def test_only_select_is_allowed():
+    validator = SQLValidator()
+    assert validator.validate("shop", SCHEMA, "DELETE FROM orders")["error"] == "Only SELECT queries are allowed"
+    assert validator.validate("shop", SCHEMA, " ; ")["error"] == "The query is empty"
+    assert validator.validate("shop", SCHEMA, "-- just a comment")["error"] == "The query is empty"
+    write = "WITH old AS (SELECT id FROM orders) DELETE FROM orders WHERE id IN (SELECT id FROM old)"
+    assert validator.validate("shop", SCHEMA, write)["error"] == "Only SELECT queries are allowed"
+
+
+def test_ctes_and_leading_comments_are_accepted():
+    validator = SQLValidator()
+    for sql in (
+        "WITH big AS (SELECT * FROM orders WHERE total > 100) SELECT COUNT(*) FROM big",
+        "-- Error generating SQL: timeout\n-- Falling back to rule-based generation\nSELECT * FROM orders LIMIT 10;",
+        "/* totals */ select sum(total) from orders",
+    ):
+        assert validator.validate("shop", SCHEMA, sql)["valid"], sql
+
+
+def test_preprocessing_runs_first():
+    validator = SQLValidator(preprocess=lambda sql: sql.replace("NOW()", "CURRENT_DATE"))
+    assert validator.validate("shop", SCHEMA, "SELECT NOW() FROM orders")["valid"]
+
+
+def test_a_changed_schema_replaces_the_cached_connection():
+    validator = SQLValidator()
+    validator.prime("shop", SCHEMA)
+    changed = SCHEMA.replace("total REAL", "amount REAL")
+    assert validator.validate("shop", changed, "SELECT amount FROM orders")["valid"]
+    assert not validator.validate("shop", changed, "SELECT total FROM orders")["valid"]
+    assert len(validator._connections) == 1
+    validator.forget("shop")
+    assert validator._connections == {}
+
+
+def test_repair_outcomes_are_counted():
+    validator = SQLValidator()
+    validator.record_outcome(0, True)
+    validator.record_outcome(2, True)
+    validator.record_outcome(3, False)
+    stats = validator.stats()
+    assert (stats["generations"], stats["valid_first_try"], stats["repaired"], stats["repair_failed"]) == (3, 1, 1, 1)
+    assert stats["repair_attempts"] == 5 and stats["repair_success_rate"] == 0.5
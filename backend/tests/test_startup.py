@@ -0,0 +1,7 @@
+from startup_benchmark import _env, measure_import
+
+
+def test_import_main_leaves_heavy_modules_unloaded(tmp_path):
+    ms, children, loaded = measure_import(_env(str(tmp_path)))
+    assert loaded == []
+    assert ms > 0 and children
@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+from pydantic import BaseModel
+
+from state import KVStore, MemoryKVStore, SQLiteKVStore, SchemaRegistry, VersionConflict, open_store
+
+
+class Schema(BaseModel):
+    name: str
+    definition: str
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return open_store(request.param, str(tmp_path / "state.db"))
+
+
+def test_kv_store_is_abstract():
+    with pytest.raises(TypeError):
+        KVStore()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        open_store("redis")
+
+
+def test_every_write_bumps_the_version(store):
+    assert store.get("ns", "k") is None
+    assert store.put("ns", "k", {"a": 1}) == 1
+    assert store.put("ns", "k", {"a": 2}) == 2
+    assert store.get("ns", "k") == ({"a": 2}, 2)
+
+
+def test_conditional_writes(store):
+    assert store.put("ns", "k", "first", expected_version=0) == 1
+    with pytest.raises(VersionConflict):
+        store.put("ns", "k", "again", expected_version=0)
+    with pytest.raises(VersionConflict):
+        store.put("ns", "k", "stale", expected_version=5)
+    assert store.put("ns", "k", "second", expected_version=1) == 2
+    assert store.get("ns", "k") == ("second", 2)
+
+
+def test_items_keep_insertion_order_across_updates(store):
+    for key in ("b", "a", "c"):
+        store.put("ns", key, key)
+    store.put("ns", "b", "B")
+    store.put("other", "z", "z")
+    assert store.items("ns") == [("b", "B", 2), ("a", "a", 1), ("c", "c", 1)]
+    store.delete("ns", "a")
+    store.delete("ns", "missing")
+    assert [key for key, _, _ in store.items("ns")] == ["b", "c"]
+
+
+def test_values_are_copies(store):
+    value = {"items": [1]}
+    store.put("ns", "k", value)
+    value["items"].append(2)
+    store.get("ns", "k")[0]["items"].append(3)
+    assert store.get("ns", "k")[0] == {"items": [1]}
+
+
+def test_update_retries_on_conflicts(store):
+    store.put("ns", "counter", 0)
+    threads = [threading.Thread(target=lambda: [store.update("ns", "counter", lambda n: n + 1, retries=1000)
+                                                for _ in range(20)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get("ns", "counter")[0] == 80
+
+
+def test_sqlite_stores_share_a_file(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first, second = SQLiteKVStore(path), SQLiteKVStore(path)
+    first.put("ns", "k", "from first")
+    assert second.get("ns", "k") == ("from first", 1)
+    with pytest.raises(VersionConflict):
+        second.put("ns", "k", "stale", expected_version=0)
+
+
+@pytest.fixture
+def registry():
+    registry = SchemaRegistry(MemoryKVStore(), Schema)
+    registry.seed({"hr": Schema(name="hr", definition="CREATE TABLE a (id INTEGER);")})
+    return registry
+
+
+def test_seed_keeps_existing_schemas(registry):
+    registry.replace(Schema(name="hr", definition="CREATE TABLE b (id INTEGER);"))
+    registry.seed({"hr": Schema(name="hr", definition="CREATE TABLE a (id INTEGER);")})
+    assert "TABLE b" in registry["hr"].definition
+
+
+def test_create_rejects_existing_names(registry):
+    with pytest.raises(VersionConflict):
+        registry.create(Schema(name="hr", definition=""))
+    assert registry.create(Schema(name="new", definition="")) == 1
+    assert registry.keys() == ["hr", "new"]
+
+
+def test_replace_with_a_stale_version_conflicts(registry):
+    registry.replace(Schema(name="hr", definition="v2"), expected_version=1)
+    with pytest.raises(VersionConflict):
+        registry.replace(Schema(name="hr", definition="v3"), expected_version=1)
+
+
+def test_replace_without_a_version_is_last_write_wins(registry):
+    version = registry.version("hr")
+    registry.store.put("schemas", "hr", {"name": "hr", "definition": "concurrent"})  # Another worker
+    assert registry.replace(Schema(name="hr", definition="mine")) == version + 2
+    assert registry["hr"].definition == "mine"
+
+
+def test_replace_and_delete_need_an_existing_schema(registry):
+    with pytest.raises(KeyError):
+        registry.replace(Schema(name="missing", definition=""))
+    with pytest.raises(KeyError):
+        registry.delete("missing")
+
+
+def test_append_records_migrations(registry):
+    schema, version = registry.append("hr", "ALTER TABLE a ADD COLUMN name TEXT;")
+    assert schema.definition.endswith("ALTER TABLE a ADD COLUMN name TEXT;\n")
+    assert registry.migrations("hr", 1, version) == ["ALTER TABLE a ADD COLUMN name TEXT;"]
+    registry.replace(Schema(name="hr", definition="CREATE TABLE c (id INTEGER);"))
+    # A full replacement can't be replayed as a migration
+    assert registry.migrations("hr", 1, registry.version("hr")) is None
+
+
+def test_append_with_a_stale_version_conflicts(registry):
+    with pytest.raises(VersionConflict):
+        registry.append("hr", "ALTER TABLE a ADD COLUMN x TEXT;", expected_version=7)
+
+
+def test_concurrent_appends_are_all_kept(registry):
+    threads = [threading.Thread(target=registry.append, args=("hr", f"ALTER TABLE a ADD COLUMN c{i} TEXT;"))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    definition = registry["hr"].definition
+    assert all(f"c{i} TEXT" in definition for i in range(8))
+    assert registry.version("hr") == 9
+
+
+def test_delete_leaves_a_tombstone_so_versions_keep_increasing(registry):
+    tombstone = registry.delete("hr")
+    assert "hr" not in registry and registry.get("hr") is None and registry.keys() == []
+    assert registry.create(Schema(name="hr", definition="again")) == tombstone + 1
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import tracing
+from tracing import OTLPFileExporter, Tracer
+
+
+def test_spans_are_noops_outside_a_trace():
+    with tracing.span("db") as span:
+        span.set(rows=1)
+    assert tracing.current_trace_id() is None
+
+
+def test_span_tree_and_server_timing():
+    tracer = Tracer(slow_ms=0)
+    root, token = tracer.start("POST /generate_sql")
+    with tracing.span("model"):
+        with tracing.span("model call", attempt=1):
+            pass
+    for _ in range(2):
+        with tracing.span("db"):
+            pass
+    with pytest.raises(ValueError):
+        with tracing.span("chart"):
+            raise ValueError("bad")
+    tracer.finish(root, token)
+
+    assert [stage.name for stage in root.walk()] == ["POST /generate_sql", "model", "model call", "db", "db", "chart"]
+    assert root.children[-1].error == "ValueError: bad"
+    header = tracing.server_timing(root)
+    names = [entry.split(";")[0] for entry in header.split(", ")]
+    assert names[0] == "total" and sorted(names[1:]) == ["chart", "db", "model", "model_call"]
+    assert tracer.slow()[0]["trace_id"] == root.trace_id
+    assert tracing.current_span() is None
+
+
+def test_context_follows_tasks_and_wrapped_threads():
+    tracer = Tracer()
+    root, token = tracer.start("request")
+
+    async def stages():
+        await asyncio.gather(tracing.traced("explanation", asyncio.sleep(0)), tracing.traced("chart", asyncio.sleep(0)))
+
+    asyncio.run(stages())
+    thread = threading.Thread(target=tracing.in_context(lambda: tracing.add_span("worker", 0, 1_000_000)))
+    thread.start()
+    thread.join()
+    tracer.finish(root, token)
+    assert sorted(child.name for child in root.children) == ["chart", "explanation", "worker"]
+    assert next(child for child in root.children if child.name == "worker").duration_ms == 1.0
+    assert tracer.slow() == []
+
+
+def test_otlp_export(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(exporter=OTLPFileExporter(str(path)))
+    root, token = tracer.start("request", method="GET", status=200, cached=True)
+    with tracing.span("db"):
+        pass
+    tracer.finish(root, token)
+    tracer.close()
+    spans = json.loads(path.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["kind"] for span in spans] == [2, 1]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert spans[0]["attributes"] == [
+        {"key": "method", "value": {"stringValue": "GET"}},
+        {"key": "status", "value": {"intValue": "200"}},
+        {"key": "cached", "value": {"boolValue": True}},
+    ]
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from warmup import Warmup
+
+
+def test_steps_run_and_failures_do_not_block_readiness():
+    warmup = Warmup(timeout=10)
+    warmup.add("schema", "hr", lambda: {"tables": 4})
+    warmup.add("model", "m", lambda: 1 / 0)
+    assert not warmup.ready
+    assert warmup.report()["steps"][0]["status"] == "pending"
+    report = warmup.run()
+    assert warmup.ready and report["ready"]
+    assert report["steps"][0] == {"kind": "schema", "name": "hr", "status": "ok", "detail": {"tables": 4},
+                                  "ms": report["steps"][0]["ms"]}
+    assert report["steps"][1]["status"] == "failed" and "division" in report["steps"][1]["error"]
+    assert report["failed"] == 1 and report["timed_out"] == 0
+
+
+def test_groups_run_in_order_and_concurrently():
+    warmup = Warmup(timeout=10)
+    order, running = [], threading.Barrier(2, timeout=5)
+    warmup.add("schema", "a", lambda: order.append("a"), group="schemas")
+    warmup.add("schema", "b", lambda: order.append("b"), group="schemas")
+    # Both model steps must be running at once to pass the barrier
+    warmup.add("model", "x", running.wait)
+    warmup.add("model", "y", running.wait)
+    report = warmup.run()
+    assert order == ["a", "b"]
+    assert report["failed"] == 0
+
+
+def test_slow_steps_time_out():
+    warmup = Warmup(timeout=0.2)
+    release = threading.Event()
+    warmup.add("model", "slow", lambda: release.wait(10))
+    start = time.perf_counter()
+    report = warmup.run()
+    release.set()
+    assert time.perf_counter() - start < 5
+    assert report["ready"] and report["timed_out"] == 1
+    assert report["steps"][0]["status"] == "timeout"
@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+from workers import ShardedPool, WorkerCrashed, WorkerError
+
+
+def handle(op, key, *args):
+    """Worker handler for these tests (imported by the spawned workers)"""
+    if op == "pid":
+        return os.getpid()
+    if op == "sleep":
+        time.sleep(args[0])
+        return {"result": key}
+    if op == "fail":
+        raise ValueError(f"bad {key}")
+    if op == "crash":
+        os._exit(1)
+    return op
+
+
+@pytest.fixture
+def pool():
+    pool = ShardedPool(2, "test_workers:handle", rebalance_seconds=3600).start()
+    yield pool
+    pool.shutdown()
+
+
+def test_keys_stick_to_their_worker_and_spread_out(pool):
+    first = pool.call("a", "pid").result(30)
+    assert pool.call("a", "pid").result(30) == first
+    assert pool.call("b", "pid").result(30) != first
+    assert sorted(pool.assignments.values()) == [0, 1]
+    assert pool.stats()["workers"][0]["calls"] == 2
+
+
+def test_errors_come_back_as_worker_errors(pool):
+    with pytest.raises(WorkerError, match="ValueError: bad a"):
+        pool.call("a", "fail").result(30)
+    assert pool.call("a", "pid").result(30)
+
+
+def test_dead_workers_are_restarted(pool):
+    pid = pool.call("a", "pid").result(30)
+    with pytest.raises(WorkerCrashed):
+        pool.call("a", "crash").result(30)
+    assert pool.call("a", "pid").result(30) != pid
+    assert pool.restarts == 1
+
+
+class _Stub:
+    def __init__(self, index):
+        self.index = index
+
+
+def offline_pool(assignments, load, **options):
+    """A pool whose calls are recorded instead of sent"""
+    pool = ShardedPool(2, "unused", warm_op="warm", drop_op="drop", **options)
+    pool._workers = [_Stub(0), _Stub(1)]
+    pool.assignments, pool.load = dict(assignments), dict(load)
+    pool.sent = []
+    pool._send = lambda worker, key, op, *args: pool.sent.append((worker.index, key, op))
+    return pool
+
+
+def test_new_keys_go_to_the_least_loaded_worker():
+    pool = offline_pool({"a": 0}, {"a": 5.0})
+    assert pool._owner("b") == (pool._workers[1], True)
+    assert pool._owner("a") == (pool._workers[0], False)
+
+
+def test_plan_moves_the_busiest_key_that_fits():
+    pool = offline_pool({"a": 0, "b": 0, "c": 1}, {"a": 5.0, "b": 3.0, "c": 1.0})
+    assert pool._plan_move() == ("a", 0, 1)
+    # Moving "a" would just swap which worker is overloaded
+    pool = offline_pool({"a": 0, "b": 0, "c": 1}, {"a": 9.0, "b": 1.0, "c": 1.0})
+    assert pool._plan_move() == ("b", 0, 1)
+    # Within the imbalance factor: nothing moves
+    pool = offline_pool({"a": 0, "c": 1}, {"a": 1.4, "c": 1.0})
+    assert pool._plan_move() is None
+
+
+def test_rebalance_moves_the_key_and_decays_load():
+    pool = offline_pool({"a": 0, "b": 0, "c": 1}, {"a": 5.0, "b": 3.0, "c": 1.0}, rebalance_seconds=0)
+    pool._maybe_rebalance()
+    assert pool.assignments["a"] == 1
+    assert pool.sent == [(0, "a", "drop"), (1, "a", "warm")]
+    assert pool.load == {"a": 2.5, "b": 1.5, "c": 0.5}
+    assert pool.moves[-1]["key"] == "a"
@@ -0,0 +1,272 @@
+"""
+Lightweight per-request span tracing.
+
+Every HTTP request gets a root span, and the stages it goes through
+(generation, each inference call, validation, execution, charting, ...)
+open child spans with `tracing.span(name)`, as a `with` block or a
+decorator. The current span lives in a contextvar, so asyncio tasks created
+during a request join its trace; code on other threads joins it only when
+run with `in_context(fn)`. Outside a request, spans are no-ops and cost a
+contextvar lookup.
+
+When a request finishes, its span tree is:
+
+- summarized in a Server-Timing header (total time per stage name)
+- kept in a bounded ring buffer when it took longer than the slow threshold
+  (GET /debug/slow)
+- optionally written to a file as OTLP/JSON, one trace per line, by a
+  background thread (OTLPFileExporter), for loading into any OTLP tool
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_SLOW_MS = 2000
+DEFAULT_SLOW_LOG_SIZE = 100
+# Server-Timing entries per response, slowest stages first
+MAX_SERVER_TIMING_ENTRIES = 20
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("nl2sql_span", default=None)
+
+
+class Span:
+    """One timed stage of a request, with the stages it contains"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "children",
+                 "start_ns", "end_ns", "error", "_start_perf")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, start_ns=None, end_ns=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = end_ns
+        self.error = None
+        self._start_perf = time.perf_counter_ns()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.end_ns is None:
+            # Wall-clock start plus monotonic elapsed time
+            self.end_ns = self.start_ns + time.perf_counter_ns() - self._start_perf
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def walk(self):
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [child.to_dict() for child in list(self.children)],
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span outside of a traced request"""
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage as a child of the current span (a no-op outside a trace)"""
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    child = Span(name, parent.trace_id, parent.span_id, attributes)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end()
+        _current.reset(token)
+
+
+def add_span(name, start_ns, end_ns, **attributes):
+    """Record a stage timed elsewhere (e.g. in another process) under the current span"""
+    parent = _current.get()
+    if parent is not None:
+        parent.children.append(Span(name, parent.trace_id, parent.span_id, attributes, start_ns, end_ns))
+
+
+async def traced(name, awaitable, **attributes):
+    """Await something inside a span, e.g. asyncio.create_task(traced("explanation", coro))"""
+    with span(name, **attributes):
+        return await awaitable
+
+
+def in_context(fn):
+    """Wrap `fn` to run in the current context, for run_in_executor and threads"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def server_timing(root):
+    """A Server-Timing header value: total milliseconds per stage name"""
+    totals = {}
+    for stage in root.walk():
+        if stage is root:
+            continue
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", stage.name)
+        totals[name] = totals.get(name, 0.0) + stage.duration_ms
+    stages = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:MAX_SERVER_TIMING_ENTRIES]
+    entries = [f"total;dur={root.duration_ms:.1f}"]
+    entries.extend(f"{name};dur={ms:.1f}" for name, ms in stages)
+    return ", ".join(entries)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_spans(root):
+    """A trace's spans in the OTLP/JSON span format"""
+    spans = []
+    for stage in root.walk():
+        item = {
+            "traceId": stage.trace_id,
+            "spanId": stage.span_id,
+            "name": stage.name,
+            "kind": 2 if stage is root else 1,  # SERVER for the request, INTERNAL for stages
+            "startTimeUnixNano": str(stage.start_ns),
+            "endTimeUnixNano": str(stage.end_ns or stage.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in stage.attributes.items()],
+            "status": {"code": 2, "message": stage.error} if stage.error else {"code": 0},  # ERROR or UNSET
+        }
+        if stage.parent_id:
+            item["parentSpanId"] = stage.parent_id
+        spans.append(item)
+    return spans
+
+
+class OTLPFileExporter:
+    """Appends finished traces to a file as OTLP/JSON lines, off the request path"""
+
+    def __init__(self, path, service_name="nl2sql-backend", max_queue=10_000):
+        self.path = path
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._write, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, root):
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            self.dropped += 1
+
+    def _line(self, root):
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "nl2sql.tracing"}, "spans": otlp_spans(root)}],
+            }]
+        })
+
+    def _write(self):
+        while True:
+            root = self._queue.get()
+            if root is None:
+                break
+            lines = [self._line(root)]
+            # Write whatever else is waiting in one go
+            while True:
+                try:
+                    root = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if root is None:
+                    self._queue.put(None)
+                    break
+                lines.append(self._line(root))
+            try:
+                with open(self.path, "a") as trace_file:
+                    trace_file.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.warning("Could not write traces to %s: %s", self.path, e)
+
+    def close(self, timeout=5):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class Tracer:
+    """Starts request traces and keeps the slow ones"""
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, slow_log_size=DEFAULT_SLOW_LOG_SIZE, exporter=None):
+        self.slow_ms = slow_ms
+        self.exporter = exporter
+        self._slow = deque(maxlen=slow_log_size)
+
+    def start(self, name, **attributes):
+        """Open a root span and make it current; returns (span, token) for finish()"""
+        root = Span(name, os.urandom(16).hex(), attributes=attributes)
+        return root, _current.set(root)
+
+    def finish(self, root, token):
+        root.end()
+        _current.reset(token)
+        if root.duration_ms >= self.slow_ms:
+            self._slow.append(root)
+        if self.exporter is not None:
+            self.exporter.export(root)
+
+    def slow(self, limit=None):
+        """Slow requests, newest first, with their full span trees"""
+        traces = list(self._slow)[::-1][:limit]
+        return [{"trace_id": root.trace_id, **root.to_dict()} for root in traces]
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
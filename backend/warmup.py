@@ -0,0 +1,102 @@
+"""
+Startup warm-up, so the first requests after a deploy don't pay for it.
+
+Once the app has started, warm-up steps run in the background: building the
+schema databases (and any DuckDB engines), priming the per-schema caches the
+request path relies on, and sending each model a one-token request so the
+connection to the inference endpoint (and a serverless model) is up. Until
+every step has finished or the deadline has passed, `ready` is False, which
+GET /ready reports as 503.
+
+Steps are best-effort: a failed step is reported but doesn't keep the process
+from becoming ready, since a request would fail the same way without warm-up.
+"""
+
+import logging
+import threading
+import time
+
+DEFAULT_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs named warm-up steps concurrently and records how long each took"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.steps = []
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def add(self, kind, name, fn, group=None):
+        """Register a step; `fn()` may return a dict of details for the report
+
+        Steps in the same group run one after another (e.g. schema builds,
+        which share a lock), while groups run concurrently.
+        """
+        self.steps.append((kind, name, fn, group or f"{kind}:{name}"))
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def _run_group(self, steps):
+        for kind, name, fn, _ in steps:
+            self._run_step(kind, name, fn)
+
+    def _run_step(self, kind, name, fn):
+        start = time.perf_counter()
+        result = {"kind": kind, "name": name, "status": "ok"}
+        try:
+            detail = fn()
+            if detail:
+                result["detail"] = detail
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        self.results[(kind, name)] = result
+        logger.info("Warm-up of %s '%s' %s in %.0fms", kind, name, result["status"], result["ms"])
+
+    def run(self):
+        """Run every step, waiting at most `timeout` seconds in total"""
+        self.started_at = time.time()
+        start = time.perf_counter()
+        groups = {}
+        for step in self.steps:
+            groups.setdefault(step[3], []).append(step)
+        # Daemon threads, so a hung model request never blocks shutdown
+        threads = [
+            threading.Thread(target=self._run_group, args=(steps,), name=f"warmup-{group}", daemon=True)
+            for group, steps in groups.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(max(0, self.timeout - (time.perf_counter() - start)))
+        self.finished_at = time.time()
+        self._done.set()
+        report = self.report()
+        logger.info("Warm-up finished in %.0fms (%d failed, %d timed out)",
+                    report["duration_ms"], report["failed"], report["timed_out"])
+        return report
+
+    def report(self):
+        """Overall and per-step timings"""
+        steps = []
+        for kind, name, _, _ in self.steps:
+            status = "timeout" if self.ready else "pending"
+            steps.append(self.results.get((kind, name), {"kind": kind, "name": name, "status": status}))
+        end = self.finished_at or (time.time() if self.started_at else None)
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "duration_ms": round((end - self.started_at) * 1000, 1) if self.started_at else None,
+            "failed": sum(step["status"] == "failed" for step in steps),
+            "timed_out": sum(step["status"] == "timeout" for step in steps),
+            "steps": steps,
+        }
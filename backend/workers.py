@@ -0,0 +1,313 @@
+"""
+Schema-affinity execution workers.
+
+Each schema is owned by one worker process, which holds its database,
+engine and caches. Calls for a schema are sent to its owner over a pipe, so
+every database exists once rather than once per process, and queries on
+different schemas run on different cores instead of sharing one GIL.
+
+A schema is assigned to the least loaded worker the first time it is used.
+The pool tracks how long each schema keeps its worker busy (a decaying
+average of reported execution time) and, at most once per rebalance
+interval, moves the busiest schema that fits from the most loaded worker to
+the least loaded one. The old owner is told to drop the schema and the new
+owner warms it, so only the first call after a move pays for the rebuild.
+
+Workers are spawned processes that import `target` ("module:function") and
+call it as `handler(op, key, *args)`; its return value is pickled back. A
+worker that dies is restarted, and the calls it had in flight fail with
+WorkerCrashed.
+"""
+
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_REBALANCE_SECONDS = 30
+# How much busier the most loaded worker must be before a schema is moved
+DEFAULT_IMBALANCE = 1.5
+# Calls each worker runs at once (calls on one schema still queue on its lock)
+DEFAULT_THREADS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """An exception raised in a worker, passed back as its type and message"""
+
+
+class WorkerCrashed(WorkerError):
+    """Raised for calls that were in flight when their worker died"""
+
+
+def _serve(conn, target, index, threads):
+    """Worker process main loop: run calls from `conn` and send back their results"""
+    os.environ["EXECUTION_WORKER_ID"] = str(index)
+    module_name, function_name = target.split(":")
+    handler = getattr(importlib.import_module(module_name), function_name)
+    send_lock = threading.Lock()
+
+    def run(call_id, op, key, args):
+        start = time.perf_counter()
+        try:
+            reply = (call_id, True, handler(op, key, *args))
+        except Exception as e:
+            # Sent as text: not every exception can be unpickled in the parent
+            reply = (call_id, False, WorkerError(f"{type(e).__name__}: {e}"))
+        elapsed = time.perf_counter() - start
+        with send_lock:
+            try:
+                conn.send(reply + (elapsed,))
+            except Exception as e:
+                # The result doesn't pickle
+                conn.send((call_id, False, WorkerError(f"{type(e).__name__}: {e}"), elapsed))
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"worker-{index}") as pool:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            pool.submit(run, *message)
+
+
+class _Worker:
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending = {}  # call id -> (future, key)
+        self.calls = 0
+        self.started_at = time.time()
+
+
+class ShardedPool:
+    """Routes calls to the worker process that owns their key"""
+
+    def __init__(self, size, target, warm_op=None, drop_op=None, threads=DEFAULT_THREADS,
+                 rebalance_seconds=DEFAULT_REBALANCE_SECONDS, imbalance=DEFAULT_IMBALANCE):
+        self.size = size
+        self.target = target
+        self.warm_op = warm_op
+        self.drop_op = drop_op
+        self.threads = threads
+        self.rebalance_seconds = rebalance_seconds
+        self.imbalance = imbalance
+        self.assignments = {}  # key -> worker index
+        self.load = {}  # key -> decaying busy seconds
+        self.moves = []
+        self.restarts = 0
+        self._workers = []
+        self._call_ids = itertools.count()
+        self._lock = threading.RLock()
+        self._last_rebalance = time.monotonic()
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if not self._workers:
+                self._workers = [self._spawn(index) for index in range(self.size)]
+        return self
+
+    def _spawn(self, index):
+        # spawn: workers must not inherit the server's threads and locks
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_serve, args=(child_conn, self.target, index, self.threads),
+            name=f"execution-worker-{index}", daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(index, process, parent_conn)
+        threading.Thread(target=self._read, args=(worker,), name=f"worker-{index}-reader", daemon=True).start()
+        return worker
+
+    def _read(self, worker):
+        """Resolve a worker's futures as its replies arrive"""
+        while True:
+            try:
+                call_id, ok, value, elapsed = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future, key = worker.pending.pop(call_id, (None, None))
+                if key is not None:
+                    self.load[key] = self.load.get(key, 0.0) + elapsed
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        self._restart(worker)
+
+    def _restart(self, worker):
+        with self._lock:
+            pending, worker.pending = worker.pending, {}
+            if self._closed or self._workers[worker.index] is not worker:
+                replacement = None  # Shut down, or already replaced
+            else:
+                logger.warning("Execution worker %d (pid %s) died; restarting it", worker.index, worker.process.pid)
+                replacement = self._spawn(worker.index)
+                self._workers[worker.index] = replacement
+                self.restarts += 1
+        for future, _ in pending.values():
+            future.set_exception(WorkerCrashed(f"Execution worker {worker.index} died"))
+        if replacement is not None and self.warm_op:
+            for key, index in list(self.assignments.items()):
+                if index == worker.index:
+                    self._send(replacement, key, self.warm_op)
+
+    def _send(self, worker, key, op, *args):
+        future = Future()
+        call_id = next(self._call_ids)
+        with self._lock:
+            if self._closed or self._workers[worker.index] is not worker:
+                future.set_exception(WorkerCrashed(f"Execution worker {worker.index} was replaced"))
+                return future
+            worker.pending[call_id] = (future, key)
+            worker.calls += 1
+        try:
+            with worker.send_lock:
+                worker.conn.send((call_id, op, key, args))
+        except (OSError, ValueError) as e:
+            with self._lock:
+                worker.pending.pop(call_id, None)
+            future.set_exception(WorkerCrashed(f"Execution worker {worker.index} is gone: {e}"))
+        return future
+
+    def _worker_loads(self):
+        loads = [0.0] * self.size
+        for key, index in self.assignments.items():
+            loads[index] += self.load.get(key, 0.0)
+        return loads
+
+    def _owner(self, key):
+        """The worker that owns a key, assigning it to the least loaded one first"""
+        with self._lock:
+            index = self.assignments.get(key)
+            if index is not None:
+                return self._workers[index], False
+            loads = self._worker_loads()
+            counts = [0] * self.size
+            for owner in self.assignments.values():
+                counts[owner] += 1
+            index = min(range(self.size), key=lambda i: (loads[i], counts[i]))
+            self.assignments[key] = index
+            return self._workers[index], True
+
+    def call(self, key, op, *args):
+        """Run `handler(op, key, *args)` on the key's worker; returns a Future"""
+        self.start()
+        self._maybe_rebalance()
+        worker, assigned = self._owner(key)
+        if assigned and self.warm_op and op != self.warm_op:
+            self._send(worker, key, self.warm_op)
+        return self._send(worker, key, op, *args)
+
+    def broadcast(self, op, *args):
+        """Run `handler(op, None, *args)` on every worker; returns their Futures"""
+        self.start()
+        return [self._send(worker, None, op, *args) for worker in list(self._workers)]
+
+    def call_index(self, index, op, *args):
+        """Run `handler(op, None, *args)` on one worker, by index; returns a Future"""
+        self.start()
+        if not 0 <= index < self.size:
+            raise IndexError(f"No execution worker {index}")
+        return self._send(self._workers[index], None, op, *args)
+
+    def _maybe_rebalance(self):
+        with self._lock:
+            if time.monotonic() - self._last_rebalance < self.rebalance_seconds:
+                return
+            self._last_rebalance = time.monotonic()
+            move = self._plan_move()
+            # Halve the load history, so it reflects the recent past
+            self.load = {key: load / 2 for key, load in self.load.items() if load > 1e-6}
+            if move is None:
+                return
+            key, source, destination = move
+            self.assignments[key] = destination
+            self.moves.append({"key": key, "from": source, "to": destination, "at": time.time()})
+            del self.moves[:-100]
+        logger.info("Moving '%s' from execution worker %d to %d", key, source, destination)
+        if self.drop_op:
+            self._send(self._workers[source], key, self.drop_op)
+        if self.warm_op:
+            self._send(self._workers[destination], key, self.warm_op)
+
+    def _plan_move(self):
+        """(key, from, to) for the move that best evens out load, or None"""
+        if self.size < 2:
+            return None
+        loads = self._worker_loads()
+        busiest = max(range(self.size), key=lambda i: loads[i])
+        idlest = min(range(self.size), key=lambda i: loads[i])
+        if loads[busiest] <= self.imbalance * loads[idlest] or loads[busiest] == 0:
+            return None
+        # The busiest key that still leaves the destination below the source
+        candidates = [
+            (self.load.get(key, 0.0), key) for key, index in self.assignments.items()
+            if index == busiest and loads[idlest] + self.load.get(key, 0.0) < loads[busiest]
+        ]
+        candidates = [(load, key) for load, key in candidates if load > 0]
+        if not candidates:
+            return None
+        return max(candidates)[1], busiest, idlest
+
+    def forget(self, key):
+        """Stop routing a key (e.g. a deleted schema) and let its owner drop it"""
+        with self._lock:
+            index = self.assignments.pop(key, None)
+            self.load.pop(key, None)
+        if index is not None and self.drop_op and self._workers:
+            self._send(self._workers[index], key, self.drop_op)
+
+    def stats(self):
+        with self._lock:
+            loads = self._worker_loads()
+            return {
+                "workers": [
+                    {
+                        "index": worker.index,
+                        "pid": worker.process.pid,
+                        "alive": worker.process.is_alive(),
+                        "keys": sorted(k for k, i in self.assignments.items() if i == worker.index),
+                        "load_seconds": round(loads[worker.index], 4),
+                        "in_flight": len(worker.pending),
+                        "calls": worker.calls,
+                        "started_at": worker.started_at,
+                    }
+                    for worker in self._workers
+                ],
+                "load_seconds": {key: round(load, 4) for key, load in self.load.items()},
+                "moves": list(self.moves),
+                "restarts": self.restarts,
+                "rebalance_seconds": self.rebalance_seconds,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { QueryHistory as QueryHistoryType, Schema as SchemaType, ExampleQueries, SQLGenerationResponse } from './types';
+import { QueryHistory as QueryHistoryType, Schema as SchemaType, ExampleQueries, SQLGenerationResponse, ChartSpec } from './types';
 
 import SQLDisplay from './components/SQLDisplay';
 import SchemaSelector from './components/SchemaSelector';
@@ -9,6 +9,9 @@ import InfoCard from './components/InfoCard';
 import { Button } from './components/ui/button';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
+
+// Charts are served by the backend at relative URLs such as /charts/<key>.png
+const toBackendUrl = (url?: string): string => (url && url.startsWith('/') ? `${BACKEND_URL}${url}` : url || "");
 const FETCH_TIMEOUT = 120000;
 
 // Example queries for different schemas
@@ -44,6 +47,7 @@ const App: React.FC = () => {
   const [reasoningSteps, setReasoningSteps] = useState<string[]>([]);
   const [queryResults, setQueryResults] = useState<string>("");
   const [resultVisualization, setResultVisualization] = useState<string>("");
+  const [chartSpec, setChartSpec] = useState<ChartSpec | undefined>(undefined);
   const [loading, setLoading] = useState<boolean>(false);
   const [executing, setExecuting] = useState<boolean>(false);
   const [error, setError] = useState<string>("");
@@ -106,7 +110,8 @@ const App: React.FC = () => {
   // Function to fetch query history
   const fetchHistory = async (): Promise<void> => {
     try {
-      const response = await fetch(`${BACKEND_URL}/history`);
+      // Summaries only; full entries are fetched when one is opened
+      const response = await fetch(`${BACKEND_URL}/history?view=summary&limit=50`);
       if (response.ok) {
         const data = await response.json();
         setQueryHistory(data);
@@ -160,6 +165,7 @@ const App: React.FC = () => {
     setReasoningSteps([]);
     setQueryResults("");
     setResultVisualization("");
+    setChartSpec(undefined);
     
     try {
       // Show a loading message
@@ -204,8 +210,9 @@ const App: React.FC = () => {
       
       // Set visualization if available
       if (data.result_visualization) {
-        setResultVisualization(data.result_visualization);
+        setResultVisualization(toBackendUrl(data.result_visualization));
       }
+      setChartSpec(data.chart_spec);
       
       // Refresh history after generating a new query
       fetchHistory();
@@ -237,7 +244,8 @@ const App: React.FC = () => {
       
       const data = await response.json();
       setQueryResults(data.results);
-      setResultVisualization(data.visualization);
+      setResultVisualization(toBackendUrl(data.visualization));
+      setChartSpec(data.chart_spec || undefined);
       
       // Refresh history after executing
       fetchHistory();
@@ -248,7 +256,19 @@ const App: React.FC = () => {
     }
   };
 
-  const loadFromHistory = (historyItem: QueryHistoryType): void => {
+  const loadFromHistory = async (summary: QueryHistoryType): Promise<void> => {
+    let historyItem = summary;
+    if (summary.has_results || summary.has_visualization || summary.reasoning_steps === undefined) {
+      try {
+        const response = await fetch(`${BACKEND_URL}/history/${summary.id}`);
+        if (response.ok) {
+          historyItem = await response.json();
+        }
+      } catch (error) {
+        console.error("Failed to fetch history entry:", error);
+      }
+    }
+    
     setQuestion(historyItem.question);
     setSql(historyItem.sql);
     setModelUsed(historyItem.model_used);
@@ -263,18 +283,28 @@ const App: React.FC = () => {
     }
     
     // Load results if available
-    if (historyItem.results) {
-      setQueryResults(historyItem.results);
-    } else {
-      setQueryResults("");
+    let results = historyItem.results || "";
+    if (!results && historyItem.results_blob) {
+      try {
+        const response = await fetch(`${BACKEND_URL}/blobs/${historyItem.results_blob}`);
+        if (response.ok) {
+          results = await response.text();
+        }
+      } catch (error) {
+        console.error("Failed to fetch stored results:", error);
+      }
     }
+    setQueryResults(results);
     
     // Load visualization if available
     if (historyItem.visualization) {
-      setResultVisualization(historyItem.visualization);
+      setResultVisualization(toBackendUrl(historyItem.visualization));
+    } else if (historyItem.visualization_blob) {
+      setResultVisualization(`${BACKEND_URL}/blobs/${historyItem.visualization_blob}`);
     } else {
       setResultVisualization("");
     }
+    setChartSpec(historyItem.chart_spec || undefined);
     
     // Close the history panel on mobile after selecting
     if (window.innerWidth <= 768) {
@@ -419,6 +449,7 @@ const App: React.FC = () => {
                   reasoningSteps={reasoningSteps}
                   results={queryResults}
                   visualization={resultVisualization}
+                  chartSpec={chartSpec}
                   onExecuteQuery={handleExecuteQuery}
                   isExecuting={executing}
                 />
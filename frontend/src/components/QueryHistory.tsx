@@ -47,14 +47,14 @@ const QueryHistory: React.FC<QueryHistoryProps> = ({ history, loadFromHistory, a
                 <p className="text-sm font-medium line-clamp-1">{item.question}</p>
                 <p className="text-xs text-muted-foreground mt-1 line-clamp-1 font-mono">{item.sql}</p>
                 
-                {(item.results || item.visualization) && (
+                {(item.results || item.visualization || item.has_results || item.has_visualization) && (
                   <div className="mt-2 flex items-center space-x-2">
-                    {item.results && (
+                    {(item.results || item.has_results) && (
                       <span className="text-xs bg-green-500/10 text-green-500 dark:text-green-400 px-2 py-0.5 rounded-full">
                         Results
                       </span>
                     )}
-                    {item.visualization && (
+                    {(item.visualization || item.has_visualization) && (
                       <span className="text-xs bg-blue-500/10 text-blue-500 dark:text-blue-400 px-2 py-0.5 rounded-full">
                         Visualization
                       </span>
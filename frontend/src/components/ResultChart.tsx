@@ -0,0 +1,149 @@
+import React from 'react';
+import { ChartSpec, TableRow } from '../types';
+
+interface ResultChartProps {
+  spec: ChartSpec;
+  data: TableRow[];
+}
+
+const WIDTH = 640;
+const HEIGHT = 360;
+const MARGIN = { top: 16, right: 16, bottom: 96, left: 64 };
+const TICKS = 5;
+
+// [min, max] of the values and `include`, in a loop: spreading a large result
+// into Math.min/Math.max overflows the call stack
+const extent = (values: number[], include?: number): [number, number] => {
+  let min = include ?? Infinity;
+  let max = include ?? -Infinity;
+  for (const value of values) {
+    if (value < min) min = value;
+    if (value > max) max = value;
+  }
+  return [min, max];
+};
+
+// Renders the subset of Vega-Lite the backend emits (bar, line and point marks
+// over the "results" dataset or inline values) as plain SVG, so charts cost
+// the server nothing.
+const ResultChart: React.FC<ResultChartProps> = ({ spec, data: results }) => {
+  const { x, y, size } = spec.encoding;
+  const data = spec.data.values || results;
+  const reduction = spec.usermeta?.reduction;
+  const plotWidth = WIDTH - MARGIN.left - MARGIN.right;
+  const plotHeight = HEIGHT - MARGIN.top - MARGIN.bottom;
+
+  const yValues = data.map((row) => Number(row[y.field]) || 0);
+  const [yMin, yLargest] = extent(yValues, 0);
+  const yMax = yLargest || 1;
+  const scaleY = (value: number) => plotHeight - ((value - yMin) / (yMax - yMin)) * plotHeight;
+  const yTicks = Array.from({ length: TICKS + 1 }, (_, i) => yMin + ((yMax - yMin) * i) / TICKS);
+
+  const formatTick = (value: number) =>
+    Math.abs(value) >= 1000 ? value.toLocaleString(undefined, { maximumFractionDigits: 0 }) : Number(value.toFixed(2)).toString();
+
+  let marks: React.ReactNode;
+  let xAxis: React.ReactNode;
+  if (spec.mark.type === 'bar') {
+    const categories = data.map((row) => String(row[x.field]));
+    const band = plotWidth / Math.max(categories.length, 1);
+    marks = data.map((row, i) => {
+      const value = Number(row[y.field]) || 0;
+      return (
+        <rect
+          key={i}
+          x={i * band + band * 0.1}
+          y={Math.min(scaleY(value), scaleY(0))}
+          width={band * 0.8}
+          height={Math.abs(scaleY(0) - scaleY(value))}
+          className="fill-primary"
+        >
+          <title>{`${categories[i]}: ${value}`}</title>
+        </rect>
+      );
+    });
+    xAxis = categories.map((category, i) => (
+      <text
+        key={i}
+        transform={`translate(${i * band + band / 2}, ${plotHeight + 12}) rotate(-45)`}
+        textAnchor="end"
+        className="fill-muted-foreground text-[10px]"
+      >
+        {category.length > 18 ? `${category.slice(0, 17)}…` : category}
+      </text>
+    ));
+  } else {
+    const temporal = x.type === 'temporal';
+    const xValues = data.map((row) => (temporal ? Date.parse(String(row[x.field])) : Number(row[x.field])) || 0);
+    const [xMin, xMax] = extent(xValues);
+    const scaleX = (value: number) => (xMax === xMin ? plotWidth / 2 : ((value - xMin) / (xMax - xMin)) * plotWidth);
+    const formatX = (value: number) => (temporal ? new Date(value).toISOString().slice(0, 10) : formatTick(value));
+
+    if (spec.mark.type === 'line') {
+      const points = xValues
+        .map((value, i) => [value, yValues[i]])
+        .sort((a, b) => a[0] - b[0])
+        .map(([xValue, yValue]) => `${scaleX(xValue)},${scaleY(yValue)}`)
+        .join(' ');
+      marks = <polyline points={points} fill="none" strokeWidth={1.5} className="stroke-primary" />;
+    } else {
+      // Binned scatter plots size each point by how many rows fall in its cell
+      const sizes = size ? data.map((row) => Number(row[size.field]) || 0) : [];
+      const maxSize = extent(sizes, 1)[1];
+      marks = data.map((row, i) => (
+        <circle
+          key={i}
+          cx={scaleX(xValues[i])}
+          cy={scaleY(yValues[i])}
+          r={size ? 2 + 8 * Math.sqrt(sizes[i] / maxSize) : 4}
+          className="fill-primary opacity-70"
+        >
+          <title>{`${x.field}: ${formatX(xValues[i])}, ${y.field}: ${yValues[i]}${size ? `, ${size.field}: ${sizes[i]}` : ''}`}</title>
+        </circle>
+      ));
+    }
+    xAxis = Array.from({ length: TICKS + 1 }, (_, i) => xMin + ((xMax - xMin) * i) / TICKS).map((value, i) => (
+      <text
+        key={i}
+        transform={`translate(${scaleX(value)}, ${plotHeight + 16})${temporal ? ' rotate(-45)' : ''}`}
+        textAnchor={temporal ? 'end' : 'middle'}
+        className="fill-muted-foreground text-[10px]"
+      >
+        {formatX(value)}
+      </text>
+    ));
+  }
+
+  return (
+    <div className="w-full max-w-3xl">
+      <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} className="w-full h-auto" role="img" aria-label={`${y.field} by ${x.field}`}>
+        <g transform={`translate(${MARGIN.left}, ${MARGIN.top})`}>
+          {yTicks.map((value, i) => (
+            <g key={i}>
+              <line x1={0} x2={plotWidth} y1={scaleY(value)} y2={scaleY(value)} className="stroke-muted" />
+              <text x={-8} y={scaleY(value)} dy="0.32em" textAnchor="end" className="fill-muted-foreground text-[10px]">
+                {formatTick(value)}
+              </text>
+            </g>
+          ))}
+          {marks}
+          <line x1={0} x2={plotWidth} y1={scaleY(0)} y2={scaleY(0)} className="stroke-muted-foreground" />
+          {xAxis}
+          <text x={plotWidth / 2} y={plotHeight + MARGIN.bottom - 8} textAnchor="middle" className="fill-foreground text-xs">
+            {x.field}
+          </text>
+          <text transform={`translate(${-MARGIN.left + 14}, ${plotHeight / 2}) rotate(-90)`} textAnchor="middle" className="fill-foreground text-xs">
+            {y.field}
+          </text>
+        </g>
+      </svg>
+      {reduction && (
+        <p className="text-xs text-muted-foreground text-center mt-1">
+          {reduction.rows.toLocaleString()} rows shown as {reduction.method}
+        </p>
+      )}
+    </div>
+  );
+};
+
+export default ResultChart;
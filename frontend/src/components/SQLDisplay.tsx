@@ -4,6 +4,8 @@ import 'prismjs/components/prism-sql';
 import { Card, CardContent, CardHeader } from './ui/card';
 import { Button } from './ui/button';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from './ui/tabs';
+import ResultChart from './ResultChart';
+import { ChartSpec } from '../types';
 
 interface SQLDisplayProps {
   sql: string;
@@ -13,6 +15,7 @@ interface SQLDisplayProps {
   reasoningSteps?: string[];
   results?: string;
   visualization?: string;
+  chartSpec?: ChartSpec;
   onExecuteQuery?: () => void;
   isExecuting?: boolean;
 }
@@ -25,6 +28,7 @@ const SQLDisplay: React.FC<SQLDisplayProps> = ({
   reasoningSteps,
   results,
   visualization,
+  chartSpec,
   onExecuteQuery,
   isExecuting = false
 }) => {
@@ -89,6 +93,14 @@ const SQLDisplay: React.FC<SQLDisplayProps> = ({
   };
 
   const renderVisualization = () => {
+    if (chartSpec && parsedResults.length > 0) {
+      return (
+        <div className="flex justify-center p-4">
+          <ResultChart spec={chartSpec} data={parsedResults} />
+        </div>
+      );
+    }
+    
     if (!visualization) {
       return (
         <div className="flex flex-col items-center justify-center p-8 text-center">
@@ -10,12 +10,20 @@ export interface QueryHistory {
   question: string;
   sql: string;
   timestamp: string;
+  schema_name?: string;
   model_used: string;
   execution_time: number;
   status?: string;
   results?: string;
   visualization?: string;
   reasoning_steps?: string[];
+  chart_spec?: ChartSpec;
+  // Content hashes of the stored results and chart, served from /blobs/{hash}
+  results_blob?: string;
+  visualization_blob?: string;
+  // Set on summary listings, which leave out results and visualizations
+  has_results?: boolean;
+  has_visualization?: boolean;
 }
 
 export interface SQLGenerationResponse {
@@ -28,6 +36,21 @@ export interface SQLGenerationResponse {
   reasoning_steps?: string[];
   results?: string;
   result_visualization?: string;
+  chart_spec?: ChartSpec;
+}
+
+// Vega-Lite chart spec. Its data is either the named dataset "results" (the
+// result rows) or, for large results reduced for charting, inline values.
+export interface ChartSpec {
+  $schema: string;
+  data: { name?: string; values?: TableRow[] };
+  mark: { type: 'bar' | 'point' | 'line'; tooltip?: boolean };
+  encoding: {
+    x: { field: string; type: 'nominal' | 'quantitative' | 'temporal'; axis?: { labelAngle?: number } };
+    y: { field: string; type: 'quantitative' };
+    size?: { field: string; type: 'quantitative' };
+  };
+  usermeta?: { reduction?: { method: string; rows: number } };
 }
 
 export interface ExampleQueries {